@@ -0,0 +1,210 @@
+"""
+Token and throughput accounting for gene-analysis runs, with budget-enforced dispatch.
+
+`RunAccounting` collects the `runcore.Usage` of every batch (prompt and completion
+tokens per model, requests, latency). It reports totals per model, per batch and per
+run, plus genes/sec and tokens per gene, under `summary.json` → `accounting`.
+
+With `--token-budget` and/or `--time-budget`, every batch asks `admit` before it is
+dispatched. From the tokens and seconds per gene seen so far (plus what is already in
+flight), `admit` returns how many of the batch's genes still fit:
+  • all of them: dispatch as planned;
+  • fewer: dispatch a smaller batch, i.e. a shorter prompt and completion;
+  • none: stop dispatching; the remaining genes are reported as skipped.
+Until the first batch has finished, its cost is projected from the prompt length
+(about four characters per token) plus `token_budget`'s completion-tokens-per-gene
+prior, once per sample; it is shrunk or refused like any later batch, and only one
+batch at a time is admitted.
+"""
+from __future__ import annotations
+
+import argparse
+import math
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import runcore
+from token_budget import PRIOR_TOKENS_PER_GENE
+
+CHARS_PER_TOKEN = 4  # rough English/JSON average; only used before any usage has been observed
+
+
+def prompt_tokens(messages: List[Dict[str, str]]) -> int:
+    """Approximate prompt tokens of ``messages`` for the first-batch projection."""
+    return math.ceil(sum(len(m.get("content") or "") for m in messages) / CHARS_PER_TOKEN)
+
+
+@dataclass
+class BatchUsage:
+    batch: int
+    genes: int
+    requests: int
+    prompt_tokens: int
+    completion_tokens: int
+    latency_sec: float
+
+
+class RunAccounting:
+    def __init__(
+        self,
+        token_budget: Optional[int] = None,
+        time_budget: Optional[float] = None,
+        samples: int = 1,
+        prior_tokens_per_gene: float = PRIOR_TOKENS_PER_GENE,
+    ) -> None:
+        self.token_budget = token_budget
+        self.time_budget = time_budget
+        self.samples = max(1, samples)
+        self.prior_tokens_per_gene = prior_tokens_per_gene
+        self.batches: List[BatchUsage] = []
+        self.by_model: Dict[str, Dict[str, int]] = {}
+        self.skipped_genes: List[str] = []
+        self.shrunk_batches = 0
+        self.stop_reason: Optional[str] = None
+        self._reserved: Dict[int, float] = {}  # batch -> projected tokens while in flight
+        self._started: Optional[float] = None
+        self._finished: Optional[float] = None
+        self._lock = threading.Lock()
+
+    # -- totals
+
+    @property
+    def genes(self) -> int:
+        return sum(b.genes for b in self.batches)
+
+    @property
+    def prompt_tokens(self) -> int:
+        return sum(b.prompt_tokens for b in self.batches)
+
+    @property
+    def completion_tokens(self) -> int:
+        return sum(b.completion_tokens for b in self.batches)
+
+    @property
+    def tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def elapsed(self) -> float:
+        if self._started is None:
+            return 0.0
+        return (self._finished or time.perf_counter()) - self._started
+
+    # -- scheduling
+
+    def _tokens_per_gene(self) -> Optional[float]:
+        return self.tokens / self.genes if self.genes and self.tokens else None
+
+    def _seconds_per_gene(self) -> Optional[float]:
+        return self.elapsed() / self.genes if self.genes else None
+
+    def _projected_tokens_per_gene(self, genes: int, prompt: int) -> float:
+        """Before any usage is observed: prompt share plus the completion prior, per sample."""
+        return self.samples * (prompt / max(1, genes) + self.prior_tokens_per_gene)
+
+    def admit(self, batch: int, genes: int, prompt: int = 0) -> int:
+        """How many of ``genes`` batch ``batch`` may dispatch now; reserves their projected tokens.
+
+        ``prompt`` is the batch's approximate prompt tokens (`prompt_tokens`), used only
+        until the first batch has been recorded. 0 with `stop_reason` still None means
+        "wait for an in-flight batch, then ask again".
+        """
+        with self._lock:
+            if self._started is None:
+                self._started = time.perf_counter()
+            if self.stop_reason is not None:
+                return 0
+            per_gene_tokens = self._tokens_per_gene()
+            limits: Dict[str, int] = {}
+            if self.token_budget is not None:
+                remaining = self.token_budget - self.tokens - sum(self._reserved.values())
+                if per_gene_tokens is None and self._reserved:
+                    limits["token budget"] = 0  # wait for the first batch's real usage
+                else:
+                    if per_gene_tokens is None:
+                        per_gene_tokens = self._projected_tokens_per_gene(genes, prompt)
+                    limits["token budget"] = max(0, min(genes, math.floor(remaining / per_gene_tokens)))
+            if self.time_budget is not None:
+                remaining_sec = self.time_budget - self.elapsed()
+                per_gene_sec = self._seconds_per_gene()
+                if remaining_sec <= 0 or per_gene_sec is None:
+                    limits["time budget"] = genes if remaining_sec > 0 and not self._reserved else 0
+                else:
+                    # Batches in flight run concurrently with this one, so only elapsed time counts.
+                    limits["time budget"] = min(genes, math.floor(remaining_sec / per_gene_sec))
+            allowed = min([genes, *limits.values()])
+            if allowed <= 0:
+                if not self._reserved:
+                    # Nothing in flight whose result could change the estimate: stop for good.
+                    self.stop_reason = next(name for name, limit in limits.items() if limit <= 0)
+                return 0
+            if allowed < genes:
+                self.shrunk_batches += 1
+            self._reserved[batch] = allowed * (per_gene_tokens or 0.0)
+            return allowed
+
+    def record(self, batch: int, genes: int, usage: runcore.Usage) -> BatchUsage:
+        with self._lock:
+            self._reserved.pop(batch, None)
+            entry = BatchUsage(
+                batch=batch,
+                genes=genes,
+                requests=usage.requests,
+                prompt_tokens=usage.prompt_tokens,
+                completion_tokens=usage.completion_tokens,
+                latency_sec=round(usage.latency_sec, 3),
+            )
+            self.batches.append(entry)
+            for key, counts in usage.by_model.items():
+                total = self.by_model.setdefault(key, {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0})
+                for name, value in counts.items():
+                    total[name] += value
+            return entry
+
+    def skip(self, genes: List[str]) -> None:
+        with self._lock:
+            self.skipped_genes.extend(genes)
+
+    def finish(self) -> None:
+        self._finished = time.perf_counter()
+
+    # -- report
+
+    def report(self) -> Dict[str, Any]:
+        elapsed = self.elapsed()
+        genes = self.genes
+        return {
+            "models": self.by_model,
+            "requests": sum(b.requests for b in self.batches),
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.tokens,
+            "genes_queried": genes,
+            "query_wall_sec": round(elapsed, 3),
+            "genes_per_sec": round(genes / elapsed, 3) if elapsed and genes else None,
+            "tokens_per_gene": round(self.tokens / genes, 1) if genes else None,
+            "prompt_tokens_per_gene": round(self.prompt_tokens / genes, 1) if genes else None,
+            "completion_tokens_per_gene": round(self.completion_tokens / genes, 1) if genes else None,
+            "budget": {
+                "tokens": self.token_budget,
+                "time_sec": self.time_budget,
+                "stopped": self.stop_reason,
+                "shrunk_batches": self.shrunk_batches,
+                "skipped_genes": self.skipped_genes,
+            },
+            "batches": [b.__dict__ for b in sorted(self.batches, key=lambda b: b.batch)],
+        }
+
+
+def add_accounting_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--token-budget",
+        type=int,
+        help="Stop dispatching batches (or shrink them) once prompt + completion tokens would exceed this.",
+    )
+    parser.add_argument(
+        "--time-budget",
+        type=float,
+        help="Stop dispatching batches (or shrink them) once the query phase would exceed this many seconds.",
+    )
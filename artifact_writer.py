@@ -0,0 +1,244 @@
+"""
+Background artifact writer: takes disk I/O off the request path.
+
+Writes are queued and done by one daemon thread, so a request loop never waits on a
+slow (network) filesystem. The worker drains whatever is queued in one go:
+  • a file written several times in the batch is written once, with its latest content;
+  • consecutive appends to the same file go out as a single write;
+  • JSON payloads are serialized on the worker, not on the caller's thread;
+  • whole-file writes go to a temp file in the same directory and are renamed into
+    place, so readers never see a half-written artifact.
+`flush()` waits for everything queued so far and re-raises the first write error.
+`install_exit_handlers` flushes at interpreter exit and turns SIGTERM into a normal
+exit, so queued artifacts survive Ctrl-C and job-scheduler kills.
+`iter_jsonl` reads appended JSONL back, tolerating a torn last line and corrupt lines.
+"""
+from __future__ import annotations
+
+import atexit
+import json
+import os
+import queue
+import signal
+import tempfile
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import profiling
+
+
+def atomic_write_text(path: Path, text: str, fsync: bool = False) -> None:
+    """Write ``text`` to ``path`` via a temp file in the same directory and an atomic rename."""
+    with profiling.span("disk", "artifact_writer.write"):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as fh:
+                fh.write(text)
+                if fsync:
+                    fh.flush()
+                    os.fsync(fh.fileno())
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+
+
+def append_text(path: Path, text: str, fsync: bool = False) -> None:
+    with profiling.span("disk", "artifact_writer.append"):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("a", encoding="utf-8") as fh:
+            fh.write(text)
+            if fsync:
+                fh.flush()
+                os.fsync(fh.fileno())
+
+
+def iter_jsonl(path: Path, truncate_torn: bool = False) -> Iterator[Dict[str, Any]]:
+    """Yield the JSON objects of a JSONL file, skipping (and reporting) lines that cannot be read.
+
+    An unreadable last line is taken to be an append cut off mid-write; with
+    ``truncate_torn`` it is removed from the file once the iteration completes, so the
+    next append starts on a clean line. Unreadable lines elsewhere are only skipped.
+    """
+    bad_lines: List[int] = []
+    size = last_line = last_len = 0
+    with path.open("rb") as fh:
+        for line_no, raw in enumerate(fh, start=1):
+            size += len(raw)
+            last_line, last_len = line_no, len(raw)
+            if not raw.strip():
+                continue
+            try:
+                if not raw.endswith(b"\n"):
+                    raise ValueError("unterminated line")  # a write cut off before its newline
+                record = json.loads(raw)
+            except ValueError:
+                bad_lines.append(line_no)
+                continue
+            if not isinstance(record, dict):
+                bad_lines.append(line_no)
+                continue
+            yield record
+    if bad_lines and bad_lines[-1] == last_line:
+        bad_lines.pop()
+        if truncate_torn:
+            print(f"Truncating partial record at end of {path}", flush=True)
+            with path.open("r+b") as fh:
+                fh.truncate(size - last_len)
+        else:
+            print(f"   ! Skipping partial record at end of {path}", flush=True)
+    for line_no in bad_lines:
+        print(f"   ! Skipping unreadable line {line_no} of {path}", flush=True)
+
+
+@dataclass
+class _Op:
+    kind: str  # "write" | "append"
+    path: Path
+    payload: Any  # str, or a JSON-serializable object when ``indent`` is set
+    indent: Optional[int] = None
+    is_json: bool = False
+    parts: List[str] = field(default_factory=list)
+
+    def text(self) -> str:
+        if self.is_json:
+            return json.dumps(self.payload, indent=self.indent)
+        return self.payload
+
+
+def coalesce(batch: List[_Op]) -> List[_Op]:
+    """Drop writes superseded later in the batch and merge consecutive appends per file.
+
+    Files that get both writes and appends in one batch keep their exact order.
+    """
+    kinds: Dict[Path, set] = {}
+    last_write: Dict[Path, int] = {}
+    for i, op in enumerate(batch):
+        kinds.setdefault(op.path, set()).add(op.kind)
+        if op.kind == "write":
+            last_write[op.path] = i
+    merged: List[_Op] = []
+    append_slot: Dict[Path, int] = {}
+    for i, op in enumerate(batch):
+        mixed = len(kinds[op.path]) > 1
+        if op.kind == "write" and not mixed and last_write[op.path] != i:
+            continue
+        if op.kind == "append" and not mixed:
+            if op.path in append_slot:
+                merged[append_slot[op.path]].parts.append(op.text())
+                continue
+            append_slot[op.path] = len(merged)
+            op = _Op("append", op.path, None, parts=[op.text()])
+        merged.append(op)
+    return merged
+
+
+class ArtifactWriter:
+    """Queue of artifact writes executed in order by one background thread."""
+
+    def __init__(self, fsync: bool = False, max_batch: int = 256) -> None:
+        self.fsync = fsync
+        self.max_batch = max_batch
+        self._queue: "queue.Queue[Optional[_Op]]" = queue.Queue()
+        self._errors: List[Tuple[Path, BaseException]] = []
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.writes = 0
+        self.batches = 0
+
+    def _ensure_started(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="artifact-writer", daemon=True)
+                self._thread.start()
+
+    def _put(self, op: _Op) -> None:
+        self._ensure_started()
+        self._queue.put(op)
+
+    def write_text(self, path: Path, text: str) -> None:
+        self._put(_Op("write", path, text))
+
+    def write_json(self, path: Path, payload: Any, indent: Optional[int] = 2) -> None:
+        """Queue ``payload`` for JSON serialization on the worker; do not mutate it afterwards."""
+        self._put(_Op("write", path, payload, indent=indent, is_json=True))
+
+    def append_text(self, path: Path, text: str) -> None:
+        self._put(_Op("append", path, text))
+
+    @property
+    def pending(self) -> int:
+        return self._queue.unfinished_tasks
+
+    def flush(self) -> None:
+        """Block until every queued write is done; raise the first error since the last flush."""
+        if self._thread is not None:
+            self._queue.join()
+        with self._lock:
+            errors, self._errors = self._errors, []
+        if errors:
+            path, exc = errors[0]
+            raise RuntimeError(f"Failed to write {path} ({len(errors)} failed writes): {exc}") from exc
+
+    def close(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._queue.put(None)
+        self._queue.join()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while True:
+            batch: List[Optional[_Op]] = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            ops = [op for op in batch if op is not None]
+            try:
+                for op in coalesce(ops):
+                    self._execute(op)
+                self.writes += len(ops)
+                self.batches += 1
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if len(ops) < len(batch):
+                return
+
+    def _execute(self, op: _Op) -> None:
+        try:
+            if op.kind == "write":
+                atomic_write_text(op.path, op.text(), self.fsync)
+            else:
+                append_text(op.path, "".join(op.parts) if op.parts else op.text(), self.fsync)
+        except Exception as exc:  # noqa: BLE001
+            with self._lock:
+                self._errors.append((op.path, exc))
+
+
+def install_exit_handlers(writer: ArtifactWriter) -> None:
+    """Flush ``writer`` at exit; make SIGTERM raise SystemExit so exit handlers run."""
+    atexit.register(_flush_quietly, writer)
+    if threading.current_thread() is not threading.main_thread():
+        return
+    if signal.getsignal(signal.SIGTERM) is signal.SIG_DFL:
+        signal.signal(signal.SIGTERM, _exit_on_signal)
+
+
+def _flush_quietly(writer: ArtifactWriter) -> None:
+    try:
+        writer.flush()
+    except RuntimeError as exc:
+        print(f"   ! {exc}")
+
+
+def _exit_on_signal(signum: int, frame: Any) -> None:
+    raise SystemExit(128 + signum)
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Replay benchmark for the gene-analysis parsing and reporting pipeline.
+
+The recorded runs under `outputs/` (the Sophia baseline and the local llama3.2_3b and
+phi3_3.8b runs) are a corpus of real model responses. Each run's raw batches are
+replicated with renamed gene symbols (`TP53` -> `TP53_c7`) until the corpus holds
+`--genes` genes. The scaled corpus is then pushed through the same stages a run uses:
+`extract_json`, `parse_results` / `coerce_results`, `summarize`, `save_outputs` and
+`task4_eval.compare_models`.
+
+Every stage is checked against the recorded run: the unscaled replay must reproduce
+`results.json`, and scaled counts must be exact multiples of the unscaled ones. Wall
+time (median of `--repeats`) and peak traced memory are recorded per stage in
+`outputs/pipeline_benchmark.json`. With a saved baseline, the script exits non-zero
+on a correctness failure or when a stage gets slower than the allowed regression.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import re
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import runcore
+import task3
+import task4
+import task4_eval
+
+PROJECT_ROOT = Path(__file__).resolve().parent
+RESULTS_PATH = PROJECT_ROOT / "outputs" / "pipeline_benchmark.json"
+BASELINE_PATH = PROJECT_ROOT / "outputs" / "pipeline_baseline.json"
+CORPUS = {
+    "sophia": PROJECT_ROOT / "outputs" / "gene_analysis",
+    "llama3.2_3b": PROJECT_ROOT / "outputs" / "gene_analysis_local" / "llama3.2_3b",
+    "phi3_3.8b": PROJECT_ROOT / "outputs" / "gene_analysis_local" / "phi3_3.8b",
+}
+STRICT_RUN = "sophia"  # recorded with task3.parse_results; the local runs used task4.coerce_results
+
+
+@dataclass
+class Batch:
+    genes: List[str]
+    response: str
+
+
+def load_batches(run_dir: Path) -> List[Batch]:
+    raw = json.loads((run_dir / "raw_model_responses.json").read_text(encoding="utf-8"))
+    return [Batch(list(entry["genes"]), entry["response"]) for entry in raw]
+
+
+def scale_batches(batches: List[Batch], copies: int) -> List[Batch]:
+    """``copies`` renamed replicas of ``batches``; copy 0 keeps the recorded symbols."""
+    scaled: List[Batch] = list(batches)
+    for copy in range(1, copies):
+        for batch in batches:
+            pattern = re.compile("|".join(re.escape(f'"{g}"') for g in batch.genes))
+            renamed = pattern.sub(lambda m: f'"{m.group(0)[1:-1]}_c{copy}"', batch.response)
+            scaled.append(Batch([f"{g}_c{copy}" for g in batch.genes], renamed))
+    return scaled
+
+
+def parse_batches(batches: List[Batch], strict: bool) -> Tuple[List[Dict[str, Any]], List[task3.GeneResult]]:
+    payloads: List[Dict[str, Any]] = []
+    results: List[task3.GeneResult] = []
+    for batch in batches:
+        try:
+            payload = task3.extract_json(batch.response)
+        except ValueError:
+            payload = {"genes": []}  # task4 treats an unparseable batch as all-omitted
+        payloads.append(payload)
+        parse = task3.parse_results if strict else task4.coerce_results
+        results.extend(parse(payload, batch.genes))
+    return payloads, results
+
+
+def flags(results: List[task3.GeneResult]) -> Dict[str, int]:
+    return {r.gene: r.flags for r in results}
+
+
+def measure(fn: Callable[[], Any], repeats: int) -> Tuple[Any, Dict[str, float]]:
+    """Median wall time over ``repeats`` calls, then one traced call for peak memory."""
+    times = []
+    value = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        value = fn()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return value, {"median_ms": round(statistics.median(times) * 1000, 2), "peak_mib": round(peak / 2**20, 2)}
+
+
+def benchmark(target_genes: int, repeats: int) -> Dict[str, Any]:
+    report: Dict[str, Any] = {"target_genes": target_genes, "runs": {}, "failures": []}
+    failures: List[str] = report["failures"]
+    scaled_results: Dict[str, List[task3.GeneResult]] = {}
+    base_results: Dict[str, List[task3.GeneResult]] = {}
+    copies_by_run: Dict[str, int] = {}
+
+    for name, run_dir in CORPUS.items():
+        if not (run_dir / "raw_model_responses.json").exists():
+            print(f"   {name}: no recorded run at {run_dir}, skipped")
+            continue
+        batches = load_batches(run_dir)
+        genes_per_copy = sum(len(b.genes) for b in batches)
+        copies = max(1, -(-target_genes // genes_per_copy))
+        scaled = scale_batches(batches, copies)
+        strict = name == STRICT_RUN
+        stages: Dict[str, Dict[str, float]] = {}
+
+        texts = [b.response for b in scaled]
+        _, stages["extract_json"] = measure(lambda: [_safe_extract(t) for t in texts], repeats)
+        (payloads, results), stages["parse_results" if strict else "coerce_results"] = measure(
+            lambda: parse_batches(scaled, strict), repeats
+        )
+        summary, stages["summarize"] = measure(lambda: task3.summarize(results), repeats)
+        with tempfile.TemporaryDirectory() as tmp:
+            genes = [r.gene for r in results]
+            raw = [{"batch": i, "genes": b.genes, "response": b.response} for i, b in enumerate(scaled, start=1)]
+            _, stages["save_outputs"] = measure(
+                lambda: _save_and_flush(genes, raw, payloads, results, summary, name, Path(tmp)), repeats
+            )
+
+        # Correctness: the unscaled replay reproduces the recorded run, and copies scale linearly.
+        _, base = parse_batches(batches, strict)
+        recorded = json.loads((run_dir / "results.json").read_text(encoding="utf-8"))
+        if flags(base) != flags([task3.GeneResult.from_record(r) for r in recorded]):
+            failures.append(f"{name}: replayed flags differ from recorded results.json")
+        base_counts = task3.summarize(base)["disease_counts"]
+        if summary["total_genes"] != copies * len(base) or summary["disease_counts"] != {
+            d: copies * c for d, c in base_counts.items()
+        }:
+            failures.append(f"{name}: scaled summary is not {copies}x the recorded one")
+
+        base_results[name], scaled_results[name], copies_by_run[name] = base, results, copies
+        report["runs"][name] = {"genes": len(results), "batches": len(scaled), "stages": stages}
+        print(f"   {name}: {len(results)} genes, " + ", ".join(f"{s} {m['median_ms']:.1f} ms" for s, m in stages.items()))
+
+    if STRICT_RUN in scaled_results:
+        baseline_flags = flags(scaled_results[STRICT_RUN])
+        for name in [n for n in scaled_results if n != STRICT_RUN]:
+            local = scaled_results[name]
+            local_flags = flags(local)
+            expl = {r.gene: r.explanation for r in local}
+            stats, timing = measure(lambda: task4_eval.compare_models(baseline_flags, local_flags, expl), repeats)
+            report["runs"][name]["stages"]["compare_models"] = timing
+            print(f"   {name}: compare_models vs {STRICT_RUN} {timing['median_ms']:.1f} ms")
+            copies = min(copies_by_run[name], copies_by_run[STRICT_RUN])
+            base_stats = task4_eval.compare_models(
+                flags(base_results[STRICT_RUN]),
+                flags(base_results[name]),
+                {r.gene: r.explanation for r in base_results[name]},
+            )
+            if any(tuple(copies * v for v in base_stats[d]) != stats[d] for d in base_stats):
+                failures.append(f"{name}: scaled comparison is not {copies}x the recorded one")
+    return report
+
+
+def _save_and_flush(
+    genes: List[str],
+    raw: List[Dict[str, Any]],
+    payloads: List[Dict[str, Any]],
+    results: List[task3.GeneResult],
+    summary: Dict[str, Any],
+    name: str,
+    output_dir: Path,
+) -> None:
+    # Includes the background writer's work, so the stage measures the real write cost.
+    task3.save_outputs(genes, raw, payloads, results, summary, 0.0, name, output_dir)
+    runcore.flush_outputs()
+
+
+def _safe_extract(text: str) -> Optional[Dict[str, Any]]:
+    try:
+        return task3.extract_json(text)
+    except ValueError:
+        return None
+
+
+def find_regressions(
+    report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float, min_ms: float
+) -> List[str]:
+    problems = []
+    for name, run in report["runs"].items():
+        before_run = baseline.get("runs", {}).get(name)
+        if not before_run or before_run.get("genes") != run["genes"]:
+            continue
+        for stage, current in run["stages"].items():
+            before = before_run["stages"].get(stage)
+            if not before:
+                continue
+            delta = current["median_ms"] - before["median_ms"]
+            if delta > min_ms and current["median_ms"] > before["median_ms"] * (1 + tolerance):
+                problems.append(f"{name}/{stage}: {before['median_ms']:.1f} ms -> {current['median_ms']:.1f} ms")
+            if current["peak_mib"] > before["peak_mib"] * (1 + tolerance) + 1:
+                problems.append(f"{name}/{stage}: peak {before['peak_mib']:.1f} MiB -> {current['peak_mib']:.1f} MiB")
+    return problems
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the gene-analysis pipeline on scaled recorded responses.")
+    parser.add_argument("--genes", type=int, default=10_000, help="Genes per recorded run after scaling.")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed repetitions per stage.")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH, help="Baseline JSON to compare against.")
+    parser.add_argument("--update-baseline", action="store_true", help="Store these results as the new baseline.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown (0.25 = 25%%).")
+    parser.add_argument("--min-ms", type=float, default=50.0, help="Ignore slowdowns smaller than this many ms.")
+    args = parser.parse_args(argv)
+
+    print(f">> Replaying recorded responses at {args.genes} genes per run ({args.repeats} runs per stage)")
+    report = benchmark(args.genes, args.repeats)
+    RESULTS_PATH.parent.mkdir(parents=True, exist_ok=True)
+    RESULTS_PATH.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f">> Saved results to {RESULTS_PATH}")
+    if report["failures"]:
+        print(">> Correctness failures:")
+        for line in report["failures"]:
+            print(f"   {line}")
+        sys.exit(1)
+
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f">> Baseline updated at {args.baseline}")
+        return
+    if args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        problems = find_regressions(report, baseline, args.tolerance, args.min_ms)
+        if problems:
+            print(">> Pipeline regressions:")
+            for line in problems:
+                print(f"   {line}")
+            sys.exit(1)
+        print(">> No pipeline regressions against baseline.")
+
+
+if __name__ == "__main__":
+    main()
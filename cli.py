@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Single entry point for every workflow in this repo.
+
+    python3 cli.py [core options] <command> [command options]
+
+Core options (retries, timeouts, concurrency, response cache, backend URLs, background
+artifact writes) are applied to the shared `runcore` settings before the command runs,
+so they take effect for every workflow that calls a model. Each invocation is recorded under `outputs/runs/` with a
+manifest (arguments, settings, git commit, status, outputs written, per-model call
+stats) and a per-call `calls.jsonl`. `--profile` runs the command under `profiling`
+(top-N table, flame graph, network/parse/render/disk time) into `outputs/profiles/`.
+Command options are those of the underlying script; `python3 cli.py <command> --help`
+lists them.
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import importlib
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import profiling
+import runcore
+
+COMMANDS: Dict[str, Tuple[str, str]] = {
+    "telephone": ("task1", "Multi-model telephone chain on Sophia"),
+    "drift": ("telephone_drift", "Per-stage drift metrics for telephone runs"),
+    "openwebui": ("task2", "Install/configure Open WebUI, healthcheck the Sophia models"),
+    "proxy": ("sophia_proxy", "Local caching proxy in front of Sophia"),
+    "genes": ("task3", "Gene-disease analysis on Sophia"),
+    "genes-local": ("task4", "Gene-disease analysis on a local Ollama model"),
+    "store": ("gene_store", "Query the gene result store, summaries and comparisons from it"),
+    "graph": ("interaction_graph", "Interaction graph, consistency checks and cross-batch pass"),
+    "validate-summaries": ("summary_validation", "Check summaries against run data and across translations"),
+    "compare": ("task4_eval", "Compare local gene analyses with the Sophia baseline"),
+    "nanogpt": ("task5", "nanoGPT fine-tune, learning curve and sample"),
+    "sweep": ("nanogpt_sweep", "nanoGPT hyperparameter sweep"),
+    "sample": ("nanogpt_sampler", "Batched sampling from the nanoGPT checkpoint"),
+    "startup-bench": ("startup_bench", "Cold-start import benchmark of the entry points"),
+    "pipeline-bench": ("bench_pipeline", "Replay benchmark of the gene parsing/reporting pipeline"),
+}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Run any assignment workflow on the shared run core.",
+        epilog="\n".join(f"  {name:<14} {help_text}" for name, (_, help_text) in COMMANDS.items()),
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--retries", type=int, help=f"Retries per model call (default {runcore.SETTINGS.retries}).")
+    parser.add_argument("--backoff", type=float, help="Seconds of backoff per retry attempt.")
+    parser.add_argument("--timeout", type=float, help="Override every per-request timeout (seconds).")
+    parser.add_argument(
+        "--concurrency", type=int, help=f"Default parallelism for streaming workflows ({runcore.SETTINGS.concurrency})."
+    )
+    parser.add_argument("--cache-dir", type=Path, help="Cache temperature-0 completions on disk here.")
+    parser.add_argument("--sophia-url", help="Sophia base URL (default: model_servers.yaml).")
+    parser.add_argument("--ollama-url", help=f"Ollama base URL (default {runcore.OLLAMA_DEFAULT_URL}).")
+    parser.add_argument(
+        "--sync-writes", action="store_true", help="Write artifacts on the calling thread instead of in the background."
+    )
+    parser.add_argument("--no-manifest", action="store_true", help="Do not record the run under outputs/runs/.")
+    parser.add_argument(
+        "--profile", action="store_true", help="Profile the command (cProfile, flame graph, time per bucket)."
+    )
+    parser.add_argument("--profile-top", type=int, default=30, help="Rows in the profile's top-N tables.")
+    parser.add_argument("command", choices=sorted(COMMANDS), metavar="command", help="Workflow to run (see below).")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help="Options passed to the workflow.")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = build_parser().parse_args(argv)
+    runcore.configure(
+        retries=args.retries,
+        backoff_sec=args.backoff,
+        timeout=args.timeout,
+        concurrency=args.concurrency,
+        cache_dir=args.cache_dir,
+        sophia_base_url=args.sophia_url,
+        ollama_base_url=args.ollama_url,
+        background_writes=False if args.sync_writes else None,
+    )
+    module = importlib.import_module(COMMANDS[args.command][0])
+    help_only = bool({"-h", "--help"} & set(args.args))
+    profile = (
+        profiling.profile_run(args.command, top=args.profile_top)
+        if args.profile and not help_only
+        else contextlib.nullcontext()
+    )
+    if args.no_manifest or help_only:
+        with profile:
+            module.main(args.args)
+        return
+    with runcore.start_run(args.command, args.args), profile:
+        module.main(args.args)
+
+
+if __name__ == "__main__":
+    main()
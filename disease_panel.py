@@ -0,0 +1,159 @@
+"""
+Configurable disease panel for the gene analysis, with one bitset per gene.
+
+The diseases a gene is classified against come from `disease_panel.yaml` (cancer,
+heart disease, diabetes and dementia unless changed). Disease i of the panel is bit i
+of `GeneResult.flags`, so a classification is one int however many conditions the
+panel holds:
+  • per-disease counts decode each distinct mask of a run once, not every gene;
+  • agreement between two classifications is a popcount of their XOR;
+  • `gene_store` keeps the mask in one column and the panel's keys next to it.
+results.json rows still carry a `has_<key>_link` bool per disease beside `flags`, and
+rows from older runs (no `flags`) are read from those keys.
+"""
+from __future__ import annotations
+
+import argparse
+import re
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, Mapping, Optional, Sequence, Tuple
+
+PROJECT_ROOT = Path(__file__).resolve().parent
+PANEL_PATH = PROJECT_ROOT / "disease_panel.yaml"
+LEGACY_KEYS = ("cancer", "heart_disease", "diabetes", "dementia")  # the fixed panel of older runs
+KEY_RE = re.compile(r"[a-z][a-z0-9_]*")
+
+
+@dataclass(frozen=True)
+class Disease:
+    key: str
+    label: str
+    description: Optional[str] = None
+    aliases: Tuple[str, ...] = ()
+
+    @property
+    def field(self) -> str:
+        """The per-disease bool key in results.json rows."""
+        return f"has_{self.key}_link"
+
+
+class DiseasePanel:
+    def __init__(self, diseases: Sequence[Disease]) -> None:
+        keys = [d.key for d in diseases]
+        if not keys:
+            raise ValueError("Disease panel is empty.")
+        if len(set(keys)) != len(keys):
+            raise ValueError(f"Duplicate disease keys in panel: {keys}")
+        self.diseases = tuple(diseases)
+        self.keys = keys
+        self.full_mask = (1 << len(keys)) - 1
+        self._bits = {key: 1 << i for i, key in enumerate(keys)}
+
+    def __len__(self) -> int:
+        return len(self.diseases)
+
+    def __iter__(self) -> Iterator[Disease]:
+        return iter(self.diseases)
+
+    def bit(self, key: str) -> int:
+        return self._bits[key]
+
+    def pack(self, flags: Mapping[str, Any]) -> int:
+        """Mask of the diseases whose value in ``flags`` is truthy."""
+        mask = 0
+        for key, value in flags.items():
+            if value:
+                mask |= self._bits[key]
+        return mask
+
+    def unpack(self, mask: int) -> Dict[str, bool]:
+        return {key: bool(mask & bit) for key, bit in self._bits.items()}
+
+    def tally(self, histogram: Mapping[int, int]) -> Dict[str, int]:
+        """Per-disease counts from a {mask: genes with that mask} histogram."""
+        counts = dict.fromkeys(self.keys, 0)
+        for mask, genes in histogram.items():
+            for key, bit in self._bits.items():
+                if mask & bit:
+                    counts[key] += genes
+        return counts
+
+    def counts(self, masks: Iterable[int]) -> Dict[str, int]:
+        """Genes linked to each disease."""
+        return self.tally(Counter(masks))
+
+    def agreement(self, a: int, b: int) -> int:
+        """Number of diseases on which masks ``a`` and ``b`` agree."""
+        return (~(a ^ b) & self.full_mask).bit_count()
+
+    def record_flags(self, mask: int) -> Dict[str, bool]:
+        return {d.field: bool(mask & self._bits[d.key]) for d in self.diseases}
+
+    def mask_from_record(self, record: Mapping[str, Any]) -> int:
+        """Mask of a results.json row: from its `has_<key>_link` bools, else from `flags`."""
+        if all(d.field in record for d in self.diseases):
+            return self.pack({d.key: record[d.field] for d in self.diseases})
+        if "flags" in record:
+            return int(record["flags"]) & self.full_mask
+        raise KeyError(f"Result for {record.get('gene')!r} has no flags for diseases {self.keys}")
+
+
+def _label(key: str) -> str:
+    return key.replace("_", " ").title()
+
+
+def load_panel(path: Path = PANEL_PATH) -> DiseasePanel:
+    """Read a panel from YAML; without the file, the four diseases of the original runs."""
+    if not path.exists():
+        return DiseasePanel([Disease(key, _label(key)) for key in LEGACY_KEYS])
+    import yaml
+
+    data = yaml.safe_load(path.read_text(encoding="utf-8")) or {}
+    diseases = []
+    for entry in data.get("diseases") or []:
+        if isinstance(entry, str):
+            entry = {"key": entry}
+        key = str(entry["key"])
+        if not KEY_RE.fullmatch(key):
+            raise ValueError(f"Disease key {key!r} in {path} must be lower_snake_case.")
+        diseases.append(
+            Disease(
+                key=key,
+                label=str(entry.get("label") or _label(key)),
+                description=entry.get("description"),
+                aliases=tuple(str(alias).lower() for alias in entry.get("aliases") or ()),
+            )
+        )
+    return DiseasePanel(diseases)
+
+
+_CURRENT: Optional[DiseasePanel] = None
+
+
+def current() -> DiseasePanel:
+    """The panel in use: set by `use`, else loaded from disease_panel.yaml on first call."""
+    global _CURRENT
+    if _CURRENT is None:
+        _CURRENT = load_panel()
+    return _CURRENT
+
+
+def use(panel: DiseasePanel) -> DiseasePanel:
+    global _CURRENT
+    _CURRENT = panel
+    return panel
+
+
+def add_panel_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--disease-panel",
+        type=Path,
+        default=PANEL_PATH,
+        help="YAML list of diseases to classify genes against (default: disease_panel.yaml).",
+    )
+
+
+def from_args(args: argparse.Namespace) -> DiseasePanel:
+    return use(load_panel(args.disease_panel))
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Persistent gene-level result store shared by task3 and task4.
+
+Every parsed gene classification is stored in SQLite, keyed by (model, gene,
+prompt version). Before a run queries a model it looks its genes up here and only
+sends the unseen ones, so rerunning with another seed costs only the new genes.
+The prompt version is a hash of `task3.build_prompt`, so changing the prompt (or the
+disease panel it lists) starts a fresh set of entries automatically. Each row keeps
+the gene's disease-panel mask in `flags` and the panel's keys in `panel`; stores
+with the older one-column-per-disease layout are migrated on open.
+
+The CLI builds summaries and comparisons straight from the store and backfills it
+from existing `results.json` files:
+
+    python3 gene_store.py import outputs/gene_analysis --model meta-llama/Meta-Llama-3.1-70B-Instruct
+    python3 gene_store.py models
+    python3 gene_store.py summary --model llama3.2:3b
+    python3 gene_store.py compare --baseline meta-llama/Meta-Llama-3.1-70B-Instruct --local llama3.2:3b
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import disease_panel
+import profiling
+import runcore
+import task3
+
+STORE_PATH = task3.PROJECT_ROOT / "outputs" / "gene_store.sqlite"
+REPORT_DIR = task3.PROJECT_ROOT / "outputs" / "gene_store"
+SQL_CHUNK = 500  # stay well below SQLite's bound-parameter limit
+
+TABLE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS gene_results (
+    model TEXT NOT NULL,
+    gene TEXT NOT NULL,
+    prompt_version TEXT NOT NULL,
+    backend TEXT NOT NULL,
+    panel TEXT NOT NULL,
+    flags INTEGER NOT NULL,
+    result TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (model, prompt_version, gene)
+)"""
+SCHEMA = TABLE_SCHEMA + """;
+CREATE INDEX IF NOT EXISTS idx_gene_results_gene ON gene_results (gene, prompt_version);
+"""
+
+
+def prompt_version() -> str:
+    template = json.dumps(task3.build_prompt(["{GENES}"]), sort_keys=True)
+    return hashlib.sha1(template.encode("utf-8")).hexdigest()[:12]
+
+
+def _migrate_legacy_columns(conn: sqlite3.Connection) -> None:
+    """Fold the per-disease columns of older stores into `flags` (one-time, in place)."""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(gene_results)")}
+    if not columns or "flags" in columns:
+        return
+    legacy = [f"has_{key}_link" for key in disease_panel.LEGACY_KEYS]
+    flags_sql = " | ".join(f"({column} << {bit})" for bit, column in enumerate(legacy))
+    with conn:
+        conn.execute("BEGIN")
+        conn.execute("DROP INDEX IF EXISTS idx_gene_results_gene")
+        conn.execute("ALTER TABLE gene_results RENAME TO gene_results_legacy")
+        conn.execute(TABLE_SCHEMA)
+        conn.execute(
+            f"INSERT INTO gene_results SELECT model, gene, prompt_version, backend, ?, {flags_sql}, result, "
+            "created_at FROM gene_results_legacy",
+            (",".join(disease_panel.LEGACY_KEYS),),
+        )
+        conn.execute("DROP TABLE gene_results_legacy")
+
+
+def _chunks(items: List[str], size: int = SQL_CHUNK) -> Iterator[List[str]]:
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+class GeneStore:
+    def __init__(self, path: Path = STORE_PATH, version: Optional[str] = None) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.version = version or prompt_version()
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        _migrate_legacy_columns(self.conn)
+        self.conn.executescript(SCHEMA)
+
+    def __enter__(self) -> "GeneStore":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def lookup(self, model: str, genes: List[str]) -> Dict[str, task3.GeneResult]:
+        """Stored results for ``genes`` under ``model`` and the current prompt version."""
+        found: Dict[str, task3.GeneResult] = {}
+        with profiling.span("disk", "gene_store.lookup"):
+            for chunk in _chunks(list(dict.fromkeys(genes))):
+                rows = self.conn.execute(
+                    f"SELECT gene, result FROM gene_results WHERE model = ? AND prompt_version = ? "
+                    f"AND gene IN ({','.join('?' * len(chunk))})",
+                    [model, self.version, *chunk],
+                )
+                for gene, payload in rows:
+                    found[gene] = task3.GeneResult.from_record(json.loads(payload))
+        return found
+
+    def put_many(self, model: str, backend: str, results: Iterable[task3.GeneResult]) -> int:
+        now = time.time()
+        panel = ",".join(disease_panel.current().keys)
+        rows = [
+            (model, r.gene, self.version, backend, panel, r.flags, json.dumps(r.to_record()), now)
+            for r in results
+        ]
+        with profiling.span("disk", "gene_store.put_many"), self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO gene_results VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def results_for(self, model: str, genes: Optional[List[str]] = None) -> List[task3.GeneResult]:
+        if genes is not None:
+            found = self.lookup(model, genes)
+            return [found[g] for g in genes if g in found]
+        rows = self.conn.execute(
+            "SELECT result FROM gene_results WHERE model = ? AND prompt_version = ? ORDER BY gene",
+            (model, self.version),
+        )
+        return [task3.GeneResult.from_record(json.loads(payload)) for (payload,) in rows]
+
+    def models(self) -> List[Dict[str, Any]]:
+        # One row per distinct mask; each group's counts are decoded with the panel it was stored under.
+        rows = self.conn.execute(
+            "SELECT model, backend, prompt_version, panel, flags, COUNT(*) FROM gene_results "
+            "GROUP BY model, backend, prompt_version, panel, flags ORDER BY model"
+        )
+        histograms: Dict[Tuple[str, str, str, str], Dict[int, int]] = {}
+        for model, backend, version, panel, flags, count in rows:
+            histograms.setdefault((model, backend, version, panel), {})[flags] = count
+        entries = []
+        for (model, backend, version, panel), histogram in histograms.items():
+            keys = panel.split(",")
+            decoder = disease_panel.DiseasePanel([disease_panel.Disease(k, k) for k in keys])
+            entries.append(
+                {
+                    "model": model,
+                    "backend": backend,
+                    "prompt_version": version,
+                    "genes": sum(histogram.values()),
+                    "disease_counts": decoder.tally(histogram),
+                }
+            )
+        return entries
+
+    def flags_and_explanations(
+        self, model: str, genes: Optional[List[str]] = None
+    ) -> Tuple[Dict[str, int], Dict[str, str]]:
+        """Per-gene disease masks and explanations in the shape task4_eval.compare_models expects."""
+        results = self.results_for(model, genes)
+        return {r.gene: r.flags for r in results}, {r.gene: r.explanation for r in results}
+
+
+def split_known(
+    store: Optional[GeneStore], model: str, genes: List[str]
+) -> Tuple[Dict[str, task3.GeneResult], List[str]]:
+    """Return (stored results, genes still to query); with no store every gene is pending."""
+    if store is None or not genes:
+        return {}, list(genes)
+    known = store.lookup(model, genes)
+    return known, [g for g in genes if g not in known]
+
+
+def add_store_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--store", type=Path, default=STORE_PATH, help="SQLite gene result store.")
+    parser.add_argument("--no-store", action="store_true", help="Neither read nor write the gene store.")
+    parser.add_argument("--refresh", action="store_true", help="Re-query every gene and overwrite stored results.")
+
+
+def open_store(args: argparse.Namespace) -> Optional[GeneStore]:
+    if args.no_store:
+        return None
+    samples = getattr(args, "samples", 1)
+    # Voted results are kept apart from single-call ones for the same prompt.
+    return GeneStore(args.store, version=f"{prompt_version()}-vote{samples}" if samples > 1 else None)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Query and maintain the gene result store.")
+    parser.add_argument("--store", type=Path, default=STORE_PATH, help="SQLite gene result store.")
+    disease_panel.add_panel_arguments(parser)
+    sub = parser.add_subparsers(dest="action", required=True)
+    sub.add_parser("models", help="List stored models with gene and disease counts.")
+    imp = sub.add_parser("import", help="Backfill the store from a results.json directory.")
+    imp.add_argument("results_dir", type=Path)
+    imp.add_argument("--model", required=True)
+    imp.add_argument("--backend", default="sophia")
+    summ = sub.add_parser("summary", help="Write summary.json for a model from stored results.")
+    summ.add_argument("--model", required=True)
+    summ.add_argument("--output-dir", type=Path, help="Default: outputs/gene_store/<model>.")
+    comp = sub.add_parser("compare", help="Agreement of local models with a baseline on shared genes.")
+    comp.add_argument("--baseline", required=True)
+    comp.add_argument("--local", nargs="+", required=True)
+    comp.add_argument("--output", type=Path, default=REPORT_DIR / "comparison.md")
+    args = parser.parse_args(argv)
+    disease_panel.from_args(args)
+
+    with GeneStore(args.store) as store:
+        if args.action == "models":
+            for entry in store.models():
+                print(
+                    f"{entry['model']} [{entry['backend']}, prompt {entry['prompt_version']}]: "
+                    f"{entry['genes']} genes, {entry['disease_counts']}"
+                )
+        elif args.action == "import":
+            data = json.loads((args.results_dir / "results.json").read_text(encoding="utf-8"))
+            count = store.put_many(args.model, args.backend, (task3.GeneResult.from_record(r) for r in data))
+            print(f">> Imported {count} genes for {args.model} (prompt {store.version})")
+        elif args.action == "summary":
+            results = store.results_for(args.model)
+            if not results:
+                raise SystemExit(f"No stored results for {args.model} (prompt {store.version}).")
+            import task4
+
+            output_dir = args.output_dir or REPORT_DIR / task4.sanitize_model_name(args.model)
+            summary = task3.summarize(results)
+            runcore.write_json(output_dir / "summary.json", {"model": args.model, "summary": summary})
+            print(json.dumps(summary["disease_counts"]))
+            print(f">> {len(results)} stored genes summarized in {output_dir}")
+        elif args.action == "compare":
+            import task4_eval
+
+            baseline, _ = store.flags_and_explanations(args.baseline)
+            lines = ["# Local vs Baseline Comparison (gene store)", "", f"Baseline: `{args.baseline}`", ""]
+            for model in args.local:
+                local, expl = store.flags_and_explanations(model, list(baseline))
+                stats = task4_eval.compare_models(baseline, local, expl)
+                lines += [f"## {model} ({len(local)} shared genes)", "| Disease | Agree | Disagree | Unsure |",
+                          "| --- | ---:| ---:| ---:|"]
+                lines += [f"| {d.replace('_', ' ')} | {ag} | {di} | {un} |" for d, (ag, di, un) in stats.items()]
+                lines.append("")
+            runcore.write_text(args.output, "\n".join(lines) + "\n")
+            print("\n".join(lines))
+            print(f"Wrote comparison report to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
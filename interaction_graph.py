@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Gene interaction graph built from a gene-analysis run (task3 or task4 outputs).
+
+`task3.summarize` keeps interactions as a flat `{gene, partners}` list, and the prompt
+only asks about partners inside the same batch. This module indexes every reported
+partner into an adjacency map, then:
+  • symmetrizes it and lists one-sided claims (A lists B, B does not list A),
+  • computes connected components (union-find) and degree statistics,
+  • optionally runs a targeted second pass that asks the model only about candidate
+    pairs whose genes were in different batches, instead of re-querying whole genes.
+Results go to `interaction_graph.{json,md}` next to the run's `results.json`.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+from collections import Counter
+from dataclasses import dataclass, field
+from itertools import combinations
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import disease_panel
+import runcore
+
+PROJECT_ROOT = Path(__file__).resolve().parent
+DEFAULT_RESULTS_DIR = PROJECT_ROOT / "outputs" / "gene_analysis"
+
+Edge = Tuple[str, str]
+
+
+def edge(a: str, b: str) -> Edge:
+    return (a, b) if a <= b else (b, a)
+
+
+@dataclass
+class InteractionGraph:
+    genes: List[str]
+    claims: Dict[str, Set[str]] = field(default_factory=dict)  # directed: gene -> partners it listed
+    sources: Dict[Edge, str] = field(default_factory=dict)  # undirected edge -> "batch" | "cross_batch"
+    unknown_partners: Dict[str, List[str]] = field(default_factory=dict)
+
+    @classmethod
+    def from_results(cls, results: Iterable[Dict[str, Any]]) -> "InteractionGraph":
+        records = list(results)
+        graph = cls(genes=[r["gene"] for r in records])
+        known = set(graph.genes)
+        for record in records:
+            gene = record["gene"]
+            listed = graph.claims.setdefault(gene, set())
+            for partner in record.get("interacting_genes") or []:
+                partner = str(partner).strip()
+                if partner == gene:
+                    continue
+                if partner not in known:
+                    graph.unknown_partners.setdefault(gene, []).append(partner)
+                    continue
+                listed.add(partner)
+                graph.sources.setdefault(edge(gene, partner), "batch")
+        return graph
+
+    def add_edge(self, a: str, b: str, source: str) -> None:
+        self.sources.setdefault(edge(a, b), source)
+
+    @property
+    def edges(self) -> List[Edge]:
+        return sorted(self.sources)
+
+    def adjacency(self) -> Dict[str, Set[str]]:
+        """Symmetrized adjacency index over every gene (isolated genes map to an empty set)."""
+        adj: Dict[str, Set[str]] = {g: set() for g in self.genes}
+        for a, b in self.sources:
+            adj[a].add(b)
+            adj[b].add(a)
+        return adj
+
+    def neighbors(self, gene: str) -> Set[str]:
+        return self.adjacency().get(gene, set())
+
+    def one_sided(self) -> List[Edge]:
+        """Directed claims (a, b) where b does not list a back."""
+        return sorted(
+            (a, b) for a, partners in self.claims.items() for b in partners if a not in self.claims.get(b, set())
+        )
+
+    def components(self) -> List[List[str]]:
+        parent = {g: g for g in self.genes}
+
+        def find(x: str) -> str:
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        for a, b in self.sources:
+            ra, rb = find(a), find(b)
+            if ra != rb:
+                parent[ra] = rb
+        groups: Dict[str, List[str]] = {}
+        for gene in self.genes:
+            groups.setdefault(find(gene), []).append(gene)
+        return sorted((sorted(g) for g in groups.values()), key=lambda g: (-len(g), g[0]))
+
+    def degree_stats(self, top: int = 5) -> Dict[str, Any]:
+        degrees = {g: len(n) for g, n in self.adjacency().items()}
+        values = list(degrees.values())
+        return {
+            "nodes": len(values),
+            "edges": len(self.sources),
+            "mean_degree": round(sum(values) / len(values), 3) if values else 0.0,
+            "max_degree": max(values, default=0),
+            "isolated": sum(1 for v in values if v == 0),
+            "histogram": {str(k): v for k, v in sorted(Counter(values).items())},
+            "hubs": [
+                {"gene": g, "degree": d}
+                for g, d in sorted(degrees.items(), key=lambda item: (-item[1], item[0]))[:top]
+                if d > 0
+            ],
+        }
+
+    def report(self) -> Dict[str, Any]:
+        components = self.components()
+        return {
+            "degree_stats": self.degree_stats(),
+            "edges": [{"a": a, "b": b, "source": self.sources[(a, b)]} for a, b in self.edges],
+            "one_sided_claims": [{"from": a, "to": b} for a, b in self.one_sided()],
+            "unknown_partners": self.unknown_partners,
+            "components": [c for c in components if len(c) > 1],
+            "singletons": sum(1 for c in components if len(c) == 1),
+        }
+
+
+def load_batches(results_dir: Path) -> List[List[str]]:
+    raw = json.loads((results_dir / "raw_model_responses.json").read_text(encoding="utf-8"))
+    return [list(batch["genes"]) for batch in raw]
+
+
+def candidate_pairs(
+    results: List[Dict[str, Any]], batches: List[List[str]], graph: InteractionGraph, max_pairs: int
+) -> List[Edge]:
+    """Cross-batch pairs worth asking about, most shared disease links first.
+
+    Pairs from the same batch were already covered by the first pass, and pairs that
+    share no disease association are unlikely partners, so both are skipped. Genes
+    reused from the gene store belong to no batch of this run and pair with everyone.
+    """
+    batch_of = {g: i for i, batch in enumerate(batches) for g in batch}
+    panel = disease_panel.current()
+    # Disease-panel masks; rows from runs before `flags` existed are read from their has_*_link keys.
+    flags = {r["gene"]: r["flags"] if "flags" in r else panel.mask_from_record(r) for r in results}
+    degree = {g: len(n) for g, n in graph.adjacency().items()}
+    scored = []
+    for a, b in combinations(sorted(flags), 2):
+        same_batch = a in batch_of and batch_of.get(a) == batch_of.get(b)
+        if same_batch or edge(a, b) in graph.sources:
+            continue
+        shared = (flags[a] & flags[b]).bit_count()
+        if shared:
+            scored.append((-shared, -(degree.get(a, 0) + degree.get(b, 0)), a, b))
+    scored.sort()
+    return [(a, b) for _, _, a, b in scored[:max_pairs]]
+
+
+def build_pair_prompt(pairs: List[Edge]) -> List[Dict[str, str]]:
+    listing = "\n".join(f"- {a} / {b}" for a, b in pairs)
+    schema = {"pairs": [{"a": "TP53", "b": "MDM2", "interacts": True, "evidence": "BRIEF RATIONALE"}]}
+    return [
+        {
+            "role": "system",
+            "content": (
+                "You translate biomedical questions into accurate, concise JSON answers. "
+                "Do not include markdown fences or prose outside the JSON object."
+            ),
+        },
+        {
+            "role": "user",
+            "content": (
+                "For each pair of human genes below, state whether the two genes are known to interact "
+                "(direct binding, regulation, or the same well-characterized pathway).\n"
+                f"{listing}\n\nRespond only with JSON following exactly this schema:\n"
+                f"{json.dumps(schema, indent=2)}\n"
+                "Limit evidence to one sentence. If there is no solid evidence, set `interacts` to false."
+            ),
+        },
+    ]
+
+
+def second_pass(
+    graph: InteractionGraph,
+    pairs: List[Edge],
+    backend: str,
+    model: str,
+    pairs_per_request: int = 25,
+    timeout: int = 180,
+) -> List[Dict[str, Any]]:
+    """Ask ``model`` about ``pairs`` in small groups and add confirmed links to ``graph``."""
+    import task3
+
+    verdicts: List[Dict[str, Any]] = []
+    for start in range(0, len(pairs), pairs_per_request):
+        chunk = pairs[start : start + pairs_per_request]
+        wanted = set(chunk)
+        options: Dict[str, Any] = {"temperature": 0}
+        if backend == "ollama":
+            options["format"] = "json"
+        result = runcore.chat(backend, model, build_pair_prompt(chunk), timeout=timeout, **options)
+        try:
+            payload = task3.extract_json(result.text)
+        except ValueError as exc:
+            print(f"   ! Pair batch {start // pairs_per_request + 1} unparseable: {exc}")
+            continue
+        for entry in payload.get("pairs", []):
+            try:
+                pair = edge(str(entry["a"]), str(entry["b"]))
+            except KeyError:
+                continue
+            if pair not in wanted:
+                continue
+            verdict = {"a": pair[0], "b": pair[1], "interacts": bool(entry.get("interacts")),
+                       "evidence": entry.get("evidence", "")}
+            verdicts.append(verdict)
+            if verdict["interacts"]:
+                graph.add_edge(pair[0], pair[1], "cross_batch")
+        print(f">> Second pass: {min(start + pairs_per_request, len(pairs))}/{len(pairs)} pairs checked")
+    return verdicts
+
+
+def write_graph_report(report: Dict[str, Any], output_dir: Path) -> None:
+    json_path = runcore.write_json(output_dir / "interaction_graph.json", report)
+    stats = report["degree_stats"]
+    lines = [
+        "# Interaction Graph",
+        "",
+        f"- Genes: {stats['nodes']}, edges: {stats['edges']} "
+        f"({sum(e['source'] == 'cross_batch' for e in report['edges'])} from the cross-batch pass)",
+        f"- Mean degree: {stats['mean_degree']}, max degree: {stats['max_degree']}, isolated genes: {stats['isolated']}",
+        f"- One-sided claims: {len(report['one_sided_claims'])}",
+        f"- Partners outside the gene set: {sum(len(v) for v in report['unknown_partners'].values())}",
+        "",
+        "## Components",
+    ]
+    lines += [f"- {len(c)} genes: {', '.join(c)}" for c in report["components"]] or ["- None"]
+    lines += ["", "## Hubs"]
+    lines += [f"- {h['gene']}: {h['degree']}" for h in stats["hubs"]] or ["- None"]
+    if report["one_sided_claims"]:
+        lines += ["", "## One-Sided Claims"]
+        lines += [f"- {c['from']} lists {c['to']}, not reciprocated" for c in report["one_sided_claims"]]
+    md_path = runcore.write_text(output_dir / "interaction_graph.md", "\n".join(lines) + "\n")
+    print(f"Saved interaction graph to {json_path}")
+    print(f"Saved interaction summary to {md_path}")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Build and check the gene interaction graph of an analysis run.")
+    parser.add_argument(
+        "--results-dir",
+        type=Path,
+        default=DEFAULT_RESULTS_DIR,
+        help="Directory containing results.json (task3 output or a task4 model directory).",
+    )
+    parser.add_argument("--second-pass", action="store_true", help="Ask the model about cross-batch candidate pairs.")
+    parser.add_argument("--backend", choices=sorted(runcore.BACKENDS), default="sophia", help="Backend for --second-pass.")
+    parser.add_argument("--model", default="meta-llama/Meta-Llama-3.1-70B-Instruct", help="Model for --second-pass.")
+    parser.add_argument("--max-pairs", type=int, default=200, help="Cap on candidate pairs sent to the model.")
+    parser.add_argument("--pairs-per-request", type=int, default=25, help="Pairs per model request.")
+    args = parser.parse_args(argv)
+
+    results = json.loads((args.results_dir / "results.json").read_text(encoding="utf-8"))
+    graph = InteractionGraph.from_results(results)
+    print(f">> Indexed {len(graph.sources)} interactions across {len(graph.genes)} genes")
+    report = graph.report()
+    if args.second_pass:
+        pairs = candidate_pairs(results, load_batches(args.results_dir), graph, args.max_pairs)
+        print(f">> {len(pairs)} cross-batch candidate pairs for {args.model}")
+        verdicts = second_pass(graph, pairs, args.backend, args.model, args.pairs_per_request)
+        report = graph.report()
+        report["second_pass"] = {
+            "model": args.model,
+            "candidates": len(pairs),
+            "confirmed": sum(v["interacts"] for v in verdicts),
+            "verdicts": verdicts,
+        }
+    write_graph_report(report, args.results_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Persistent, batched sampler for the nanoGPT checkpoint trained by task5.
+
+The checkpoint is loaded once and kept in memory. Prompts are grouped by token
+length so each group is generated as one batch; decoding reuses a per-layer
+key/value cache so every new token costs a single-position forward pass instead
+of re-running the whole context. Use it from Python (`Sampler`), from the CLI
+for bulk generation, or as a small local HTTP service (`--serve`).
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import pickle
+import sys
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import torch
+import torch.nn.functional as F
+
+PROJECT_ROOT = Path(__file__).resolve().parent
+NANOGPT_DIR = PROJECT_ROOT / "nanoGPT"
+CKPT_PATH = NANOGPT_DIR / "out" / "ckpt.pt"
+SAMPLE_SEPARATOR = "---------------"
+
+KVCache = List[Tuple[torch.Tensor, torch.Tensor]]
+
+
+class Sampler:
+    def __init__(self, ckpt_path: Path = CKPT_PATH, device: str = "cpu", seed: int = 1337) -> None:
+        if str(NANOGPT_DIR) not in sys.path:
+            sys.path.insert(0, str(NANOGPT_DIR))
+        from model import GPT, GPTConfig  # type: ignore  # pylint: disable=import-outside-toplevel
+
+        torch.manual_seed(seed)
+        self.device = device
+        checkpoint = torch.load(ckpt_path, map_location=device)
+        model = GPT(GPTConfig(**checkpoint["model_args"]))
+        state_dict = {k.removeprefix("_orig_mod."): v for k, v in checkpoint["model"].items()}
+        model.load_state_dict(state_dict)
+        self.model = model.eval().to(device)
+        self.block_size = model.config.block_size
+        self._load_codec(checkpoint)
+        self._lock = threading.Lock()  # one generation at a time; the batch is the unit of parallelism
+
+    def _load_codec(self, checkpoint: Dict[str, Any]) -> None:
+        dataset = (checkpoint.get("config") or {}).get("dataset")
+        meta_path = NANOGPT_DIR / "data" / str(dataset) / "meta.pkl"
+        if dataset and meta_path.exists():
+            with meta_path.open("rb") as fh:
+                meta = pickle.load(fh)
+            stoi, itos = meta["stoi"], meta["itos"]
+            self.encode = lambda s: [stoi[c] for c in s]
+            self.decode = lambda ids: "".join(itos[i] for i in ids)
+        else:
+            import tiktoken
+
+            enc = tiktoken.get_encoding("gpt2")
+            self.encode = lambda s: enc.encode(s, allowed_special={"<|endoftext|>"})
+            self.decode = enc.decode
+
+    def _forward(self, idx: torch.Tensor, past: Optional[KVCache], pos0: int) -> Tuple[torch.Tensor, KVCache]:
+        """Forward ``idx`` (B, T) at positions pos0..pos0+T-1, returning last-position logits and the cache."""
+        tr = self.model.transformer
+        _, T = idx.shape
+        pos = torch.arange(pos0, pos0 + T, dtype=torch.long, device=idx.device)
+        x = tr.drop(tr.wte(idx) + tr.wpe(pos))
+        new_past: KVCache = []
+        for layer, block in enumerate(tr.h):
+            attn = block.attn
+            B, _, C = x.shape
+            q, k, v = attn.c_attn(block.ln_1(x)).split(attn.n_embd, dim=2)
+            q, k, v = (t.view(B, T, attn.n_head, C // attn.n_head).transpose(1, 2) for t in (q, k, v))
+            if past is not None:
+                k = torch.cat([past[layer][0], k], dim=2)
+                v = torch.cat([past[layer][1], v], dim=2)
+            new_past.append((k, v))
+            # Prefill needs the causal mask; a single decoded token may attend to the whole cache.
+            y = F.scaled_dot_product_attention(q, k, v, is_causal=past is None and T > 1)
+            y = y.transpose(1, 2).contiguous().view(B, T, C)
+            x = x + attn.resid_dropout(attn.c_proj(y))
+            x = x + block.mlp(block.ln_2(x))
+        x = tr.ln_f(x[:, [-1], :])
+        return self.model.lm_head(x)[:, -1, :], new_past
+
+    @torch.inference_mode()
+    def _generate_batch(
+        self, idx: torch.Tensor, max_new_tokens: int, temperature: float, top_k: Optional[int]
+    ) -> torch.Tensor:
+        past: Optional[KVCache] = None
+        pos0 = 0
+        step_input = idx[:, -self.block_size :]
+        for _ in range(max_new_tokens):
+            if past is not None and past[0][0].shape[2] >= self.block_size:
+                # Context window full: fall back to nanoGPT's behaviour of re-reading the last block.
+                past, pos0, step_input = None, 0, idx[:, -self.block_size :]
+            logits, past = self._forward(step_input, past, pos0)
+            pos0 += step_input.shape[1]
+            logits = logits / temperature
+            if top_k is not None:
+                v, _ = torch.topk(logits, min(top_k, logits.size(-1)))
+                logits[logits < v[:, [-1]]] = -float("inf")
+            idx_next = torch.multinomial(F.softmax(logits, dim=-1), num_samples=1)
+            idx = torch.cat((idx, idx_next), dim=1)
+            step_input = idx_next
+        return idx
+
+    def generate(
+        self,
+        prompts: List[str],
+        max_new_tokens: int = 40,
+        temperature: float = 0.8,
+        top_k: Optional[int] = 200,
+        batch_size: int = 64,
+    ) -> Tuple[List[str], Dict[str, float]]:
+        """Generate one continuation per prompt (order preserved) and return throughput stats."""
+        encoded = [self.encode(p) for p in prompts]
+        by_length: Dict[int, List[int]] = defaultdict(list)
+        for i, ids in enumerate(encoded):
+            by_length[len(ids)].append(i)
+
+        outputs: List[str] = [""] * len(prompts)
+        start = time.perf_counter()
+        with self._lock:
+            for indices in by_length.values():
+                for chunk_start in range(0, len(indices), batch_size):
+                    chunk = indices[chunk_start : chunk_start + batch_size]
+                    idx = torch.tensor([encoded[i] for i in chunk], dtype=torch.long, device=self.device)
+                    out = self._generate_batch(idx, max_new_tokens, temperature, top_k)
+                    for row, i in enumerate(chunk):
+                        outputs[i] = self.decode(out[row].tolist())
+        elapsed = time.perf_counter() - start
+        generated = len(prompts) * max_new_tokens
+        stats = {
+            "prompts": len(prompts),
+            "generated_tokens": generated,
+            "seconds": round(elapsed, 3),
+            "tokens_per_sec": round(generated / elapsed, 1) if elapsed > 0 else 0.0,
+        }
+        return outputs, stats
+
+
+def make_handler(sampler: Sampler):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format: str, *args: Any) -> None:  # noqa: A002  # pylint: disable=redefined-builtin
+            return
+
+        def _send_json(self, status: int, payload: Any) -> None:
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self) -> None:  # noqa: N802
+            if self.path != "/generate":
+                self._send_json(404, {"error": f"unknown path {self.path}"})
+                return
+            try:
+                req = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                prompts = [p for p in req["prompts"] for _ in range(int(req.get("num_samples", 1)))]
+                samples, stats = sampler.generate(
+                    prompts,
+                    max_new_tokens=int(req.get("max_new_tokens", 40)),
+                    temperature=float(req.get("temperature", 0.8)),
+                    top_k=req.get("top_k", 200),
+                )
+            except (KeyError, ValueError, TypeError) as exc:
+                self._send_json(400, {"error": str(exc)})
+                return
+            self._send_json(200, {"samples": samples, "stats": stats})
+
+    return Handler
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Bulk-generate text from the nanoGPT checkpoint.")
+    parser.add_argument("--ckpt", type=Path, default=CKPT_PATH, help="Checkpoint to load.")
+    parser.add_argument("--device", default="cpu", help="Torch device (cpu, mps, cuda).")
+    parser.add_argument("--start", action="append", help="Prompt text (repeatable).")
+    parser.add_argument("--prompts-file", type=Path, help="One prompt per line.")
+    parser.add_argument("--num-samples", type=int, default=1, help="Samples per prompt.")
+    parser.add_argument("--max-new-tokens", type=int, default=40, help="Tokens generated per sample.")
+    parser.add_argument("--temperature", type=float, default=0.8, help="Sampling temperature.")
+    parser.add_argument("--top-k", type=int, default=200, help="Top-k filter.")
+    parser.add_argument("--batch-size", type=int, default=64, help="Max prompts per forward pass.")
+    parser.add_argument("--seed", type=int, default=1337, help="Torch random seed.")
+    parser.add_argument("--output", type=Path, help="Write samples as JSONL instead of printing them.")
+    parser.add_argument("--serve", action="store_true", help="Serve POST /generate instead of running once.")
+    parser.add_argument("--port", type=int, default=8799, help="Port for --serve.")
+    args = parser.parse_args(argv)
+
+    sampler = Sampler(args.ckpt, args.device, args.seed)
+    if args.serve:
+        server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(sampler))
+        print(f">> nanoGPT sampler listening on http://127.0.0.1:{args.port}/generate", flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return
+
+    prompts = list(args.start or [])
+    if args.prompts_file:
+        prompts += [line.rstrip("\n") for line in args.prompts_file.open(encoding="utf-8") if line.strip()]
+    if not prompts:
+        prompts = ["\n"]
+    expanded = [p for p in prompts for _ in range(args.num_samples)]
+    samples, stats = sampler.generate(expanded, args.max_new_tokens, args.temperature, args.top_k, args.batch_size)
+
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        with args.output.open("w", encoding="utf-8") as fh:
+            for prompt, sample in zip(expanded, samples):
+                fh.write(json.dumps({"prompt": prompt, "sample": sample}) + "\n")
+        print(f"Saved {len(samples)} samples to {args.output}")
+    else:
+        for sample in samples:
+            print(sample)
+            print(SAMPLE_SEPARATOR)
+    print(
+        f"Generated {stats['generated_tokens']} tokens in {stats['seconds']}s "
+        f"({stats['tokens_per_sec']} tokens/sec)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Hyperparameter sweeps for the task5 nanoGPT fine-tune.
+
+A sweep spec (JSON or YAML) lists train.py arguments to vary:
+
+    {"name": "width", "mode": "grid", "fixed": {"max_iters": 300},
+     "params": {"n_embd": [64, 128], "n_layer": [2, 4]}}
+
+`mode: random` draws `samples` configurations instead; a parameter may then also be a
+range such as {"min": 1e-4, "max": 1e-2, "log": true}. Each configuration runs as its
+own training subprocess with a private out dir and log. Runs are scheduled onto
+disjoint slices of the available cores (OMP threads + CPU affinity), optionally
+under task5's early-stopping controller, and the finished logs are parsed with
+task5.parse_log into an overlaid learning-curve plot.
+"""
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import math
+import os
+import queue
+import random
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+import task5
+
+SWEEP_DIR = task5.NANOGPT_DIR / "out-sweep"
+REPORT_DIR = task5.PROJECT_ROOT / "outputs" / "nanogpt_sweep"
+
+
+def load_spec(path: Path) -> Dict[str, Any]:
+    text = path.read_text(encoding="utf-8")
+    if path.suffix in (".yaml", ".yml"):
+        import yaml
+
+        spec = yaml.safe_load(text)
+    else:
+        spec = json.loads(text)
+    if not isinstance(spec.get("params"), dict) or not spec["params"]:
+        raise ValueError(f"{path} must define a non-empty `params` mapping.")
+    spec.setdefault("name", path.stem)
+    spec.setdefault("mode", "grid")
+    spec.setdefault("fixed", {})
+    return spec
+
+
+def _draw(rng: random.Random, values: Any) -> Any:
+    if isinstance(values, list):
+        return rng.choice(values)
+    lo, hi = float(values["min"]), float(values["max"])
+    if values.get("log"):
+        value = math.exp(rng.uniform(math.log(lo), math.log(hi)))
+    else:
+        value = rng.uniform(lo, hi)
+    return int(round(value)) if values.get("int") else float(f"{value:.4g}")
+
+
+def expand_spec(spec: Dict[str, Any]) -> List[Dict[str, Any]]:
+    params: Dict[str, Any] = spec["params"]
+    if spec["mode"] == "grid":
+        if not all(isinstance(v, list) for v in params.values()):
+            raise ValueError("Grid sweeps need a list of values for every parameter.")
+        keys = list(params)
+        return [dict(zip(keys, combo)) for combo in itertools.product(*(params[k] for k in keys))]
+    if spec["mode"] == "random":
+        rng = random.Random(spec.get("seed", 0))
+        return [{k: _draw(rng, v) for k, v in params.items()} for _ in range(int(spec.get("samples", 8)))]
+    raise ValueError(f"Unknown sweep mode {spec['mode']!r}; use `grid` or `random`.")
+
+
+def run_name(idx: int, config: Dict[str, Any]) -> str:
+    parts = "_".join(f"{k}{v}" for k, v in config.items())
+    return f"run{idx:02d}_" + re.sub(r"[^A-Za-z0-9.\-_]+", "-", parts)
+
+
+def available_cores() -> List[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def core_slots(threads_per_run: int, max_parallel: Optional[int] = None) -> List[Set[int]]:
+    """Split the usable cores into disjoint slots of ``threads_per_run`` cores each."""
+    cores = available_cores()
+    count = max(1, len(cores) // threads_per_run)
+    if max_parallel:
+        count = min(count, max_parallel)
+    return [set(cores[i * threads_per_run : (i + 1) * threads_per_run]) or set(cores) for i in range(count)]
+
+
+def run_one(
+    name: str,
+    config: Dict[str, Any],
+    fixed: Dict[str, Any],
+    profile: Dict[str, object],
+    out_root: Path,
+    slots: "queue.Queue[Set[int]]",
+    early_stop: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    out_dir = out_root / name
+    overrides = {**fixed, **config, "out_dir": out_dir.relative_to(task5.NANOGPT_DIR)}
+    cmd = task5.build_train_cmd(profile, overrides)
+    log_path = out_dir / "training_log.txt"
+    parser = task5.LogParser()
+    controller = None
+    if early_stop is not None:
+        controller = task5.TrainingController(
+            out_dir, int(task5.cmd_arg(cmd, "--max_iters", "5000")), **early_stop
+        )
+
+    def on_line(line: str) -> bool:
+        record = parser.feed(line)
+        return controller.update(line, record) if controller is not None else False
+
+    cpus = slots.get()
+    try:
+        env = task5.profile_env({**profile, "threads": len(cpus)})
+        print(f">> [{name}] start on cores {sorted(cpus)}", flush=True)
+        start = time.perf_counter()
+        ret, peak_rss = task5.stream_process(cmd, log_path, on_line, env=env, echo=False, cpus=cpus)
+        wall = time.perf_counter() - start
+    finally:
+        slots.put(cpus)
+    print(f">> [{name}] finished with exit code {ret} in {wall:.1f}s", flush=True)
+    result: Dict[str, Any] = {
+        "name": name,
+        "params": config,
+        "exit_code": ret,
+        "wall_sec": round(wall, 2),
+        "peak_rss_mb": round(peak_rss / 2**20, 1),
+        "log": str(log_path),
+    }
+    if controller is not None:
+        result["early_stopping"] = controller.finish(parser.tokens_per_iter)
+        if controller.stop_reason:
+            result["exit_code"] = 0  # terminated by the controller, not a failure
+    return result
+
+
+def run_sweep(
+    spec: Dict[str, Any],
+    profile_name: str = "cpu",
+    threads_per_run: int = 2,
+    max_parallel: Optional[int] = None,
+    early_stop: Optional[Dict[str, Any]] = None,
+) -> List[Dict[str, Any]]:
+    configs = expand_spec(spec)
+    profile = task5.resolve_profile(profile_name)
+    out_root = SWEEP_DIR / spec["name"]
+    slot_list = core_slots(threads_per_run, max_parallel)
+    slots: "queue.Queue[Set[int]]" = queue.Queue()
+    for slot in slot_list:
+        slots.put(slot)
+    print(
+        f">> Sweep {spec['name']}: {len(configs)} runs, {len(slot_list)} in parallel "
+        f"x {threads_per_run} threads ({profile_name} profile)",
+        flush=True,
+    )
+    # Each worker only supervises a training subprocess, so threads are enough here.
+    with ThreadPoolExecutor(max_workers=len(slot_list)) as pool:
+        futures = [
+            pool.submit(run_one, run_name(i, c), c, spec["fixed"], profile, out_root, slots, early_stop)
+            for i, c in enumerate(configs, start=1)
+        ]
+        return [f.result() for f in futures]
+
+
+def summarize_sweep(spec: Dict[str, Any], runs: List[Dict[str, Any]]) -> None:
+    report_dir = REPORT_DIR / spec["name"]
+    curves = {}
+    for run in runs:
+        if run["exit_code"] != 0:
+            continue
+        try:
+            _, iter_records, eval_records = task5.parse_log(Path(run["log"]))
+        except ValueError as exc:
+            print(f"   ! Could not parse {run['log']}: {exc}")
+            continue
+        curves[run["name"]] = (iter_records, eval_records)
+        if eval_records:
+            run["final_val_loss"] = eval_records[-1].val_loss
+            run["best_val_loss"] = min(r.val_loss for r in eval_records)
+        if iter_records:
+            run["final_train_loss"] = iter_records[-1].train_loss
+
+    report_dir.mkdir(parents=True, exist_ok=True)
+    (report_dir / "sweep_summary.json").write_text(
+        json.dumps({"spec": spec, "runs": runs}, indent=2, default=str), encoding="utf-8"
+    )
+    if curves:
+        task5.make_comparison_plot(curves, report_dir / "learning_curves.png")
+
+    ranked = sorted(runs, key=lambda r: r.get("best_val_loss", float("inf")))
+    lines = [
+        f"# nanoGPT Sweep: {spec['name']}",
+        "",
+        "| Run | Params | Best val loss | Final val loss | Wall (s) | Peak RSS (MB) |",
+        "| --- | --- | ---:| ---:| ---:| ---:|",
+    ]
+    for run in ranked:
+        params = ", ".join(f"{k}={v}" for k, v in run["params"].items())
+        best = f"{run['best_val_loss']:.4f}" if "best_val_loss" in run else f"exit {run['exit_code']}"
+        final = f"{run['final_val_loss']:.4f}" if "final_val_loss" in run else "-"
+        lines.append(f"| {run['name']} | {params} | {best} | {final} | {run['wall_sec']} | {run['peak_rss_mb']} |")
+    (report_dir / "sweep_summary.md").write_text("\n".join(lines) + "\n", encoding="utf-8")
+    print("\n".join(lines))
+    print(f">> Sweep report written to {report_dir}")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Run a nanoGPT hyperparameter sweep on local cores.")
+    parser.add_argument("spec", type=Path, help="Sweep spec (JSON or YAML).")
+    parser.add_argument(
+        "--device-profile",
+        choices=sorted(task5.DEVICE_PROFILES),
+        default="cpu",
+        help="task5 device profile used for every run.",
+    )
+    parser.add_argument("--threads-per-run", type=int, default=2, help="Cores pinned to each training run.")
+    parser.add_argument("--max-parallel", type=int, help="Cap on concurrent runs (default: cores / threads).")
+    parser.add_argument(
+        "--early-stop",
+        action="store_true",
+        help="Stop each run on val-loss plateau/divergence (see task5 --early-stop).",
+    )
+    parser.add_argument("--patience", type=int, default=3, help="Evals without improvement before stopping.")
+    parser.add_argument("--keep-best", type=int, default=1, help="Eval checkpoints retained per run.")
+    args = parser.parse_args(argv)
+
+    spec = load_spec(args.spec)
+    early_stop = {"patience": args.patience, "keep_best": args.keep_best} if args.early_stop else None
+    runs = run_sweep(spec, args.device_profile, args.threads_per_run, args.max_parallel, early_stop)
+    summarize_sweep(spec, runs)
+
+
+if __name__ == "__main__":
+    main()
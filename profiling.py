@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+Profiling hooks for any entry point: cProfile, a stack sampler and time buckets.
+
+`span(bucket, name)` marks the call sites where a run usually spends its time. It is
+a no-op unless a profile is being recorded:
+  • network: model requests (`runcore.chat`, Ollama preload), Sophia token fetches;
+  • parse:   JSON extraction and repair, nanoGPT log parsing;
+  • render:  matplotlib plots;
+  • disk:    artifact writes, cache reads, gene store queries.
+`profile_run` wraps a whole run. It records the spans, runs cProfile on the calling
+thread, and samples the Python stacks of every thread at a fixed interval. It then
+writes the following to `outputs/profiles/<timestamp>-<name>/`:
+  • `top.txt`: the top-N functions by cumulative and by own time;
+  • `profile.pstats`: the raw cProfile data (for snakeviz, pstats, ...);
+  • `stacks.folded` and `flamegraph.svg`: wall-clock flame graph of the samples;
+  • `spans.json`: per-bucket wall time and time per span name.
+A bucket's wall time counts every second in which at least one of its spans was
+running, on any thread; `unattributed_sec` is the rest of the run.
+
+    python3 cli.py --profile genes --gene-count 20
+    python3 profiling.py task5 --plot-only
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+PROJECT_ROOT = Path(__file__).resolve().parent
+PROFILE_DIR = PROJECT_ROOT / "outputs" / "profiles"
+BUCKETS = ("network", "parse", "render", "disk")
+
+
+@dataclass
+class SpanEvent:
+    bucket: str
+    name: str
+    start: float
+    end: float
+    self_sec: float
+
+
+@dataclass
+class SpanRecorder:
+    events: List[SpanEvent] = field(default_factory=list)
+    _local: threading.local = field(default_factory=threading.local, repr=False)
+
+    def stack(self) -> List[List[float]]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def report(self, wall_sec: float) -> Dict[str, Any]:
+        by_name: Dict[Tuple[str, str], Dict[str, float]] = {}
+        for ev in self.events:
+            entry = by_name.setdefault((ev.bucket, ev.name), {"calls": 0, "total_sec": 0.0, "self_sec": 0.0})
+            entry["calls"] += 1
+            entry["total_sec"] += ev.end - ev.start
+            entry["self_sec"] += ev.self_sec
+        buckets = {}
+        for bucket in sorted({ev.bucket for ev in self.events}, key=_bucket_order):
+            intervals = [(ev.start, ev.end) for ev in self.events if ev.bucket == bucket]
+            buckets[bucket] = {
+                "wall_sec": round(_union_length(intervals), 3),
+                "busy_sec": round(sum(ev.self_sec for ev in self.events if ev.bucket == bucket), 3),
+            }
+        covered = _union_length([(ev.start, ev.end) for ev in self.events])
+        return {
+            "wall_sec": round(wall_sec, 3),
+            "buckets": buckets,
+            "unattributed_sec": round(max(0.0, wall_sec - covered), 3),
+            "spans": [
+                {"bucket": bucket, "name": name, **{k: round(v, 4) for k, v in entry.items()}}
+                for (bucket, name), entry in sorted(by_name.items(), key=lambda item: -item[1]["total_sec"])
+            ],
+        }
+
+
+_RECORDER: Optional[SpanRecorder] = None
+
+
+@contextmanager
+def span(bucket: str, name: str) -> Iterator[None]:
+    """Attribute the enclosed block to ``bucket`` while a profile is recorded.
+
+    Nested spans are subtracted from their parent's own (``self``) time.
+    """
+    recorder = _RECORDER
+    if recorder is None:
+        yield
+        return
+    stack = recorder.stack()
+    children = [0.0]
+    stack.append(children)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        stack.pop()
+        if stack:
+            stack[-1][0] += end - start
+        recorder.events.append(SpanEvent(bucket, name, start, end, end - start - children[0]))
+
+
+def _bucket_order(bucket: str) -> Tuple[int, str]:
+    return (BUCKETS.index(bucket) if bucket in BUCKETS else len(BUCKETS), bucket)
+
+
+def _union_length(intervals: List[Tuple[float, float]]) -> float:
+    total = 0.0
+    current_start = current_end = None
+    for start, end in sorted(intervals):
+        if current_end is None or start > current_end:
+            if current_end is not None:
+                total += current_end - current_start
+            current_start, current_end = start, end
+        else:
+            current_end = max(current_end, end)
+    if current_end is not None:
+        total += current_end - current_start
+    return total
+
+
+class StackSampler(threading.Thread):
+    """Counts the folded Python stack of every thread every ``interval`` seconds."""
+
+    def __init__(self, interval: float = 0.005) -> None:
+        super().__init__(name="profiling-sampler", daemon=True)
+        self.interval = interval
+        self.counts: Dict[str, int] = {}
+        self.samples = 0
+        self._stop_event = threading.Event()
+        self._labels: Dict[Any, str] = {}
+
+    def _label(self, code: Any) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ",")
+            self._labels[code] = label
+        return label
+
+    def run(self) -> None:
+        me = threading.get_ident()
+        main = threading.main_thread().ident
+        while not self._stop_event.wait(self.interval):
+            names = {t.ident: re.sub(r"_\d+$", "", t.name) for t in threading.enumerate()}
+            self.samples += 1
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                if ident != main and _idle(labels):
+                    continue
+                stack = ";".join([names.get(ident, "thread"), *reversed(labels)])
+                self.counts[stack] = self.counts.get(stack, 0) + 1
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join()
+
+
+def _idle(labels: List[str]) -> bool:
+    """A worker thread waiting for work (leaf-first labels): idle pool worker or queue consumer."""
+    return bool(labels) and (
+        labels[0].startswith("_worker (thread.py") or any(label.startswith("get (queue.py") for label in labels[:3])
+    )
+
+
+def folded(counts: Dict[str, int]) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(counts.items()))
+
+
+def flamegraph_svg(counts: Dict[str, int], title: str, width: int = 1200, row: int = 16) -> str:
+    """Render folded stack counts as a static SVG flame graph (root at the bottom)."""
+    import html
+    import zlib
+
+    root: Dict[str, Any] = {"count": 0, "children": {}}
+    depth = 0
+    for stack, count in counts.items():
+        frames = stack.split(";")
+        depth = max(depth, len(frames))
+        node = root
+        node["count"] += count
+        for frame in frames:
+            node = node["children"].setdefault(frame, {"count": 0, "children": {}})
+            node["count"] += count
+    total = root["count"] or 1
+    top = 40
+    height = top + (depth + 1) * row + 10
+    scale = (width - 20) / total
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" font-family="monospace" '
+        f'font-size="11">',
+        '<rect width="100%" height="100%" fill="#fdfdf6"/>',
+        f'<text x="{width / 2}" y="20" text-anchor="middle" font-size="15">{html.escape(title)}</text>',
+        f'<text x="10" y="34" fill="#555">{total} samples; width = share of samples (hover for details)</text>',
+    ]
+    pending = [(name, node, 10.0, 0) for name, node in sorted(root["children"].items())]
+    while pending:
+        name, node, x, level = pending.pop()
+        w = node["count"] * scale
+        if w >= 0.3:
+            y = height - 10 - (level + 1) * row
+            h = zlib.crc32(name.encode("utf-8"))
+            color = f"rgb({205 + h % 50},{(h >> 8) % 230},{(h >> 16) % 55})"
+            label = html.escape(name)
+            pct = 100.0 * node["count"] / total
+            parts.append(
+                f'<g><title>{label} ({node["count"]} samples, {pct:.1f}%)</title>'
+                f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{row - 1}" fill="{color}" rx="2"/>'
+            )
+            chars = int((w - 6) / 6.6)
+            if chars >= 3:
+                text = name if len(name) <= chars else name[: chars - 2] + ".."
+                parts.append(f'<text x="{x + 3:.1f}" y="{y + row - 4}">{html.escape(text)}</text>')
+            parts.append("</g>")
+            child_x = x
+            for child_name, child in sorted(node["children"].items()):
+                pending.append((child_name, child, child_x, level + 1))
+                child_x += child["count"] * scale
+    parts.append("</svg>")
+    return "\n".join(parts) + "\n"
+
+
+def _top_table(profiler: Any, top: int) -> str:
+    import io
+    import pstats
+
+    out = io.StringIO()
+    out.write("cProfile of the thread that started the run (worker threads appear in the flame graph).\n")
+    for order in ("cumulative", "tottime"):
+        out.write(f"\n==== top {top} by {order} ====\n")
+        pstats.Stats(profiler, stream=out).sort_stats(order).print_stats(top)
+    return out.getvalue()
+
+
+def format_buckets(report: Dict[str, Any]) -> List[str]:
+    wall = report["wall_sec"] or 1.0
+    lines = [f"   {'bucket':<14}{'wall s':>9}{'share':>8}{'busy s':>9}"]
+    for bucket, stats in report["buckets"].items():
+        lines.append(f"   {bucket:<14}{stats['wall_sec']:>9.3f}{stats['wall_sec'] / wall:>8.1%}{stats['busy_sec']:>9.3f}")
+    lines.append(f"   {'unattributed':<14}{report['unattributed_sec']:>9.3f}{report['unattributed_sec'] / wall:>8.1%}")
+    return lines
+
+
+@contextmanager
+def profile_run(
+    name: str, output_dir: Optional[Path] = None, top: int = 30, interval: float = 0.005
+) -> Iterator[Path]:
+    """Profile the enclosed run and write its profile files, even if the run fails or exits."""
+    import cProfile
+
+    global _RECORDER
+    output_dir = output_dir or PROFILE_DIR / f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{name}"
+    recorder = SpanRecorder()
+    sampler = StackSampler(interval)
+    profiler = cProfile.Profile()
+    _RECORDER = recorder
+    sampler.start()
+    start = time.perf_counter()
+    profiler.enable()
+    try:
+        yield output_dir
+    finally:
+        profiler.disable()
+        wall = time.perf_counter() - start
+        sampler.stop()
+        _RECORDER = None
+        report = recorder.report(wall)
+        report.update({"name": name, "samples": sampler.samples, "sample_interval_sec": interval})
+        output_dir.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(str(output_dir / "profile.pstats"))
+        (output_dir / "top.txt").write_text(_top_table(profiler, top), encoding="utf-8")
+        (output_dir / "stacks.folded").write_text(folded(sampler.counts), encoding="utf-8")
+        (output_dir / "flamegraph.svg").write_text(
+            flamegraph_svg(sampler.counts, f"{name}: {wall:.2f}s wall"), encoding="utf-8"
+        )
+        (output_dir / "spans.json").write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f">> Profile ({wall:.2f}s wall, {sampler.samples} stack samples):")
+        for line in format_buckets(report):
+            print(line)
+        print(f">> Profile written to {output_dir} (top.txt, flamegraph.svg, spans.json)")
+
+
+def resolve_entry_point(target: str) -> Tuple[str, Any]:
+    """A `cli.py` command name, module name or script path -> (name, module with main())."""
+    import importlib
+
+    from cli import COMMANDS
+
+    module_name = COMMANDS[target][0] if target in COMMANDS else Path(target).stem
+    return target if target in COMMANDS else module_name, importlib.import_module(module_name)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Run any entry point under the profiler (flame graph, top-N table, time buckets)."
+    )
+    parser.add_argument("--top", type=int, default=30, help="Rows in each top-N table.")
+    parser.add_argument("--interval", type=float, default=5.0, help="Stack sampling interval in milliseconds.")
+    parser.add_argument("--output-dir", type=Path, help="Default: outputs/profiles/<timestamp>-<target>.")
+    parser.add_argument("target", help="cli.py command (genes, nanogpt, ...), module or script (task3.py).")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help="Options passed to the entry point.")
+    args = parser.parse_args(argv)
+
+    name, module = resolve_entry_point(args.target)
+    with profile_run(name, args.output_dir, args.top, args.interval / 1000):
+        module.main(args.args)
+
+
+if __name__ == "__main__":
+    # Go through the importable module: the profiled code's `span` calls look at its recorder.
+    import profiling
+
+    profiling.main()
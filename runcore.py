@@ -0,0 +1,720 @@
+"""
+Shared run-orchestration core used by the task scripts and `cli.py`.
+
+  • backend registry: `chat("sophia" | "ollama", model, messages, ...)` hides the client
+    library behind one call and returns a `ChatResult` with latency and token usage;
+  • client pool: one long-lived client per backend (token fetched once, connections reused);
+  • retries with linear backoff on transient errors, and an optional on-disk cache of
+    deterministic (temperature 0) completions;
+  • run manifest, per-call metrics and an output writer, so every workflow records what
+    it ran, what each model call cost and which files it produced. Artifact writes go
+    through a background writer (`artifact_writer`) so request loops never wait on disk.
+
+Settings are process-wide: the task scripts use the defaults, `cli.py` sets them once
+(`configure`) for whichever subcommand it runs. Heavy client libraries are imported
+only when a backend is first used.
+"""
+from __future__ import annotations
+
+import contextvars
+import hashlib
+import json
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple, Type
+
+import artifact_writer
+import profiling
+
+PROJECT_ROOT = Path(__file__).resolve().parent
+MODEL_CONFIG = PROJECT_ROOT / "model_servers.yaml"
+RUNS_DIR = PROJECT_ROOT / "outputs" / "runs"
+SOPHIA_DEFAULT_URL = "https://inference-api.alcf.anl.gov/resource_server/sophia/vllm/v1"
+OLLAMA_DEFAULT_URL = "http://localhost:11434"
+
+
+@dataclass
+class Settings:
+    retries: int = 2
+    backoff_sec: float = 1.5
+    concurrency: int = 4
+    timeout: Optional[float] = None  # overrides every per-call timeout when set
+    cache_dir: Optional[Path] = None
+    sophia_base_url: Optional[str] = None  # default: openai_api_base from model_servers.yaml
+    ollama_base_url: str = OLLAMA_DEFAULT_URL
+    background_writes: bool = True  # False: write artifacts synchronously on the caller's thread
+
+
+SETTINGS = Settings()
+
+
+def configure(**overrides: Any) -> Settings:
+    for key, value in overrides.items():
+        if not hasattr(SETTINGS, key):
+            raise TypeError(f"Unknown runcore setting {key!r}")
+        if value is not None:
+            setattr(SETTINGS, key, value)
+    return SETTINGS
+
+
+def sophia_base_url() -> str:
+    if SETTINGS.sophia_base_url:
+        return SETTINGS.sophia_base_url
+    if MODEL_CONFIG.exists():
+        import yaml
+
+        data = yaml.safe_load(MODEL_CONFIG.read_text(encoding="utf-8")) or {}
+        if data.get("openai_api_base"):
+            SETTINGS.sophia_base_url = str(data["openai_api_base"])
+            return SETTINGS.sophia_base_url
+    return SOPHIA_DEFAULT_URL
+
+
+@dataclass
+class ChatResult:
+    text: str
+    model: str
+    backend: str
+    latency_sec: float = 0.0
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    finish_reason: Optional[str] = None
+    attempts: int = 1
+    cached: bool = False
+    choices: List[str] = field(default_factory=list)  # every returned choice when n > 1
+    finish_reasons: List[Optional[str]] = field(default_factory=list)  # per choice, parallel to `choices`
+    server_timings: Optional[Dict[str, float]] = None  # backend-reported phases, seconds
+
+
+# --------------------------------------------------------------------------- backends
+
+
+class Backend:
+    """One model-serving API. Subclasses create a client and perform a single chat call."""
+
+    name = ""
+    supports_n = False  # can return several samples for one request (OpenAI `n`)
+
+    def create_client(self) -> Any:
+        raise NotImplementedError
+
+    def complete(
+        self, client: Any, model: str, messages: List[Dict[str, str]], timeout: float, options: Dict[str, Any]
+    ) -> ChatResult:
+        raise NotImplementedError
+
+    def is_transient(self, exc: Exception) -> bool:
+        return False
+
+    def is_rejected_request(self, exc: Exception) -> bool:
+        """True when the server refused the request itself (400/422), e.g. an unsupported parameter."""
+        return False
+
+    def base_url(self) -> str:
+        return ""
+
+
+BACKENDS: Dict[str, Type[Backend]] = {}
+_INSTANCES: Dict[str, Backend] = {}
+
+
+def register_backend(name: str) -> Callable[[Type[Backend]], Type[Backend]]:
+    def decorator(cls: Type[Backend]) -> Type[Backend]:
+        cls.name = name
+        BACKENDS[name] = cls
+        return cls
+
+    return decorator
+
+
+def get_backend(name: str) -> Backend:
+    if name not in _INSTANCES:
+        if name not in BACKENDS:
+            raise ValueError(f"Unknown backend {name!r}; registered: {sorted(BACKENDS)}")
+        _INSTANCES[name] = BACKENDS[name]()
+    return _INSTANCES[name]
+
+
+@register_backend("sophia")
+class SophiaBackend(Backend):
+    """Sophia's OpenAI-compatible vLLM endpoint, authenticated with a Globus access token."""
+
+    supports_n = True
+
+    def base_url(self) -> str:
+        return sophia_base_url()
+
+    def create_client(self) -> Any:
+        from openai import OpenAI
+
+        from sophia_auth import get_access_token
+
+        # Retries are handled by `chat` so they are counted and configured in one place.
+        return OpenAI(api_key=get_access_token(), base_url=self.base_url(), max_retries=0)
+
+    def complete(
+        self, client: Any, model: str, messages: List[Dict[str, str]], timeout: float, options: Dict[str, Any]
+    ) -> ChatResult:
+        response = client.with_options(timeout=timeout).chat.completions.create(
+            model=model, messages=messages, **options
+        )
+        choice = response.choices[0]
+        usage = getattr(response, "usage", None)
+        return ChatResult(
+            text=(choice.message.content or "").strip(),
+            model=model,
+            backend=self.name,
+            prompt_tokens=getattr(usage, "prompt_tokens", None),
+            completion_tokens=getattr(usage, "completion_tokens", None),
+            finish_reason=choice.finish_reason,
+            choices=[(c.message.content or "").strip() for c in response.choices],
+            finish_reasons=[c.finish_reason for c in response.choices],
+        )
+
+    def is_transient(self, exc: Exception) -> bool:
+        from openai import APIConnectionError, APITimeoutError, AuthenticationError, InternalServerError
+
+        if isinstance(exc, AuthenticationError):
+            # Expired token: drop the pooled client so the retry fetches a fresh one.
+            POOL.discard(self.name)
+            return True
+        return isinstance(exc, (APITimeoutError, APIConnectionError, InternalServerError))
+
+    def is_rejected_request(self, exc: Exception) -> bool:
+        from openai import BadRequestError, UnprocessableEntityError
+
+        return isinstance(exc, (BadRequestError, UnprocessableEntityError))
+
+
+@register_backend("ollama")
+class OllamaBackend(Backend):
+    """Local Ollama server (`/api/chat`) over one keep-alive `requests.Session`.
+
+    Generic options are mapped onto Ollama's request: `keep_alive`/`format` stay top-level,
+    everything else (num_thread, num_ctx, temperature, max_tokens -> num_predict) goes
+    into `options`. Ollama reports its phase durations in nanoseconds; they are returned
+    in seconds as `server_timings` (load, prompt_eval, eval, total).
+    """
+
+    TOP_LEVEL = {"format", "keep_alive", "options", "tools"}
+    RENAMED = {"max_tokens": "num_predict"}
+    TIMINGS = {"load_duration": "load", "prompt_eval_duration": "prompt_eval", "eval_duration": "eval",
+               "total_duration": "total"}
+
+    def base_url(self) -> str:
+        return SETTINGS.ollama_base_url.rstrip("/")
+
+    def create_client(self) -> Any:
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        session.mount("http://", HTTPAdapter(pool_maxsize=max(8, ollama_parallel_slots())))
+        return session
+
+    def build_payload(self, model: str, options: Dict[str, Any]) -> Dict[str, Any]:
+        payload: Dict[str, Any] = {"model": model, "stream": False}
+        model_options = dict(options.get("options") or {})
+        for key, value in options.items():
+            if value is None:
+                continue
+            if key in self.TOP_LEVEL:
+                if key != "options":
+                    payload[key] = value
+            else:
+                model_options[self.RENAMED.get(key, key)] = value
+        if model_options:
+            payload["options"] = model_options
+        return payload
+
+    @classmethod
+    def timings(cls, data: Dict[str, Any]) -> Dict[str, float]:
+        return {name: data[key] / 1e9 for key, name in cls.TIMINGS.items() if isinstance(data.get(key), (int, float))}
+
+    def preload(self, model: str, timeout: float = 600, **options: Any) -> Dict[str, float]:
+        """Load ``model`` into memory (an empty generate request) and return wall and load seconds."""
+        client = POOL.get(self)
+        start = time.perf_counter()
+        with profiling.span("network", "ollama.preload"):
+            response = client.post(
+                f"{self.base_url()}/api/generate", json=self.build_payload(model, options), timeout=timeout
+            )
+        response.raise_for_status()
+        return {"wall": time.perf_counter() - start, **self.timings(response.json())}
+
+    def complete(
+        self, client: Any, model: str, messages: List[Dict[str, str]], timeout: float, options: Dict[str, Any]
+    ) -> ChatResult:
+        payload = self.build_payload(model, options)
+        payload["messages"] = messages
+        response = client.post(f"{self.base_url()}/api/chat", json=payload, timeout=timeout)
+        response.raise_for_status()
+        data = response.json()
+        if "message" in data and "content" in data["message"]:
+            text = data["message"]["content"]
+        elif "response" in data:
+            text = data["response"]
+        else:
+            raise ValueError(f"Unexpected Ollama response payload: {json.dumps(data)[:200]}")
+        return ChatResult(
+            text=text.strip(),
+            model=model,
+            backend=self.name,
+            prompt_tokens=data.get("prompt_eval_count"),
+            completion_tokens=data.get("eval_count"),
+            finish_reason=data.get("done_reason"),
+            server_timings=self.timings(data) or None,
+        )
+
+    def is_transient(self, exc: Exception) -> bool:
+        import requests
+
+        if isinstance(exc, requests.HTTPError):
+            return exc.response is not None and exc.response.status_code >= 500
+        return isinstance(exc, (requests.ConnectionError, requests.Timeout))
+
+
+def ollama_parallel_slots() -> int:
+    """Requests the Ollama server runs concurrently per model (its OLLAMA_NUM_PARALLEL)."""
+    try:
+        return max(1, int(os.environ.get("OLLAMA_NUM_PARALLEL", "1")))
+    except ValueError:
+        return 1
+
+
+class ClientPool:
+    """Lazily created, shared clients keyed by backend name (thread-safe)."""
+
+    def __init__(self) -> None:
+        self._clients: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def get(self, backend: Backend) -> Any:
+        with self._lock:
+            if backend.name not in self._clients:
+                self._clients[backend.name] = backend.create_client()
+            return self._clients[backend.name]
+
+    def discard(self, name: str) -> None:
+        with self._lock:
+            self._clients.pop(name, None)
+
+
+POOL = ClientPool()
+
+
+# --------------------------------------------------------------------------- metrics
+
+
+def add_timings(total: Dict[str, float], timings: Optional[Dict[str, float]]) -> Dict[str, float]:
+    for name, seconds in (timings or {}).items():
+        total[name] = round(total.get(name, 0.0) + seconds, 6)
+    return total
+
+
+class RunMetrics:
+    """Per backend/model call counts, retries, cache hits, latency and token totals."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._models: Dict[str, Dict[str, Any]] = {}
+        self.events_path: Optional[Path] = None
+
+    def reset(self, events_path: Optional[Path] = None) -> None:
+        with self._lock:
+            self._models = {}
+            self.events_path = events_path
+
+    def record(self, backend: str, model: str, result: Optional[ChatResult], error: Optional[str] = None) -> None:
+        event: Dict[str, Any] = {"ts": time.time(), "backend": backend, "model": model}
+        if result is not None:
+            event.update({k: v for k, v in asdict(result).items() if k not in ("text", "choices", "finish_reasons", "backend", "model")})
+        if error is not None:
+            event["error"] = error
+        with self._lock:
+            entry = self._models.setdefault(
+                f"{backend}:{model}",
+                {"calls": 0, "errors": 0, "retries": 0, "cache_hits": 0, "latencies": [],
+                 "prompt_tokens": 0, "completion_tokens": 0, "server_sec": {}},
+            )
+            entry["calls"] += 1
+            if error is not None:
+                entry["errors"] += 1
+            elif result is not None:
+                entry["retries"] += result.attempts - 1
+                entry["cache_hits"] += int(result.cached)
+                if not result.cached:
+                    entry["latencies"].append(result.latency_sec)
+                entry["prompt_tokens"] += result.prompt_tokens or 0
+                entry["completion_tokens"] += result.completion_tokens or 0
+                if not result.cached:
+                    add_timings(entry["server_sec"], result.server_timings)
+            if self.events_path is not None:
+                WRITER.append_text(self.events_path, json.dumps(event) + "\n", register=False)
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = {}
+            for key, entry in self._models.items():
+                lat = sorted(entry["latencies"])
+                out[key] = {
+                    **{k: v for k, v in entry.items() if k != "latencies"},
+                    "latency_sec": {
+                        "total": round(sum(lat), 3),
+                        "mean": round(sum(lat) / len(lat), 3),
+                        "p95": round(lat[min(len(lat) - 1, int(len(lat) * 0.95))], 3),
+                    }
+                    if lat
+                    else None,
+                }
+            return out
+
+
+METRICS = RunMetrics()
+
+
+@dataclass
+class Usage:
+    """Requests and tokens spent inside one `track_usage` scope, per model (thread-safe)."""
+
+    requests: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    latency_sec: float = 0.0
+    by_model: Dict[str, Dict[str, int]] = field(default_factory=dict)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    @property
+    def tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def add(self, result: ChatResult) -> None:
+        with self._lock:
+            self.requests += 1
+            self.prompt_tokens += result.prompt_tokens or 0
+            self.completion_tokens += result.completion_tokens or 0
+            self.latency_sec += result.latency_sec
+            entry = self.by_model.setdefault(
+                f"{result.backend}:{result.model}", {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0}
+            )
+            entry["requests"] += 1
+            entry["prompt_tokens"] += result.prompt_tokens or 0
+            entry["completion_tokens"] += result.completion_tokens or 0
+
+
+_USAGE: contextvars.ContextVar[Optional[Usage]] = contextvars.ContextVar("runcore_usage", default=None)
+
+
+@contextmanager
+def track_usage() -> Iterator[Usage]:
+    """Attribute every non-cached `chat` call made inside the block (and its `sample` workers) to one `Usage`."""
+    usage = Usage()
+    token = _USAGE.set(usage)
+    try:
+        yield usage
+    finally:
+        _USAGE.reset(token)
+
+
+# --------------------------------------------------------------------------- chat
+
+
+def _cache_path(backend: Backend, model: str, messages: List[Dict[str, str]], options: Dict[str, Any]) -> Path:
+    assert SETTINGS.cache_dir is not None
+    canonical = json.dumps(
+        {"backend": backend.name, "url": backend.base_url(), "model": model, "messages": messages, "options": options},
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    key = hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+    return Path(SETTINGS.cache_dir) / key[:2] / f"{key}.json"
+
+
+def chat(
+    backend: str,
+    model: str,
+    messages: List[Dict[str, str]],
+    timeout: float = 60,
+    retries: Optional[int] = None,
+    on_retry: Optional[Callable[[int, Exception], None]] = None,
+    **options: Any,
+) -> ChatResult:
+    """Run one chat completion through ``backend`` with pooling, retries, caching and metrics.
+
+    ``options`` are passed to the backend (temperature, max_tokens, format, ...).
+    Transient failures are retried ``retries`` times (default: ``SETTINGS.retries``);
+    ``on_retry(attempt, exc)`` is called before each retry.
+    """
+    impl = get_backend(backend)
+    timeout = SETTINGS.timeout or timeout
+    retries = SETTINGS.retries if retries is None else retries
+
+    cache_path = None
+    if SETTINGS.cache_dir is not None and options.get("temperature") == 0:
+        cache_path = _cache_path(impl, model, messages, options)
+        if cache_path.exists():
+            with profiling.span("disk", "runcore.cache_read"):
+                result = ChatResult(**json.loads(cache_path.read_text(encoding="utf-8")))
+            result.cached = True
+            METRICS.record(backend, model, result)
+            return result
+
+    for attempt in range(retries + 1):
+        try:
+            client = POOL.get(impl)  # created outside the timer so latency is the request alone
+            start = time.perf_counter()
+            with profiling.span("network", f"{backend}.complete"):
+                result = impl.complete(client, model, messages, timeout, options)
+        except Exception as exc:  # noqa: BLE001
+            transient = impl.is_transient(exc)
+            if attempt >= retries or not transient:
+                METRICS.record(backend, model, None, error=f"{type(exc).__name__}: {exc}")
+                if transient:
+                    raise RuntimeError(f"Model {model} failed after {retries + 1} attempts: {exc}") from exc
+                raise
+            if on_retry is not None:
+                on_retry(attempt, exc)
+            time.sleep(SETTINGS.backoff_sec * (attempt + 1))
+            continue
+        result.latency_sec = time.perf_counter() - start
+        result.attempts = attempt + 1
+        METRICS.record(backend, model, result)
+        usage = _USAGE.get()
+        if usage is not None:
+            usage.add(result)
+        if cache_path is not None:
+            WRITER.write_json(cache_path, asdict(result), indent=None, register=False)
+        return result
+    raise RuntimeError(f"Model {model} did not return after retries.")
+
+
+@dataclass
+class SampleSet:
+    texts: List[str]
+    mode: str  # "n": one request with n choices, "parallel": concurrent single requests
+    requests: int
+    latency_sec: float
+    request_latencies: List[float]
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    server_timings: Dict[str, float] = field(default_factory=dict)
+    finish_reasons: List[Optional[str]] = field(default_factory=list)  # parallel to `texts`
+
+    def single_sample_tokens(self) -> Optional[float]:
+        """Estimated tokens one k=1 request would have cost (prompt once + one completion)."""
+        if self.prompt_tokens is None or self.completion_tokens is None or not self.texts:
+            return None
+        return self.prompt_tokens / self.requests + self.completion_tokens / len(self.texts)
+
+
+_N_UNSUPPORTED: Set[Tuple[str, str]] = set()
+
+
+def sample(
+    backend: str, model: str, messages: List[Dict[str, str]], k: int, timeout: float = 60, **options: Any
+) -> SampleSet:
+    """Draw ``k`` completions for the same messages.
+
+    Backends that support it get a single request with ``n=k``; otherwise, or once a
+    model has rejected ``n`` with a 400/422, the samples are drawn as concurrent requests (at most
+    ``SETTINGS.concurrency`` at a time).
+    """
+    impl = get_backend(backend)
+    POOL.get(impl)
+    start = time.perf_counter()
+    results: List[ChatResult] = []
+    texts: List[str] = []
+    reasons: List[Optional[str]] = []
+    if k > 1 and impl.supports_n and (backend, model) not in _N_UNSUPPORTED:
+        try:
+            result = chat(backend, model, messages, timeout, n=k, **options)
+        except Exception as exc:  # noqa: BLE001
+            # Only a refusal of the request marks `n` unsupported; timeouts, auth and 5xx
+            # errors have already been retried by `chat` and are real failures.
+            if not impl.is_rejected_request(exc):
+                raise
+            _N_UNSUPPORTED.add((backend, model))
+            print(f"   ! {model} rejected n={k} ({exc}); falling back to concurrent requests", flush=True)
+        else:
+            results.append(result)
+            texts.extend(result.choices[:k] or [result.text])
+            reasons.extend(result.finish_reasons[:k] or [result.finish_reason])
+    mode = "n" if texts else "parallel"
+    missing = k - len(texts)
+    if missing > 0:
+        with ThreadPoolExecutor(max_workers=max(1, min(missing, SETTINGS.concurrency))) as pool:
+            # Each worker runs in a copy of this context so `track_usage` scopes see its calls.
+            futures = [
+                pool.submit(contextvars.copy_context().run, chat, backend, model, messages, timeout, **options)
+                for _ in range(missing)
+            ]
+            for future in futures:
+                result = future.result()
+                results.append(result)
+                texts.append(result.text)
+                reasons.append(result.finish_reason)
+    tokens_known = all(r.prompt_tokens is not None and r.completion_tokens is not None for r in results)
+    server_timings: Dict[str, float] = {}
+    for result in results:
+        add_timings(server_timings, result.server_timings)
+    return SampleSet(
+        texts=texts,
+        mode=mode,
+        requests=len(results),
+        latency_sec=time.perf_counter() - start,
+        request_latencies=[r.latency_sec for r in results],
+        prompt_tokens=sum(r.prompt_tokens or 0 for r in results) if tokens_known else None,
+        completion_tokens=sum(r.completion_tokens or 0 for r in results) if tokens_known else None,
+        server_timings=server_timings,
+        finish_reasons=reasons,
+    )
+
+
+# --------------------------------------------------------------------------- outputs + manifest
+
+
+class OutputWriter:
+    """Writes run artifacts and remembers every path so the manifest can list them.
+
+    With ``SETTINGS.background_writes`` (the default) writes are queued on an
+    `artifact_writer.ArtifactWriter` and the call returns immediately; otherwise they
+    happen on the caller's thread. Either way whole-file writes are atomic
+    (temp file + rename). ``flush`` waits for queued writes and raises write errors.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.paths: List[Path] = []
+        self._background: Optional[artifact_writer.ArtifactWriter] = None
+
+    def register(self, path: Path) -> Path:
+        with self._lock:
+            if path not in self.paths:
+                self.paths.append(path)
+        return path
+
+    def background(self) -> Optional[artifact_writer.ArtifactWriter]:
+        if not SETTINGS.background_writes:
+            return None
+        with self._lock:
+            if self._background is None:
+                self._background = artifact_writer.ArtifactWriter()
+                artifact_writer.install_exit_handlers(self._background)
+            return self._background
+
+    def write_text(self, path: Path, text: str, register: bool = True) -> Path:
+        writer = self.background()
+        if writer is not None:
+            writer.write_text(path, text)
+        else:
+            artifact_writer.atomic_write_text(path, text)
+        return self.register(path) if register else path
+
+    def write_json(self, path: Path, payload: Any, indent: Optional[int] = 2, register: bool = True) -> Path:
+        """Write ``payload`` as JSON; in background mode it is serialized later, so do not mutate it."""
+        writer = self.background()
+        if writer is not None:
+            writer.write_json(path, payload, indent)
+        else:
+            artifact_writer.atomic_write_text(path, json.dumps(payload, indent=indent))
+        return self.register(path) if register else path
+
+    def append_text(self, path: Path, text: str, register: bool = True) -> Path:
+        writer = self.background()
+        if writer is not None:
+            writer.append_text(path, text)
+        else:
+            artifact_writer.append_text(path, text)
+        return self.register(path) if register else path
+
+    def flush(self) -> None:
+        if self._background is not None:
+            self._background.flush()
+
+
+WRITER = OutputWriter()
+write_text = WRITER.write_text
+write_json = WRITER.write_json
+append_text = WRITER.append_text
+flush_outputs = WRITER.flush
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        proc = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=PROJECT_ROOT, capture_output=True, text=True, check=False, timeout=5
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return proc.stdout.strip() or None
+
+
+def _display_path(path: Path) -> str:
+    try:
+        return str(path.resolve().relative_to(PROJECT_ROOT))
+    except ValueError:
+        return str(path)
+
+
+@dataclass
+class RunManifest:
+    command: str
+    argv: List[str]
+    started_at: str
+    settings: Dict[str, Any]
+    git_commit: Optional[str] = None
+    finished_at: Optional[str] = None
+    status: str = "running"
+    wall_sec: Optional[float] = None
+    outputs: List[str] = field(default_factory=list)
+    model_calls: Dict[str, Any] = field(default_factory=dict)
+
+
+@contextmanager
+def start_run(command: str, argv: List[str], runs_dir: Path = RUNS_DIR) -> Iterator[RunManifest]:
+    """Record one workflow run in ``runs_dir/<timestamp>-<command>/`` (manifest.json + calls.jsonl)."""
+    started = datetime.now(timezone.utc)
+    run_dir = runs_dir / f"{started.strftime('%Y%m%d-%H%M%S')}-{command}"
+    run_dir.mkdir(parents=True, exist_ok=True)
+    WRITER.background()  # start the writer here so its SIGTERM handler is installed on the main thread
+    METRICS.reset(events_path=run_dir / "calls.jsonl")
+    manifest = RunManifest(
+        command=command,
+        argv=list(argv),
+        started_at=started.isoformat(timespec="seconds"),
+        settings={k: str(v) if isinstance(v, Path) else v for k, v in asdict(SETTINGS).items()},
+        git_commit=_git_commit(),
+    )
+    t0 = time.perf_counter()
+    try:
+        yield manifest
+        manifest.status = "ok"
+    except KeyboardInterrupt:
+        manifest.status = "interrupted"
+        raise
+    except SystemExit as exc:
+        manifest.status = "ok" if exc.code in (None, 0) else f"exit {exc.code}"
+        raise
+    except BaseException:
+        manifest.status = "failed"
+        raise
+    finally:
+        try:
+            WRITER.flush()
+        except RuntimeError as exc:
+            print(f"   ! {exc}")
+            if manifest.status == "ok":
+                manifest.status = "failed"
+        manifest.finished_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        manifest.wall_sec = round(time.perf_counter() - t0, 3)
+        manifest.outputs = [_display_path(p) for p in WRITER.paths]
+        manifest.model_calls = METRICS.summary()
+        artifact_writer.atomic_write_text(run_dir / "manifest.json", json.dumps(asdict(manifest), indent=2))
+        print(f">> Run manifest written to {run_dir / 'manifest.json'}")
@@ -0,0 +1,24 @@
+"""
+Lazy access to the Sophia `inference_auth_token` helper.
+
+Sophia-tools lives next to this repo and pulls in the Globus SDK, so it is only put on
+`sys.path` and imported the first time a token is actually needed.
+"""
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+import profiling
+
+PROJECT_ROOT = Path(__file__).resolve().parent
+SOPHIA_TOOLS = PROJECT_ROOT.parent / "Sophia-tools"
+
+
+def get_access_token() -> str:
+    if str(SOPHIA_TOOLS) not in sys.path:
+        sys.path.append(str(SOPHIA_TOOLS))
+    with profiling.span("network", "sophia_auth.get_access_token"):
+        from inference_auth_token import get_access_token as fetch_token  # type: ignore
+
+        return fetch_token()
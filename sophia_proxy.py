@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+Local OpenAI-compatible caching proxy in front of the Sophia inference service.
+
+Open WebUI (or any OpenAI client) talks to http://127.0.0.1:<port>/v1 and the proxy
+  • forwards requests over a pooled `requests.Session` to the Sophia base URL,
+  • injects a centrally refreshed access token (clients can send any API key),
+  • coalesces identical in-flight requests into one upstream call,
+  • caches deterministic (temperature 0) completions in a bounded LRU,
+  • answers `GET /v1/models` locally from `model_servers.yaml` (Sophia returns 405),
+  • exposes per-model request, cache and latency stats at `GET /stats`.
+A temperature-0 streaming request (what Open WebUI sends for a chat with temperature 0)
+is buffered upstream and its SSE body cached and replayed, so it is coalesced and cached
+like any other; the client then receives the whole stream at once. Other streaming
+requests are passed through untouched, chunk by chunk.
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import statistics
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import profiling
+from sophia_auth import get_access_token
+
+PROJECT_ROOT = Path(__file__).resolve().parent
+MODEL_CONFIG = PROJECT_ROOT / "model_servers.yaml"
+DEFAULT_PORT = 8787
+TOKEN_MAX_AGE_SEC = 3600.0  # re-fetch the shared token after this long; a 401 forces it sooner
+HOP_HEADERS = {"connection", "keep-alive", "transfer-encoding", "content-encoding", "content-length"}
+
+
+@dataclass
+class UpstreamResponse:
+    status: int
+    content_type: str
+    body: bytes
+
+
+@dataclass
+class ModelStats:
+    requests: int = 0
+    upstream_calls: int = 0
+    cache_hits: int = 0
+    coalesced: int = 0
+    errors: int = 0
+    latencies: Deque[float] = field(default_factory=lambda: deque(maxlen=1000))
+
+    def as_dict(self) -> Dict[str, Any]:
+        lat = sorted(self.latencies)
+        return {
+            "requests": self.requests,
+            "upstream_calls": self.upstream_calls,
+            "cache_hits": self.cache_hits,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "latency_ms": {
+                "mean": round(statistics.fmean(lat) * 1000, 1),
+                "p50": round(lat[len(lat) // 2] * 1000, 1),
+                "p95": round(lat[min(len(lat) - 1, int(len(lat) * 0.95))] * 1000, 1),
+            }
+            if lat
+            else None,
+        }
+
+
+class TokenManager:
+    """Single shared Sophia token, refreshed on age or after an upstream 401."""
+
+    def __init__(self, max_age: float) -> None:
+        self.max_age = max_age
+        self._token: Optional[str] = None
+        self._fetched_at = 0.0
+        self.lock = threading.Lock()
+
+    def get(self, force: bool = False) -> str:
+        with self.lock:
+            if force or self._token is None or time.time() - self._fetched_at > self.max_age:
+                self._token = get_access_token()
+                self._fetched_at = time.time()
+            return self._token
+
+
+class _Pending:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.response: Optional[UpstreamResponse] = None
+
+
+class SophiaProxy:
+    def __init__(
+        self,
+        base_url: str,
+        models: list,
+        pool_size: int = 32,
+        cache_size: int = 1024,
+        cache_ttl: float = 3600.0,
+        timeout: float = 300.0,
+        token_max_age: float = TOKEN_MAX_AGE_SEC,
+    ) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.models = models
+        self.timeout = timeout
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.tokens = TokenManager(token_max_age)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._cache: "OrderedDict[str, Tuple[float, UpstreamResponse]]" = OrderedDict()
+        self._in_flight: Dict[str, _Pending] = {}
+        self.lock = threading.Lock()
+        self.stats: Dict[str, ModelStats] = {}
+
+    def stats_for(self, model: str) -> ModelStats:
+        if model not in self.stats:
+            self.stats[model] = ModelStats()
+        return self.stats[model]
+
+    @staticmethod
+    def request_key(path: str, payload: Dict[str, Any]) -> str:
+        canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(f"{path}\n{canonical}".encode("utf-8")).hexdigest()
+
+    def upstream(self, path: str, body: bytes, stream: bool = False) -> requests.Response:
+        url = f"{self.base_url}{path}"
+        for attempt in range(2):
+            headers = {
+                "Authorization": f"Bearer {self.tokens.get(force=attempt > 0)}",
+                "Content-Type": "application/json",
+            }
+            with profiling.span("network", "sophia_proxy.upstream"):
+                resp = self.session.post(url, data=body, headers=headers, timeout=self.timeout, stream=stream)
+            if resp.status_code != 401 or attempt:
+                return resp
+            resp.close()
+        return resp
+
+    def _cache_get(self, key: str) -> Optional[UpstreamResponse]:
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        stored_at, response = entry
+        if time.time() - stored_at > self.cache_ttl:
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return response
+
+    def _cache_put(self, key: str, response: UpstreamResponse) -> None:
+        self._cache[key] = (time.time(), response)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    @staticmethod
+    def cacheable(payload: Dict[str, Any]) -> bool:
+        return payload.get("temperature") == 0 and payload.get("n", 1) == 1
+
+    def complete(self, path: str, payload: Dict[str, Any]) -> UpstreamResponse:
+        """Serve a request from cache, an identical in-flight call, or upstream (buffered in full)."""
+        model = str(payload.get("model", ""))
+        cacheable = self.cacheable(payload)
+        key = self.request_key(path, payload)
+        with self.lock:
+            stats = self.stats_for(model)
+            stats.requests += 1
+            if cacheable:
+                cached = self._cache_get(key)
+                if cached is not None:
+                    stats.cache_hits += 1
+                    return cached
+            pending = self._in_flight.get(key)
+            leader = pending is None
+            if leader:
+                pending = self._in_flight[key] = _Pending()
+            else:
+                stats.coalesced += 1
+
+        if not leader:
+            pending.done.wait()
+            assert pending.response is not None
+            return pending.response
+
+        start = time.perf_counter()
+        try:
+            resp = self.upstream(path, json.dumps(payload).encode("utf-8"))
+            result = UpstreamResponse(
+                resp.status_code, resp.headers.get("Content-Type", "application/json"), resp.content
+            )
+        except Exception as exc:  # noqa: BLE001
+            result = UpstreamResponse(502, "application/json", json.dumps({"error": str(exc)}).encode("utf-8"))
+        latency = time.perf_counter() - start
+
+        with self.lock:
+            stats.upstream_calls += 1
+            stats.latencies.append(latency)
+            if result.status >= 400:
+                stats.errors += 1
+            elif cacheable:
+                self._cache_put(key, result)
+            del self._in_flight[key]
+        pending.response = result
+        pending.done.set()
+        return result
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "upstream": self.base_url,
+                "cache_entries": len(self._cache),
+                "in_flight": len(self._in_flight),
+                "models": {m: s.as_dict() for m, s in self.stats.items()},
+            }
+
+
+def make_handler(proxy: SophiaProxy):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format: str, *args: Any) -> None:  # noqa: A002  # pylint: disable=redefined-builtin
+            return
+
+        def _send(self, status: int, body: bytes, content_type: str = "application/json") -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_json(self, status: int, payload: Any) -> None:
+            self._send(status, json.dumps(payload, indent=2).encode("utf-8"))
+
+        def do_GET(self) -> None:  # noqa: N802
+            if self.path == "/stats":
+                self._send_json(200, proxy.snapshot())
+            elif self.path.rstrip("/") in ("/v1/models", "/models"):
+                data = [{"id": m, "object": "model", "owned_by": "sophia"} for m in proxy.models]
+                self._send_json(200, {"object": "list", "data": data})
+            else:
+                self._send_json(404, {"error": f"unknown path {self.path}"})
+
+        def do_POST(self) -> None:  # noqa: N802
+            path = self.path[len("/v1") :] if self.path.startswith("/v1/") else self.path
+            length = int(self.headers.get("Content-Length", 0))
+            try:
+                payload = json.loads(self.rfile.read(length) or b"{}")
+            except json.JSONDecodeError:
+                self._send_json(400, {"error": "request body is not valid JSON"})
+                return
+            if payload.get("stream") and not proxy.cacheable(payload):
+                self._stream(path, payload)
+                return
+            result = proxy.complete(path, payload)
+            self._send(result.status, result.body, result.content_type)
+
+        def _stream(self, path: str, payload: Dict[str, Any]) -> None:
+            model = str(payload.get("model", ""))
+            with proxy.lock:
+                stats = proxy.stats_for(model)
+                stats.requests += 1
+                stats.upstream_calls += 1
+            start = time.perf_counter()
+            try:
+                resp = proxy.upstream(path, json.dumps(payload).encode("utf-8"), stream=True)
+            except requests.RequestException as exc:
+                with proxy.lock:
+                    stats.errors += 1
+                self._send_json(502, {"error": str(exc)})
+                return
+            with resp:
+                self.send_response(resp.status_code)
+                for name, value in resp.headers.items():
+                    if name.lower() not in HOP_HEADERS:
+                        self.send_header(name, value)
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+                for chunk in resp.iter_content(chunk_size=None):
+                    self.wfile.write(chunk)
+                    self.wfile.flush()
+            with proxy.lock:
+                stats.latencies.append(time.perf_counter() - start)
+                if resp.status_code >= 400:
+                    stats.errors += 1
+
+    return Handler
+
+
+def load_model_config(path: Path = MODEL_CONFIG) -> Dict[str, Any]:
+    """Upstream base URL and model list from `model_servers.yaml`."""
+    import yaml
+
+    data = yaml.safe_load(path.read_text(encoding="utf-8")) or {}
+    if not data.get("openai_api_base"):
+        raise ValueError(f"{path} must define `openai_api_base`.")
+    return {"base_url": str(data["openai_api_base"]).rstrip("/"), "models": list(data.get("models") or [])}
+
+
+def serve(proxy: SophiaProxy, host: str, port: int) -> None:
+    server = ThreadingHTTPServer((host, port), make_handler(proxy))
+    server.daemon_threads = True
+    print(f">> Sophia proxy listening on http://{host}:{port}/v1 -> {proxy.base_url}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Run a local caching proxy in front of Sophia.")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to bind.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Port to bind.")
+    parser.add_argument("--pool-size", type=int, default=32, help="Max pooled upstream connections.")
+    parser.add_argument("--cache-size", type=int, default=1024, help="Max cached temperature-0 completions.")
+    parser.add_argument("--cache-ttl", type=float, default=3600.0, help="Seconds a cached completion stays valid.")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Upstream request timeout in seconds.")
+    args = parser.parse_args(argv)
+
+    config = load_model_config()
+    proxy = SophiaProxy(
+        config["base_url"],
+        config["models"],
+        pool_size=args.pool_size,
+        cache_size=args.cache_size,
+        cache_ttl=args.cache_ttl,
+        timeout=args.timeout,
+    )
+    serve(proxy, args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
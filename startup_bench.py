@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Cold-start import benchmark for the task entry points.
+
+Each entry-point module is imported in a fresh interpreter with `python -X importtime`;
+the cumulative time of the module's own top-level import is recorded (median of
+several runs) together with its heaviest direct imports. Results go to
+`outputs/startup_benchmark.json`. With a saved baseline the script exits non-zero
+when an entry point gets slower than the allowed regression.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import re
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+PROJECT_ROOT = Path(__file__).resolve().parent
+RESULTS_PATH = PROJECT_ROOT / "outputs" / "startup_benchmark.json"
+BASELINE_PATH = PROJECT_ROOT / "outputs" / "startup_baseline.json"
+ENTRY_POINTS = [
+    "cli",
+    "task1",
+    "task2",
+    "task3",
+    "task4",
+    "task4_eval",
+    "task5",
+    "telephone_drift",
+    "interaction_graph",
+    "gene_store",
+    "sophia_proxy",
+    "nanogpt_sweep",
+]
+IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def import_profile(module: str) -> Tuple[int, List[Tuple[str, int]]]:
+    """Cumulative import time of ``module`` (µs) and its top-level dependencies by cost."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "import failed")
+    total: Optional[int] = None
+    deps: List[Tuple[str, int]] = []
+    for line in proc.stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if not match:
+            continue
+        cumulative, depth, name = int(match.group(2)), len(match.group(3)), match.group(4)
+        if depth == 1:
+            # importtime prints children before their parent, so reset on every other top-level line.
+            if name == module:
+                total = cumulative
+                break
+            deps = []
+        elif depth == 3:
+            # Direct children of the entry module (importtime indents two spaces per level).
+            deps.append((name, cumulative))
+    if total is None:
+        raise RuntimeError(f"{module} missing from -X importtime output")
+    deps.sort(key=lambda item: item[1], reverse=True)
+    return total, deps
+
+
+def benchmark(modules: List[str], repeats: int) -> Dict[str, Any]:
+    results: Dict[str, Any] = {}
+    for module in modules:
+        try:
+            samples = [import_profile(module) for _ in range(repeats)]
+        except RuntimeError as exc:
+            results[module] = {"error": str(exc)}
+            print(f"   {module}: import failed ({exc})")
+            continue
+        totals = [total for total, _ in samples]
+        median_ms = statistics.median(totals) / 1000
+        results[module] = {
+            "median_ms": round(median_ms, 2),
+            "min_ms": round(min(totals) / 1000, 2),
+            "heaviest_imports": [{"module": n, "ms": round(us / 1000, 2)} for n, us in samples[0][1][:5]],
+        }
+        print(f"   {module}: {median_ms:.1f} ms")
+    return results
+
+
+def find_regressions(
+    results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float, min_ms: float
+) -> List[str]:
+    problems = []
+    for module, current in results.items():
+        before = baseline.get(module)
+        if not before or "median_ms" not in before or "median_ms" not in current:
+            continue
+        delta = current["median_ms"] - before["median_ms"]
+        if delta > min_ms and current["median_ms"] > before["median_ms"] * (1 + tolerance):
+            problems.append(f"{module}: {before['median_ms']:.1f} ms -> {current['median_ms']:.1f} ms")
+    return problems
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark cold-start import time of each entry point.")
+    parser.add_argument("modules", nargs="*", default=ENTRY_POINTS, help="Entry-point modules to measure.")
+    parser.add_argument("--repeats", type=int, default=5, help="Fresh interpreters per module.")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH, help="Baseline JSON to compare against.")
+    parser.add_argument("--update-baseline", action="store_true", help="Store these results as the new baseline.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown (0.25 = 25%%).")
+    parser.add_argument("--min-ms", type=float, default=5.0, help="Ignore slowdowns smaller than this many ms.")
+    args = parser.parse_args(argv)
+
+    print(f">> Measuring import time for {len(args.modules)} entry points ({args.repeats} runs each)")
+    results = benchmark(args.modules, args.repeats)
+    RESULTS_PATH.parent.mkdir(parents=True, exist_ok=True)
+    RESULTS_PATH.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    print(f">> Saved results to {RESULTS_PATH}")
+
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f">> Baseline updated at {args.baseline}")
+        return
+    if args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        problems = find_regressions(results, baseline, args.tolerance, args.min_ms)
+        if problems:
+            print(">> Startup regressions:")
+            for line in problems:
+                print(f"   {line}")
+            sys.exit(1)
+        print(">> No startup regressions against baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Check generated summaries against the run data they describe.
+
+`outputs/summary_validation.txt` was a one-off English/Spanish number comparison. This
+engine handles any number of reports in one pass:
+  • every report (a file, or each `# ` section of a file) is scanned once for numbers,
+    gene-like symbols and disease counts ("11 cancer", "1 cardiopatía"; the words are
+    the `aliases` of each disease in disease_panel.yaml);
+  • the values are looked up in an index built from the source runs: each run's
+    `summary.json`/`results.json` and the telephone latencies. Numbers are matched at
+    their printed precision (`364 s` matches 364.03; `6.80` matches 6.8012);
+  • reports of the same text in different languages (`summary.en.md` / `summary.es.md`,
+    or sections titled "(English)" / "(Español)") must contain the same numbers.
+Disease counts that match no source run, HGNC symbols that no run analyzed, and
+number differences between translations are mismatches. Numbers without a source
+(derived ratios, nanoGPT losses) are listed as unverified. Results go to
+`outputs/summary_validation.{json,md}`; the exit status is 1 when there are mismatches.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import re
+import sys
+from collections import Counter
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import disease_panel
+import runcore
+
+PROJECT_ROOT = Path(__file__).resolve().parent
+OUTPUTS = PROJECT_ROOT / "outputs"
+DEFAULT_REPORTS = [OUTPUTS / "summary.md"]
+CATALOG_PATH = PROJECT_ROOT / "data" / "approved_gene_symbols.txt"
+TELEPHONE_RUNS = OUTPUTS / "telephone" / "telephone_runs.json"
+REPORT_BASE = OUTPUTS / "summary_validation"
+MAX_DECIMALS = 3
+
+LANGUAGES = {"english": "en", "inglés": "en", "español": "es", "espanol": "es", "spanish": "es"}
+LANG_SUFFIX_RE = re.compile(r"\.([a-z]{2})\.md$")
+# Plain numbers (not part of names like Llama-3.1 or 3B) and upper-case symbols.
+NUMBER_SYMBOL_RE = (
+    r"(?P<num>(?<![\w.\-‑:])\d{1,3}(?:,\d{3})+(?:\.\d+)?(?![\w])|(?<![\w.\-‑:])\d+(?:\.\d+)?(?![\w.]|\.\d))"
+    r"|(?P<sym>\b[A-Z][A-Z0-9]{1,11}\b)"
+)
+
+
+@lru_cache(maxsize=None)
+def scanner(panel: disease_panel.DiseasePanel) -> Tuple["re.Pattern[str]", List[Tuple[str, str]]]:
+    """One regex per panel for a single scan per report, plus (word stem, disease) pairs.
+
+    Stems are tried longest first, so "cardiopat" wins over "cardio".
+    """
+    stems = sorted(
+        ((alias, d.key) for d in panel for alias in d.aliases or (d.label.lower(),)),
+        key=lambda pair: -len(pair[0]),
+    )
+    alternation = "|".join(re.escape(stem) for stem, _ in stems)
+    return re.compile(rf"(?P<count>\d+)\s+(?P<disease>(?i:{alternation}))\w*|" + NUMBER_SYMBOL_RE), stems
+
+
+@dataclass
+class Report:
+    path: Path
+    section: str
+    text: str
+    language: Optional[str] = None
+    group: str = ""
+
+
+@dataclass
+class Extracted:
+    numbers: List[str] = field(default_factory=list)
+    counts: List[Tuple[str, int]] = field(default_factory=list)  # (disease, count)
+    symbols: List[str] = field(default_factory=list)
+
+
+class SourceIndex:
+    """Values from source runs, keyed for O(1) lookup at a given printed precision."""
+
+    def __init__(self) -> None:
+        self.numbers: Dict[Tuple[int, str], Set[str]] = {}
+        self.disease_counts: Dict[Tuple[str, int], Set[str]] = {}
+        self.genes: Dict[str, Set[str]] = {}
+        self.sources: List[str] = []
+
+    def add_number(self, value: float, label: str) -> None:
+        for decimals in range(MAX_DECIMALS + 1):
+            scale = 10**decimals
+            # Reports round or truncate ("364 s" for 364.03, "~200 minutes").
+            for candidate in {round(value, decimals), int(value * scale) / scale}:
+                self.numbers.setdefault((decimals, f"{candidate:.{decimals}f}"), set()).add(label)
+
+    def add_gene_run(self, run_dir: Path) -> None:
+        name = _display(run_dir)
+        report = json.loads((run_dir / "summary.json").read_text(encoding="utf-8"))
+        summary = report.get("summary", {})
+        self.sources.append(name)
+        for key in ("runtime_seconds", "manual_estimate_minutes", "reused_from_store"):
+            if isinstance(report.get(key), (int, float)):
+                self.add_number(report[key], f"{name}:{key}")
+        if "total_genes" in summary:
+            self.add_number(summary["total_genes"], f"{name}:total_genes")
+        self.add_number(len(summary.get("genes_with_interactions", [])), f"{name}:genes_with_interactions")
+        for disease, count in summary.get("disease_counts", {}).items():
+            self.add_number(count, f"{name}:{disease}")
+            self.disease_counts.setdefault((disease, count), set()).add(name)
+        results_path = run_dir / "results.json"
+        if results_path.exists():
+            for record in json.loads(results_path.read_text(encoding="utf-8")):
+                self.genes.setdefault(record["gene"], set()).add(name)
+
+    def add_telephone(self, path: Path) -> None:
+        runs = json.loads(path.read_text(encoding="utf-8"))
+        name = _display(path)
+        self.sources.append(name)
+        self.add_number(len(runs), f"{name}:prompts")
+        by_stage: Dict[int, List[float]] = {}
+        for run in runs:
+            for i, stage in enumerate(run.get("stages", []), start=1):
+                if isinstance(stage.get("latency_sec"), (int, float)):
+                    by_stage.setdefault(i, []).append(stage["latency_sec"])
+        self.add_number(len(by_stage), f"{name}:stages")
+        for i, latencies in by_stage.items():
+            self.add_number(sum(latencies) / len(latencies), f"{name}:stage{i}_mean_latency")
+
+    def lookup_number(self, text: str) -> Set[str]:
+        plain = text.replace(",", "")
+        decimals = len(plain.split(".")[1]) if "." in plain else 0
+        if decimals > MAX_DECIMALS:
+            return set()
+        return self.numbers.get((decimals, f"{float(plain):.{decimals}f}"), set())
+
+
+def _display(path: Path) -> str:
+    try:
+        return str(path.resolve().relative_to(PROJECT_ROOT))
+    except ValueError:
+        return str(path)
+
+
+def gene_run_dirs(root: Path = OUTPUTS) -> List[Path]:
+    return sorted(p.parent for p in root.rglob("summary.json") if (p.parent / "results.json").exists())
+
+
+def build_index(run_dirs: Iterable[Path], telephone: Optional[Path] = None) -> SourceIndex:
+    index = SourceIndex()
+    for run_dir in run_dirs:
+        index.add_gene_run(run_dir)
+    if telephone is not None and telephone.exists():
+        index.add_telephone(telephone)
+    return index
+
+
+def load_catalog(path: Path = CATALOG_PATH) -> Set[str]:
+    if not path.exists():
+        return set()
+    return {line.strip() for line in path.read_text(encoding="utf-8").splitlines() if line.strip()}
+
+
+def split_reports(path: Path) -> List[Report]:
+    """One report per top-level section; a language suffix in the name applies to all of them."""
+    text = path.read_text(encoding="utf-8")
+    suffix = LANG_SUFFIX_RE.search(path.name)
+    group = _display(path.with_name(LANG_SUFFIX_RE.sub(".md", path.name)) if suffix else path)
+    sections: List[Tuple[str, List[str]]] = [("", [])]
+    for line in text.splitlines():
+        if line.startswith("# "):
+            sections.append((line[2:].strip(), []))
+        else:
+            sections[-1][1].append(line)
+    reports = []
+    for heading, lines in sections:
+        body = "\n".join(lines).strip()
+        if not body:
+            continue
+        language = suffix.group(1) if suffix else None
+        lowered = heading.lower()
+        for word, code in LANGUAGES.items():
+            if word in lowered:
+                language = code
+        reports.append(Report(path, heading, body, language, group))
+    return reports
+
+
+def extract(text: str, catalog: Set[str]) -> Extracted:
+    found = Extracted()
+    token_re, stems = scanner(disease_panel.current())
+    for match in token_re.finditer(text):
+        if match.group("count"):
+            word = match.group("disease").lower()
+            disease = next(d for stem, d in stems if word.startswith(stem))
+            found.counts.append((disease, int(match.group("count"))))
+            found.numbers.append(match.group("count"))
+        elif match.group("num"):
+            found.numbers.append(match.group("num"))
+        elif match.group("sym") in catalog:
+            found.symbols.append(match.group("sym"))
+    return found
+
+
+def validate(reports: List[Report], index_for: Any, catalog: Set[str]) -> Dict[str, Any]:
+    """Check each report against its source index; ``index_for(path)`` picks the index."""
+    entries: List[Dict[str, Any]] = []
+    extracted: Dict[int, Extracted] = {}
+    for i, report in enumerate(reports):
+        index: SourceIndex = index_for(report.path)
+        found = extract(report.text, catalog)
+        extracted[i] = found
+        mismatches = [
+            f"{count} {disease.replace('_', ' ')} matches no source run"
+            for disease, count in found.counts
+            if (disease, count) not in index.disease_counts
+        ]
+        mismatches += [f"gene {s} was not analyzed in any source run" for s in dict.fromkeys(found.symbols)
+                       if s not in index.genes]
+        verified: Dict[str, List[str]] = {}
+        unverified: List[str] = []
+        for number in found.numbers:
+            labels = index.lookup_number(number)
+            if labels:
+                verified[number] = sorted(labels)
+            elif number not in unverified:
+                unverified.append(number)
+        entries.append(
+            {
+                "report": _display(report.path),
+                "section": report.section,
+                "language": report.language,
+                "sources": index.sources,
+                "numbers": len(found.numbers),
+                "verified": verified,
+                "unverified": unverified,
+                "genes": sorted(set(found.symbols)),
+                "mismatches": mismatches,
+            }
+        )
+
+    # Translations of the same report must carry the same numbers.
+    groups: Dict[str, List[int]] = {}
+    for i, report in enumerate(reports):
+        if report.language:
+            groups.setdefault(report.group, []).append(i)
+    parity = []
+    for group, members in groups.items():
+        if len({reports[i].language for i in members}) < 2:
+            continue
+        members.sort(key=lambda i: reports[i].language != "en")
+        reference = Counter(extracted[members[0]].numbers)
+        for i in members[1:]:
+            other = Counter(extracted[i].numbers)
+            missing, extra = sorted((reference - other).elements()), sorted((other - reference).elements())
+            parity.append(
+                {
+                    "group": group,
+                    "reference": reports[members[0]].language,
+                    "language": reports[i].language,
+                    "match": not missing and not extra,
+                    "missing": missing,
+                    "extra": extra,
+                }
+            )
+            if missing or extra:
+                entries[i]["mismatches"].append(
+                    f"numbers differ from the {reports[members[0]].language} version: missing {missing}, extra {extra}"
+                )
+    return {
+        "reports": entries,
+        "parity": parity,
+        "mismatches": sum(len(e["mismatches"]) for e in entries),
+    }
+
+
+def write_report(result: Dict[str, Any], base: Path) -> None:
+    runcore.write_json(base.with_suffix(".json"), result)
+    lines = ["# Summary Validation", "", f"- Reports checked: {len(result['reports'])}",
+             f"- Mismatches: {result['mismatches']}", ""]
+    for entry in result["reports"]:
+        title = f"{entry['report']}" + (f" — {entry['section']}" if entry["section"] else "")
+        lines += [
+            f"## {title}",
+            f"- Numbers: {entry['numbers']} ({len(entry['verified'])} distinct verified)",
+            f"- Unverified: {', '.join(entry['unverified']) or 'none'}",
+            f"- Genes: {', '.join(entry['genes']) or 'none'}",
+        ]
+        lines += [f"- **Mismatch:** {m}" for m in entry["mismatches"]]
+        lines.append("")
+    if result["parity"]:
+        lines += ["## Translation Parity", "| Report | Languages | Match | Missing | Extra |", "| --- | --- | --- | --- | --- |"]
+        lines += [
+            f"| {p['group']} | {p['reference']} / {p['language']} | {p['match']} | "
+            f"{', '.join(p['missing']) or '-'} | {', '.join(p['extra']) or '-'} |"
+            for p in result["parity"]
+        ]
+    runcore.write_text(base.with_suffix(".md"), "\n".join(lines) + "\n")
+
+
+def collect_reports(paths: List[Path]) -> List[Path]:
+    files: List[Path] = []
+    for path in paths:
+        files.extend(sorted(path.rglob("summary*.md")) if path.is_dir() else [path])
+    return files
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Validate numbers and gene symbols in generated summaries.")
+    parser.add_argument(
+        "reports", nargs="*", type=Path, default=DEFAULT_REPORTS, help="Summary files or directories of summary*.md."
+    )
+    parser.add_argument(
+        "--source",
+        type=Path,
+        action="append",
+        help="Run directory with summary.json/results.json (repeatable; default: every run under outputs/).",
+    )
+    parser.add_argument("--output", type=Path, default=REPORT_BASE, help="Report path without extension.")
+    args = parser.parse_args(argv)
+
+    catalog = load_catalog()
+    shared = build_index(args.source or gene_run_dirs(), TELEPHONE_RUNS)
+    per_run: Dict[Path, SourceIndex] = {}
+
+    def index_for(path: Path) -> SourceIndex:
+        # A report saved next to its run's summary.json is checked against that run only.
+        run_dir = path.resolve().parent
+        if args.source or not (run_dir / "summary.json").exists():
+            return shared
+        if run_dir not in per_run:
+            per_run[run_dir] = build_index([run_dir])
+        return per_run[run_dir]
+
+    files = collect_reports(args.reports)
+    reports = [r for path in files for r in split_reports(path)]
+    print(f">> Validating {len(reports)} reports from {len(files)} files against {len(shared.sources)} sources")
+    result = validate(reports, index_for, catalog)
+    write_report(result, args.output)
+    for entry in result["reports"]:
+        for mismatch in entry["mismatches"]:
+            print(f"   ! {entry['report']} [{entry['section'] or '-'}]: {mismatch}")
+    print(f">> {result['mismatches']} mismatches; report written to {args.output.with_suffix('.md')}")
+    if result["mismatches"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,22 +5,19 @@ Task 1: Multi-model "Game of Telephone" using the Argonne ALCF Sophia inference
 Each input prompt is paraphrased sequentially by four models. We log intermediate
 outputs, latencies, and final paraphrases. Results are persisted as JSON and markdown.
 """
+from __future__ import annotations
+
 import argparse
 import json
-import sys
-import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from dataclasses import asdict, dataclass
 from pathlib import Path
-from typing import List
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set
 
-from openai import APIConnectionError, APITimeoutError, InternalServerError, OpenAI
+import artifact_writer
+import runcore
 
 PROJECT_ROOT = Path(__file__).resolve().parent
-SOPHIA_TOOLS = PROJECT_ROOT.parent / "Sophia-tools"
-if str(SOPHIA_TOOLS) not in sys.path:
-    sys.path.append(str(SOPHIA_TOOLS))
-
-from inference_auth_token import get_access_token  # type: ignore  # pylint: disable=wrong-import-position
 
 
 DEFAULT_MODELS = [
@@ -61,97 +58,164 @@ class TelephoneRun:
         return self.stages[-1].output_text if self.stages else ""
 
 
-def build_client(timeout: int) -> OpenAI:
-    access_token = get_access_token()
-    return OpenAI(
-        api_key=access_token,
-        base_url="https://inference-api.alcf.anl.gov/resource_server/sophia/vllm/v1",
-        timeout=timeout,
-    )
-
-
-def paraphrase_message(client: OpenAI, model: str, text: str, timeout: int, retry: int = 2) -> StageResult:
+def paraphrase_message(model: str, text: str, timeout: int, retry: Optional[int] = None) -> StageResult:
     paraphrase_prompt = (
         "Paraphrase the following message. Keep the core meaning but change tone, word choice, "
         "and sentence structure. Limit the response to 200 words. Message:\n\n"
         f"{text}"
     )
-    for attempt in range(retry + 1):
-        start = time.perf_counter()
-        try:
-            response = client.with_options(timeout=timeout).chat.completions.create(
-                model=model,
-                messages=[{"role": "user", "content": paraphrase_prompt}],
-            )
-        except (APITimeoutError, APIConnectionError, InternalServerError) as exc:
-            if attempt >= retry:
-                raise RuntimeError(f"Model {model} failed after {retry + 1} attempts: {exc}") from exc
-            print(f"    ! Model {model} attempt {attempt + 1} failed: {exc}. Retrying...", flush=True)
-            time.sleep(1.5 * (attempt + 1))
-            continue
 
-        latency = time.perf_counter() - start
-        message = response.choices[0].message.content.strip()
-        return StageResult(model=model, latency_sec=latency, output_text=message)
+    def report_retry(attempt: int, exc: Exception) -> None:
+        print(f"    ! Model {model} attempt {attempt + 1} failed: {exc}. Retrying...", flush=True)
 
-    raise RuntimeError(f"Model {model} did not return after retries.")
+    result = runcore.chat(
+        "sophia",
+        model,
+        [{"role": "user", "content": paraphrase_prompt}],
+        timeout=timeout,
+        retries=retry,
+        on_retry=report_retry,
+    )
+    return StageResult(model=model, latency_sec=result.latency_sec, output_text=result.text)
 
 
-def run_telephone(prompts: List[str], models: List[str], timeout: int) -> List[TelephoneRun]:
-    client = build_client(timeout=timeout)
-    runs: List[TelephoneRun] = []
-    total_prompts = len(prompts)
-    for prompt_idx, prompt in enumerate(prompts, start=1):
-        print(f"[Prompt {prompt_idx}/{total_prompts}] Starting run", flush=True)
-        stages: List[StageResult] = []
-        current_text = prompt
-        for stage_idx, model in enumerate(models, start=1):
+def run_chain(prompt: str, models: List[str], timeout: int, verbose: bool = True) -> TelephoneRun:
+    stages: List[StageResult] = []
+    current_text = prompt
+    for stage_idx, model in enumerate(models, start=1):
+        if verbose:
             print(f"    -> Stage {stage_idx}: requesting {model}", flush=True)
-            stage = paraphrase_message(client, model, current_text, timeout=timeout)
-            stages.append(stage)
-            current_text = stage.output_text
+        stage = paraphrase_message(model, current_text, timeout=timeout)
+        stages.append(stage)
+        current_text = stage.output_text
+        if verbose:
             print(
                 f"    <- Stage {stage_idx}: {model} returned {len(stage.output_text)} chars "
                 f"in {stage.latency_sec:.2f}s",
                 flush=True,
             )
-        runs.append(TelephoneRun(input_prompt=prompt, stages=stages))
+    return TelephoneRun(input_prompt=prompt, stages=stages)
+
+
+def run_telephone(prompts: List[str], models: List[str], timeout: int) -> List[TelephoneRun]:
+    runs: List[TelephoneRun] = []
+    total_prompts = len(prompts)
+    for prompt_idx, prompt in enumerate(prompts, start=1):
+        print(f"[Prompt {prompt_idx}/{total_prompts}] Starting run", flush=True)
+        runs.append(run_chain(prompt, models, timeout))
         print(f"[Prompt {prompt_idx}/{total_prompts}] Completed run\n", flush=True)
     return runs
 
 
+def run_to_record(run: TelephoneRun) -> Dict[str, Any]:
+    return {
+        "input_prompt": run.input_prompt,
+        "stages": [asdict(stage) for stage in run.stages],
+        "final_output": run.final_output,
+    }
+
+
+def load_completed_indices(jsonl_path: Path) -> Set[int]:
+    """Return prompt indices already present in a JSONL file, dropping a torn trailing line."""
+    if not jsonl_path.exists():
+        return set()
+    return {
+        int(record["prompt_index"])
+        for record in artifact_writer.iter_jsonl(jsonl_path, truncate_torn=True)
+        if "prompt_index" in record
+    }
+
+
+def stream_telephone(
+    prompts: Iterable[str],
+    models: List[str],
+    timeout: int,
+    jsonl_path: Path,
+    concurrency: int = 4,
+) -> int:
+    """Run prompts through the chain with bounded concurrency, appending each run to JSONL.
+
+    At most ``2 * concurrency`` prompts are in memory at once. Prompts whose index
+    already appears in ``jsonl_path`` are skipped, so an interrupted run resumes.
+    """
+    completed = load_completed_indices(jsonl_path)
+    if completed:
+        print(f"Resuming: {len(completed)} runs already in {jsonl_path}", flush=True)
+    max_in_flight = max(1, concurrency) * 2
+    written = 0
+    failed = 0
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        in_flight: Dict[Future, int] = {}
+
+        def drain(block_until: int) -> None:
+            nonlocal written, failed
+            while len(in_flight) > block_until:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    prompt_idx = in_flight.pop(future)
+                    try:
+                        run = future.result()
+                    except Exception as exc:  # noqa: BLE001
+                        failed += 1
+                        print(f"[Prompt {prompt_idx}] failed: {exc}", flush=True)
+                        continue
+                    record = {"prompt_index": prompt_idx, **run_to_record(run)}
+                    # Queued on the background writer; whole lines keep the resume check valid.
+                    runcore.append_text(jsonl_path, json.dumps(record) + "\n")
+                    written += 1
+                    print(f"[Prompt {prompt_idx}] completed ({written} written, {failed} failed)", flush=True)
+
+        for prompt_idx, prompt in enumerate(prompts, start=1):
+            if prompt_idx in completed:
+                continue
+            future = pool.submit(run_chain, prompt, models, timeout, False)
+            in_flight[future] = prompt_idx
+            drain(max_in_flight - 1)
+        drain(0)
+
+    runcore.flush_outputs()
+    print(f"Appended {written} runs to {jsonl_path} ({failed} failed; rerun to retry them).")
+    return written
+
+
+def iter_jsonl_records(jsonl_path: Path) -> Iterator[Dict[str, Any]]:
+    return artifact_writer.iter_jsonl(jsonl_path)
+
+
+def markdown_chunks(records: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    yield "# Game of Telephone Results\n\n"
+    for idx, record in enumerate(records, start=1):
+        yield f"## Prompt {record.get('prompt_index', idx)}\n"
+        yield f"**Input:** {record['input_prompt']}\n\n"
+        for stage_idx, stage in enumerate(record["stages"], start=1):
+            yield (
+                f"- **Stage {stage_idx} ({stage['model']} | {stage['latency_sec']:.2f}s):** "
+                f"{stage['output_text']}\n"
+            )
+        yield f"\n**Final Output:** {record['final_output']}\n\n"
+
+
+def write_markdown(records: Iterable[Dict[str, Any]], markdown_path: Path) -> None:
+    """Stream the report straight to disk (used for JSONL runs that may not fit in memory)."""
+    with markdown_path.open("w", encoding="utf-8") as fh:
+        fh.writelines(markdown_chunks(records))
+    runcore.WRITER.register(markdown_path)
+
+
 def save_results(runs: List[TelephoneRun], output_dir: Path) -> None:
     output_dir.mkdir(parents=True, exist_ok=True)
     json_path = output_dir / "telephone_runs.json"
-    with json_path.open("w", encoding="utf-8") as fh:
-        json.dump(
-            [
-                {
-                    "input_prompt": run.input_prompt,
-                    "stages": [asdict(stage) for stage in run.stages],
-                    "final_output": run.final_output,
-                }
-                for run in runs
-            ],
-            fh,
-            indent=2,
-        )
+    runcore.write_json(json_path, [run_to_record(run) for run in runs])
 
     markdown_path = output_dir / "telephone_runs.md"
-    with markdown_path.open("w", encoding="utf-8") as fh:
-        fh.write("# Game of Telephone Results\n\n")
-        for idx, run in enumerate(runs, start=1):
-            fh.write(f"## Prompt {idx}\n")
-            fh.write(f"**Input:** {run.input_prompt}\n\n")
-            for stage_idx, stage in enumerate(run.stages, start=1):
-                fh.write(f"- **Stage {stage_idx} ({stage.model} | {stage.latency_sec:.2f}s):** {stage.output_text}\n")
-            fh.write(f"\n**Final Output:** {run.final_output}\n\n")
+    runcore.write_text(markdown_path, "".join(markdown_chunks(run_to_record(run) for run in runs)))
 
     print(f"Saved JSON results to {json_path}")
     print(f"Saved Markdown summary to {markdown_path}")
 
 
-def parse_args() -> argparse.Namespace:
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Run a multi-model telephone paraphrasing experiment.")
     parser.add_argument(
         "--models",
@@ -176,7 +240,23 @@ def parse_args() -> argparse.Namespace:
         type=Path,
         help="Optional path to a text file containing one prompt per line. Overrides the default prompts.",
     )
-    return parser.parse_args()
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Read prompts lazily and append each completed run to telephone_runs.jsonl (resumable).",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=runcore.SETTINGS.concurrency,
+        help="Number of prompts processed in parallel in --stream mode.",
+    )
+    parser.add_argument(
+        "--markdown",
+        action="store_true",
+        help="In --stream mode, render telephone_runs.md from the JSONL after the run.",
+    )
+    return parser.parse_args(argv)
 
 
 def load_prompts(args: argparse.Namespace) -> List[str]:
@@ -189,12 +269,34 @@ def load_prompts(args: argparse.Namespace) -> List[str]:
     return DEFAULT_PROMPTS
 
 
-def main() -> None:
-    args = parse_args()
+def iter_prompts(args: argparse.Namespace) -> Iterator[str]:
+    """Lazily yield prompts; unlike load_prompts the file is never held in memory."""
+    if not args.prompt_file:
+        yield from DEFAULT_PROMPTS
+        return
+    with args.prompt_file.open("r", encoding="utf-8") as fh:
+        for line in fh:
+            line = line.strip()
+            if line:
+                yield line
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    if args.stream:
+        jsonl_path = args.output_dir / "telephone_runs.jsonl"
+        print(f"Streaming telephone experiment across models: {args.models}")
+        stream_telephone(iter_prompts(args), args.models, args.timeout, jsonl_path, args.concurrency)
+        if args.markdown:
+            markdown_path = args.output_dir / "telephone_runs.md"
+            write_markdown(iter_jsonl_records(jsonl_path), markdown_path)
+            print(f"Saved Markdown summary to {markdown_path}")
+        return
     prompts = load_prompts(args)
     print(f"Running telephone experiment with {len(prompts)} prompts across models: {args.models}")
     runs = run_telephone(prompts, args.models, timeout=args.timeout)
     save_results(runs, args.output_dir)
+    runcore.flush_outputs()
 
 
 if __name__ == "__main__":
@@ -8,33 +8,48 @@ This helper script
   • Fetches a fresh access token via `inference_auth_token`.
   • Writes an `.env.openwebui` file with the OpenAI-compatible settings.
   • Optionally launches the Open WebUI server using those settings.
+
+Repeated runs take a fast path: when `model_servers.yaml`, the venv and the env file
+are unchanged, every setup step except the token lookup is skipped. The token itself
+is never cached here; `inference_auth_token` tracks its real expiry, and the env file
+is rewritten only when the token it returns has changed.
 """
 from __future__ import annotations
 
 import argparse
+import hashlib
 import json
 import os
+import socket
+import ssl
+import statistics
 import subprocess
 import sys
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Dict, List
+from typing import Any, Deque, Dict, List, Optional
+from urllib.parse import urlparse
 
-import yaml
+import artifact_writer
+import profiling
+from sophia_auth import get_access_token
 
-# Allow importing inference_auth_token from Sophia-tools.
 PROJECT_ROOT = Path(__file__).resolve().parent
-SOPHIA_TOOLS = PROJECT_ROOT.parent / "Sophia-tools"
-if str(SOPHIA_TOOLS) not in sys.path:
-    sys.path.append(str(SOPHIA_TOOLS))
-
-from inference_auth_token import get_access_token  # type: ignore  # pylint: disable=wrong-import-position
-
 PY311 = Path("/opt/homebrew/bin/python3.11")
 VENV_DIR = PROJECT_ROOT / ".venv_openwebui"
 OPENWEBUI_BIN = VENV_DIR / "bin" / "open-webui"
 ENV_FILE = PROJECT_ROOT / ".env.openwebui"
 MODEL_CONFIG = PROJECT_ROOT / "model_servers.yaml"
 STATE_DIR = PROJECT_ROOT / "openwebui_state"
+HEALTHCHECK_PATH = PROJECT_ROOT / "outputs" / "openwebui_healthcheck.json"
+HEALTHCHECK_HISTORY = PROJECT_ROOT / "outputs" / "openwebui_healthcheck_history.jsonl"
+DEGRADED_FACTOR = 2.0  # flag a model whose mean latency doubles vs. its baseline
+BASELINE_ROUNDS = 20  # the baseline is the median of a model's last rounds in the history
+MIN_BASELINE_ROUNDS = 3  # rounds needed before anything is flagged
+SETUP_STATE = PROJECT_ROOT / ".openwebui_setup.json"
 
 
 def ensure_python311() -> None:
@@ -46,26 +61,87 @@ def ensure_python311() -> None:
     )
 
 
-def ensure_virtualenv() -> None:
-    ensure_python311()
+def ensure_virtualenv(
+    wheelhouse: Optional[Path] = None, offline: bool = False, upgrade_pip: bool = False
+) -> None:
     if VENV_DIR.exists() and OPENWEBUI_BIN.exists():
         return
+    ensure_python311()
 
     if not VENV_DIR.exists():
         print(">> Creating Python 3.11 virtual environment .venv_openwebui")
         subprocess.run([str(PY311), "-m", "venv", str(VENV_DIR)], check=True)
 
-    print(">> Installing open-webui into the virtual environment")
-    subprocess.run(
-        [str(VENV_DIR / "bin" / "pip"), "install", "--upgrade", "pip"],
-        check=True,
-    )
+    pip = str(VENV_DIR / "bin" / "pip")
+    if upgrade_pip and not offline:
+        subprocess.run([pip, "install", "--upgrade", "pip"], check=True)
+
+    if wheelhouse is None:
+        print(">> Installing open-webui into the virtual environment")
+        subprocess.run([pip, "install", "open-webui"], check=True)
+        return
+
+    if offline:
+        if not any(wheelhouse.glob("*.whl")):
+            raise FileNotFoundError(f"--offline requires a populated wheelhouse; no wheels in {wheelhouse}")
+    else:
+        # Populate/refresh the shared wheel cache; wheels already present are reused by pip.
+        print(f">> Building open-webui wheels into {wheelhouse}")
+        wheelhouse.mkdir(parents=True, exist_ok=True)
+        subprocess.run(
+            [pip, "wheel", "--wheel-dir", str(wheelhouse), "--find-links", str(wheelhouse), "open-webui"],
+            check=True,
+        )
+    print(f">> Installing open-webui from wheelhouse {wheelhouse}")
     subprocess.run(
-        [str(VENV_DIR / "bin" / "pip"), "install", "open-webui"],
+        [pip, "install", "--no-index", "--find-links", str(wheelhouse), "open-webui"],
         check=True,
     )
 
 
+def setup_fingerprint(api_base: str = "") -> str:
+    """Hash of everything the generated environment depends on, cheap enough for every run."""
+    digest = hashlib.sha256()
+    digest.update(api_base.encode())
+    digest.update(MODEL_CONFIG.read_bytes() if MODEL_CONFIG.exists() else b"<no config>")
+    for path in (OPENWEBUI_BIN, VENV_DIR / "pyvenv.cfg", ENV_FILE):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            digest.update(f"{path}:missing".encode())
+            continue
+        digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    digest.update(str(STATE_DIR.is_dir()).encode())
+    return digest.hexdigest()
+
+
+def token_digest(token: str) -> str:
+    """Identifies the token written to the env file without storing the token itself."""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def load_setup_state(api_base: str = "") -> Optional[Dict[str, Any]]:
+    """Return the cached setup if the fingerprint still matches."""
+    try:
+        state = json.loads(SETUP_STATE.read_text(encoding="utf-8"))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if state.get("fingerprint") != setup_fingerprint(api_base):
+        return None
+    return state
+
+
+def save_setup_state(config: Dict[str, Any], env_token: str, api_base: str = "") -> None:
+    state = {
+        "fingerprint": setup_fingerprint(api_base),
+        "base_url": config["base_url"],
+        "models": config["models"],
+        "env_token_sha256": token_digest(env_token),
+    }
+    # Created 0600 by mkstemp and renamed into place, so it is never readable by others.
+    artifact_writer.atomic_write_text(SETUP_STATE, json.dumps(state, indent=2))
+
+
 def ensure_state_dir() -> None:
     STATE_DIR.mkdir(parents=True, exist_ok=True)
 
@@ -76,6 +152,8 @@ def load_model_config() -> Dict[str, List[str]]:
             f"Configuration file {MODEL_CONFIG} not found. "
             "Create it with `openai_api_base` and `models` entries."
         )
+    import yaml
+
     payload = yaml.safe_load(MODEL_CONFIG.read_text(encoding="utf-8"))
     base_url = payload.get("openai_api_base")
     models = payload.get("models") or []
@@ -103,10 +181,23 @@ def write_env_file(base_url: str, models: List[str], token: str) -> None:
         f"OPENAI_API_CONFIGS={json.dumps(configs)}",
         f"OPEN_WEBUI_CONFIG_DIR={STATE_DIR}",
     ]
-    ENV_FILE.write_text("\n".join(env_lines) + "\n", encoding="utf-8")
+    # Holds the bearer token: written 0600 via a temp file and an atomic rename.
+    artifact_writer.atomic_write_text(ENV_FILE, "\n".join(env_lines) + "\n")
     print(f">> Wrote Open WebUI environment file: {ENV_FILE}")
 
 
+def proxy_url(port: int) -> str:
+    return f"http://127.0.0.1:{port}/v1"
+
+
+def launch_proxy(port: int) -> subprocess.Popen:
+    print(f">> Starting Sophia caching proxy at {proxy_url(port)}")
+    return subprocess.Popen(
+        [sys.executable, str(PROJECT_ROOT / "sophia_proxy.py"), "--port", str(port)],
+        cwd=PROJECT_ROOT,
+    )
+
+
 def launch_openwebui(host: str, port: int, env: Dict[str, str]) -> None:
     if not OPENWEBUI_BIN.exists():
         raise FileNotFoundError(
@@ -130,7 +221,175 @@ def launch_openwebui(host: str, port: int, env: Dict[str, str]) -> None:
     )
 
 
-def main() -> None:
+def measure_connect(base_url: str, timeout: float) -> float:
+    """Seconds spent on TCP connect plus TLS handshake to the endpoint host."""
+    parsed = urlparse(base_url)
+    port = parsed.port or (443 if parsed.scheme == "https" else 80)
+    start = time.perf_counter()
+    with socket.create_connection((parsed.hostname, port), timeout=timeout) as sock:
+        if parsed.scheme == "https":
+            with ssl.create_default_context().wrap_socket(sock, server_hostname=parsed.hostname):
+                pass
+    return time.perf_counter() - start
+
+
+def probe_model(client: Any, model: str) -> Dict[str, Any]:
+    """Stream one tiny completion and time the first token and the full response."""
+    start = time.perf_counter()
+    ttft: Optional[float] = None
+    chunks: List[str] = []
+    with profiling.span("network", "task2.probe_model"):
+        stream = client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": "Return the single word: ok"}],
+            max_tokens=2,
+            temperature=0,
+            stream=True,
+        )
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content or ""
+            if delta and ttft is None:
+                ttft = time.perf_counter() - start
+            chunks.append(delta)
+    total = time.perf_counter() - start
+    return {"ttft": ttft if ttft is not None else total, "total": total, "text": "".join(chunks)}
+
+
+def _latency_stats(values: List[float]) -> Optional[Dict[str, float]]:
+    if not values:
+        return None
+    return {
+        "min_ms": round(min(values) * 1000, 1),
+        "mean_ms": round(statistics.fmean(values) * 1000, 1),
+        "median_ms": round(statistics.median(values) * 1000, 1),
+        "max_ms": round(max(values) * 1000, 1),
+    }
+
+
+def check_model(base_url: str, token: str, model: str, probes: int, timeout: float) -> Dict[str, Any]:
+    """Time one TCP/TLS connect, then ``probes`` completions over the client's pooled connection.
+
+    Each step is bounded by ``timeout``, so a model costs at most ``(probes + 1) * timeout``;
+    an unreachable host fails after the connect alone.
+    """
+    from openai import OpenAI
+
+    client = OpenAI(api_key=token, base_url=base_url, timeout=timeout, max_retries=0)
+    connect: List[float] = []
+    ttft: List[float] = []
+    total: List[float] = []
+    errors: List[str] = []
+    status = ""
+    try:
+        connect.append(measure_connect(base_url, timeout))
+    except OSError as e:
+        errors.append(str(e)[:200])
+    for _ in range(probes if connect else 0):
+        try:
+            probe = probe_model(client, model)
+        except Exception as e:  # noqa: BLE001
+            errors.append(str(e)[:200])
+            continue
+        ttft.append(probe["ttft"])
+        total.append(probe["total"])
+        txt = probe["text"].strip().lower()
+        status = "pass" if txt.startswith("ok") else f"unexpected: {txt[:20]}"
+    if not total:
+        status = f"fail: {errors[-1] if errors else 'no probes run'}"
+    return {
+        "status": status,
+        "probes": probes,
+        "succeeded": len(total),
+        "connect": _latency_stats(connect),
+        "ttft": _latency_stats(ttft),
+        "total": _latency_stats(total),
+        "errors": errors,
+    }
+
+
+def run_healthcheck(
+    base_url: str, models: List[str], token: str, probes: int, timeout: float
+) -> Dict[str, Any]:
+    """Probe every model concurrently; a hung model costs at most ``(probes + 1) * timeout``."""
+    with ThreadPoolExecutor(max_workers=len(models)) as pool:
+        futures = {m: pool.submit(check_model, base_url, token, m, probes, timeout) for m in models}
+        latency = {m: f.result() for m, f in futures.items()}
+    return {
+        "base_url": base_url,
+        "checked_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "probe_timeout_sec": timeout,
+        "results": {m: info["status"] for m, info in latency.items()},
+        "latency": latency,
+    }
+
+
+def load_latency_history(path: Path = HEALTHCHECK_HISTORY) -> Dict[str, Deque[float]]:
+    """Mean total latency (ms) of each model's last ``BASELINE_ROUNDS`` recorded rounds."""
+    history: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=BASELINE_ROUNDS))
+    if not path.exists():
+        return history
+    for report in artifact_writer.iter_jsonl(path):
+        for model, info in (report.get("latency") or {}).items():
+            if info.get("total"):
+                history[model].append(info["total"]["mean_ms"])
+    return history
+
+
+def degraded_baseline(past: Deque[float]) -> Optional[float]:
+    """Median of the recorded rounds, so neither one cold start nor a slow first round sets it."""
+    return statistics.median(past) if len(past) >= MIN_BASELINE_ROUNDS else None
+
+
+def run_healthcheck_loop(
+    config: Dict[str, Any], probes: int, timeout: float, watch: Optional[float], token: str
+) -> None:
+    """One healthcheck round, or with ``watch`` one round every ``watch`` seconds until Ctrl-C.
+
+    In watch mode a failed round (token refresh, probes, report write) is logged and
+    recorded in the history as an ``error`` entry, and the next round runs as usual.
+    """
+    history = load_latency_history()
+    refresh_token = False
+    while True:
+        try:
+            if refresh_token:
+                token = get_access_token()
+            report = run_healthcheck(config["base_url"], config["models"], token, probes, timeout)
+            HEALTHCHECK_PATH.parent.mkdir(parents=True, exist_ok=True)
+            HEALTHCHECK_PATH.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        except Exception as exc:  # noqa: BLE001
+            if not watch:
+                raise
+            report = {
+                "checked_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "error": f"{type(exc).__name__}: {exc}"[:500],
+            }
+            print(f"   ! Healthcheck round failed ({report['checked_at']}): {report['error']}", flush=True)
+        else:
+            print(f">> Healthcheck saved to {HEALTHCHECK_PATH} ({report['checked_at']})")
+            for model, info in report["latency"].items():
+                total = info["total"]["mean_ms"] if info["total"] else None
+                ttft = info["ttft"]["mean_ms"] if info["ttft"] else None
+                flag = ""
+                if total is not None:
+                    baseline = degraded_baseline(history[model])
+                    if baseline is not None and total > DEGRADED_FACTOR * baseline:
+                        flag = f"  DEGRADED (median of last {len(history[model])} rounds {baseline:.0f} ms)"
+                    history[model].append(total)
+                print(f"   {model}: {info['status']} ttft={ttft} ms total={total} ms{flag}")
+        if not watch:
+            return
+        try:
+            artifact_writer.append_text(HEALTHCHECK_HISTORY, json.dumps(report) + "\n")
+        except OSError as exc:
+            print(f"   ! Could not append to {HEALTHCHECK_HISTORY}: {exc}", flush=True)
+        time.sleep(watch)
+        refresh_token = True
+
+
+def main(argv: Optional[List[str]] = None) -> None:
     parser = argparse.ArgumentParser(
         description="Prepare and optionally launch Open WebUI for Sophia endpoints."
     )
@@ -155,18 +414,84 @@ def main() -> None:
         default=8080,
         help="Port for Open WebUI when using --serve.",
     )
-    args = parser.parse_args()
+    parser.add_argument(
+        "--probes",
+        type=int,
+        default=3,
+        help="Latency probes per model during --healthcheck.",
+    )
+    parser.add_argument(
+        "--probe-timeout",
+        type=float,
+        default=20.0,
+        help="Timeout in seconds for the connect test and each probe; a model takes at most (probes + 1) x this.",
+    )
+    parser.add_argument(
+        "--watch",
+        type=float,
+        metavar="SECONDS",
+        help="Re-run the healthcheck every SECONDS and append rounds to openwebui_healthcheck_history.jsonl.",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Ignore the cached setup fingerprint and redo every setup step.",
+    )
+    parser.add_argument(
+        "--wheelhouse",
+        type=Path,
+        help="Wheel cache directory; open-webui is built into it once and installed from it.",
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Install only from --wheelhouse without touching the network.",
+    )
+    parser.add_argument(
+        "--upgrade-pip",
+        action="store_true",
+        help="Upgrade pip inside a freshly created virtual environment before installing.",
+    )
+    parser.add_argument(
+        "--proxy",
+        action="store_true",
+        help="Route Open WebUI through the local caching proxy (sophia_proxy.py); launched with --serve.",
+    )
+    parser.add_argument(
+        "--proxy-port",
+        type=int,
+        default=8787,
+        help="Port for the local caching proxy when using --proxy.",
+    )
+    args = parser.parse_args(argv)
+    if args.offline and args.wheelhouse is None:
+        parser.error("--offline requires --wheelhouse")
 
-    ensure_virtualenv()
-    ensure_state_dir()
-    config = load_model_config()
+    # With --proxy, Open WebUI sees the local proxy; the proxy injects the real token itself.
+    api_base = proxy_url(args.proxy_port) if args.proxy else ""
+    state = None if args.force else load_setup_state(api_base)
+    # Always asked for: the auth helper refreshes an expired token and is cheap otherwise.
     token = get_access_token()
-    write_env_file(config["base_url"], config["models"], token)
+    env_token = "sophia-proxy" if args.proxy else token
+    if state is not None:
+        config = {"base_url": state["base_url"], "models": state["models"]}
+        if state.get("env_token_sha256") == token_digest(env_token):
+            print(">> Setup unchanged since last run; reusing .env.openwebui")
+        else:
+            print(">> Setup unchanged since last run; refreshing the token in .env.openwebui")
+            write_env_file(api_base or config["base_url"], config["models"], env_token)
+            save_setup_state(config, env_token, api_base)
+    else:
+        ensure_virtualenv(args.wheelhouse, args.offline, args.upgrade_pip)
+        ensure_state_dir()
+        config = load_model_config()
+        write_env_file(api_base or config["base_url"], config["models"], env_token)
+        save_setup_state(config, env_token, api_base)
 
     env_vars = {
         "ENABLE_OPENAI_API": "True",
-        "OPENAI_API_BASE_URLS": config["base_url"],
-        "OPENAI_API_KEYS": token,
+        "OPENAI_API_BASE_URLS": api_base or config["base_url"],
+        "OPENAI_API_KEYS": env_token,
         "OPENAI_API_CONFIGS": json.dumps(
             {
                 "0": {
@@ -184,34 +509,25 @@ def main() -> None:
     print(f"   source {VENV_DIR}/bin/activate")
     print("   set -a && source .env.openwebui && set +a  # exports OPEN_WEBUI_CONFIG_DIR automatically")
     print("   open-webui serve --host 127.0.0.1 --port 8080")
+    if args.proxy:
+        print(f"   python3 sophia_proxy.py --port {args.proxy_port}  # start the proxy first")
 
     if args.serve:
-        launch_openwebui(args.host, args.port, env_vars)
+        proxy_proc = launch_proxy(args.proxy_port) if args.proxy else None
+        try:
+            launch_openwebui(args.host, args.port, env_vars)
+        finally:
+            if proxy_proc is not None:
+                proxy_proc.terminate()
+                proxy_proc.wait()
 
-    if args.healthcheck:
+    if args.healthcheck or args.watch:
         try:
-            from openai import OpenAI
-            client = OpenAI(api_key=token, base_url=config["base_url"])
-            results: Dict[str, str] = {}
-            for m in config["models"]:
-                try:
-                    r = client.chat.completions.create(
-                        model=m,
-                        messages=[{"role": "user", "content": "Return the single word: ok"}],
-                        max_tokens=2,
-                        temperature=0,
-                    )
-                    txt = (r.choices[0].message.content or "").strip().lower()
-                    results[m] = "pass" if txt.startswith("ok") else f"unexpected: {txt[:20]}"
-                except Exception as e:  # noqa: BLE001
-                    results[m] = f"fail: {e}"
-            out = PROJECT_ROOT / "outputs" / "openwebui_healthcheck.json"
-            out.parent.mkdir(parents=True, exist_ok=True)
-            out.write_text(json.dumps({"base_url": config["base_url"], "results": results}, indent=2), encoding="utf-8")
-            print(f">> Healthcheck saved to {out}")
+            run_healthcheck_loop(config, args.probes, args.probe_timeout, args.watch, token)
+        except KeyboardInterrupt:
+            print(">> Healthcheck watch stopped.")
         except Exception as e:  # noqa: BLE001
             print(f"Healthcheck error: {e}")
 
-
 if __name__ == "__main__":
     main()
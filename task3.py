@@ -6,8 +6,9 @@ Workflow
 --------
 1. Download the HGNC complete gene list (if not present).
 2. Randomly sample 50 human genes.
-3. Query the specified LLM to classify each gene for links to cancer, heart disease,
-   diabetes, and dementia, plus suggest interactions among the selected genes.
+3. Query the specified LLM to classify each gene for links to the diseases of the
+   panel in disease_panel.yaml (cancer, heart disease, diabetes and dementia by
+   default), plus suggest interactions among the selected genes.
 4. Persist raw model output, a structured JSON report, and timing metadata.
 """
 from __future__ import annotations
@@ -17,23 +18,18 @@ import json
 import random
 import re
 import time
+from collections import Counter, deque
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
-import requests
-from openai import OpenAI
-from json_repair import repair_json
+import accounting
+import disease_panel
+import profiling
+import runcore
+import token_budget
 
-# Sophia tooling for access tokens.
 PROJECT_ROOT = Path(__file__).resolve().parent
-SOPHIA_TOOLS = PROJECT_ROOT.parent / "Sophia-tools"
-import sys
-
-if str(SOPHIA_TOOLS) not in sys.path:
-    sys.path.append(str(SOPHIA_TOOLS))
-
-from inference_auth_token import get_access_token  # type: ignore  # pylint: disable=wrong-import-position
 
 GENESET_URL = (
     "https://www.genenames.org/cgi-bin/download/custom?"
@@ -43,17 +39,40 @@ DATA_DIR = PROJECT_ROOT / "data"
 OUTPUT_DIR = PROJECT_ROOT / "outputs" / "gene_analysis"
 DEFAULT_MODEL = "meta-llama/Meta-Llama-3.1-70B-Instruct"
 MANUAL_MINUTES_PER_GENE = 4.0  # Conservative manual research estimate
+FIXED_MAX_TOKENS = 4000  # used with --fixed-max-tokens
 
 
 @dataclass
 class GeneResult:
     gene: str
-    has_cancer_link: bool
-    has_heart_disease_link: bool
-    has_diabetes_link: bool
-    has_dementia_link: bool
+    flags: int  # bit i set: linked to disease i of the disease panel
     explanation: str
     interacting_genes: List[str]
+    confidence: Optional[Dict[str, float]] = None  # per-disease vote share in self-consistency mode
+
+    def linked(self, disease: str) -> bool:
+        return bool(self.flags & disease_panel.current().bit(disease))
+
+    def to_record(self) -> Dict[str, Any]:
+        """results.json row: the mask plus one `has_<disease>_link` bool per panel disease."""
+        return {
+            "gene": self.gene,
+            "flags": self.flags,
+            **disease_panel.current().record_flags(self.flags),
+            "explanation": self.explanation,
+            "interacting_genes": self.interacting_genes,
+            "confidence": self.confidence,
+        }
+
+    @classmethod
+    def from_record(cls, record: Dict[str, Any]) -> "GeneResult":
+        return cls(
+            gene=record["gene"],
+            flags=disease_panel.current().mask_from_record(record),
+            explanation=record["explanation"],
+            interacting_genes=list(record.get("interacting_genes") or []),
+            confidence=record.get("confidence"),
+        )
 
 
 def ensure_gene_catalog() -> Path:
@@ -61,6 +80,8 @@ def ensure_gene_catalog() -> Path:
     local_path = DATA_DIR / "approved_gene_symbols.txt"
     if local_path.exists():
         return local_path
+    import requests
+
     print(">> Downloading Approved Human Gene symbol list...")
     response = requests.get(GENESET_URL, timeout=60)
     response.raise_for_status()
@@ -89,15 +110,16 @@ def sample_genes(symbols: List[str], count: int, seed: int | None = 42) -> List[
 
 def build_prompt(genes: List[str]) -> List[Dict[str, str]]:
     gene_list = ", ".join(genes)
+    panel = disease_panel.current()
     json_schema = {
         "genes": [
             {
                 "symbol": "TP53",
                 "diseases": {
-                    "cancer": {"associated": True, "evidence": "BRIEF RATIONALE"},
-                    "heart_disease": {"associated": False, "evidence": "Why not"},
-                    "diabetes": {"associated": False, "evidence": "Why not"},
-                    "dementia": {"associated": False, "evidence": "Why not"},
+                    d.key: {"associated": True, "evidence": "BRIEF RATIONALE"}
+                    if i == 0
+                    else {"associated": False, "evidence": "Why not"}
+                    for i, d in enumerate(panel)
                 },
                 "interactions": {
                     "has_interactions": True,
@@ -118,6 +140,9 @@ def build_prompt(genes: List[str]) -> List[Dict[str, str]]:
         "- For interactions, only list other genes from the provided list.\n"
         "- Return valid JSON. No markdown, no commentary."
     )
+    described = [f"`{d.key}` = {d.description}" for d in panel if d.description]
+    if described:
+        user_prompt += "\n- Disease keys: " + "; ".join(described) + "."
     return [
         {
             "role": "system",
@@ -130,40 +155,70 @@ def build_prompt(genes: List[str]) -> List[Dict[str, str]]:
     ]
 
 
-def call_model(model: str, messages: List[Dict[str, str]], timeout: int = 180) -> str:
-    token = get_access_token()
-    client = OpenAI(
-        api_key=token,
-        base_url="https://inference-api.alcf.anl.gov/resource_server/sophia/vllm/v1",
+def call_model(
+    model: str,
+    messages: List[Dict[str, str]],
+    timeout: int = 180,
+    budget: Optional[token_budget.TokenBudget] = None,
+    gene_count: int = 10,
+) -> runcore.ChatResult:
+    return token_budget.chat(
+        budget,
+        "sophia",
+        model,
+        messages,
+        gene_count,
         timeout=timeout,
-    )
-    response = client.chat.completions.create(
-        model=model,
-        messages=messages,
+        fixed_max_tokens=FIXED_MAX_TOKENS,
         temperature=0.2,
-        max_tokens=4000,
     )
-    return response.choices[0].message.content.strip()
+
+
+def call_model_samples(
+    model: str,
+    messages: List[Dict[str, str]],
+    samples: int,
+    temperature: float,
+    timeout: int = 180,
+    budget: Optional[token_budget.TokenBudget] = None,
+    gene_count: int = 10,
+) -> runcore.SampleSet:
+    return token_budget.sample(
+        budget,
+        "sophia",
+        model,
+        messages,
+        gene_count,
+        samples,
+        timeout=timeout,
+        fixed_max_tokens=FIXED_MAX_TOKENS,
+        temperature=temperature,
+    )
 
 
 def extract_json(text: str) -> Dict[str, Any]:
-    cleaned = text.strip()
-    if cleaned.startswith("```"):
-        cleaned = re.sub(r"^```json\s*", "", cleaned, flags=re.IGNORECASE)
-        cleaned = cleaned.rstrip("` \n")
-        cleaned = cleaned.rstrip("```")
-    try:
-        return json.loads(cleaned)
-    except json.JSONDecodeError as exc:
+    with profiling.span("parse", "task3.extract_json"):
+        cleaned = text.strip()
+        if cleaned.startswith("```"):
+            cleaned = re.sub(r"^```json\s*", "", cleaned, flags=re.IGNORECASE)
+            cleaned = cleaned.rstrip("` \n")
+            cleaned = cleaned.rstrip("```")
         try:
-            repaired = repair_json(cleaned)
-            return json.loads(repaired)
-        except Exception as repair_exc:
-            raise ValueError(f"Model response was not valid JSON: {exc}\n{text}") from repair_exc
+            return json.loads(cleaned)
+        except json.JSONDecodeError as exc:
+            try:
+                with profiling.span("parse", "json_repair"):
+                    from json_repair import repair_json
+
+                    repaired = repair_json(cleaned)
+                    return json.loads(repaired)
+            except Exception as repair_exc:
+                raise ValueError(f"Model response was not valid JSON: {exc}\n{text}") from repair_exc
 
 
 def parse_results(payload: Dict[str, Any], expected_genes: List[str]) -> List[GeneResult]:
     results: List[GeneResult] = []
+    panel = disease_panel.current()
     genes = payload.get("genes", [])
     if not isinstance(genes, list):
         raise ValueError("JSON missing 'genes' array.")
@@ -177,18 +232,8 @@ def parse_results(payload: Dict[str, Any], expected_genes: List[str]) -> List[Ge
             results.append(
                 GeneResult(
                     gene=symbol,
-                    has_cancer_link=bool(diseases["cancer"]["associated"]),
-                    has_heart_disease_link=bool(diseases["heart_disease"]["associated"]),
-                    has_diabetes_link=bool(diseases["diabetes"]["associated"]),
-                    has_dementia_link=bool(diseases["dementia"]["associated"]),
-                    explanation=" ".join(
-                        [
-                            diseases["cancer"]["evidence"],
-                            diseases["heart_disease"]["evidence"],
-                            diseases["diabetes"]["evidence"],
-                            diseases["dementia"]["evidence"],
-                        ]
-                    ),
+                    flags=panel.pack({k: diseases[k]["associated"] for k in panel.keys}),
+                    explanation=" ".join(diseases[k]["evidence"] for k in panel.keys),
                     interacting_genes=list(interactions.get("partners", []))
                     if interactions.get("has_interactions")
                     else [],
@@ -202,15 +247,148 @@ def parse_results(payload: Dict[str, Any], expected_genes: List[str]) -> List[Ge
     return results
 
 
+def vote_results(samples: List[List[GeneResult]], genes: List[str]) -> List[GeneResult]:
+    """Majority vote per gene and disease over parsed samples; ties resolve to False.
+
+    ``confidence`` records the share of samples agreeing with the voted flag. Partners
+    are kept when a majority of samples list them; the explanation comes from the
+    sample that agrees with the most voted flags.
+    """
+    panel = disease_panel.current()
+    by_sample = [{r.gene: r for r in results} for results in samples]
+    voted: List[GeneResult] = []
+    for gene in genes:
+        votes = [s[gene] for s in by_sample if gene in s]
+        if not votes:
+            continue
+        yes = panel.counts(v.flags for v in votes)
+        flags = panel.pack({d: n * 2 > len(votes) for d, n in yes.items()})
+        confidence = {d: round(max(n, len(votes) - n) / len(votes), 3) for d, n in yes.items()}
+        partner_counts = Counter(p for v in votes for p in dict.fromkeys(v.interacting_genes))
+        best = max(votes, key=lambda v: panel.agreement(v.flags, flags))
+        voted.append(
+            GeneResult(
+                gene=gene,
+                flags=flags,
+                explanation=best.explanation,
+                interacting_genes=[p for p, c in partner_counts.items() if c * 2 > len(votes)],
+                confidence=confidence,
+            )
+        )
+    return voted
+
+
+def vote_batch(
+    texts: List[str],
+    genes: List[str],
+    parse: Callable[[Dict[str, Any], List[str]], List[GeneResult]],
+) -> Tuple[List[GeneResult], List[Dict[str, Any]]]:
+    """Parse every sample with ``parse`` (dropping unparseable ones) and vote."""
+    parsed: List[List[GeneResult]] = []
+    payloads: List[Dict[str, Any]] = []
+    for text in texts:
+        try:
+            payload = extract_json(text)
+            parsed.append(parse(payload, genes))
+        except ValueError as exc:
+            print(f"   ! Discarding one sample: {str(exc).splitlines()[0]}")
+            continue
+        payloads.append(payload)
+    if not parsed:
+        raise ValueError(f"None of the {len(texts)} samples for {genes} could be parsed.")
+    return vote_results(parsed, genes), payloads
+
+
+class ConsistencyTracker:
+    """Accumulates cost and latency of k-sample batches and estimates the k=1 equivalent."""
+
+    def __init__(self, samples: int, temperature: float) -> None:
+        self.samples = samples
+        self.temperature = temperature
+        self.batches: List[runcore.SampleSet] = []
+        self.single_latencies: List[float] = []
+        self.calibration: List[runcore.ChatResult] = []  # k=1 probes, kept out of the run's totals
+
+    @property
+    def needs_calibration(self) -> bool:
+        """True while only n-mode batches ran, so no k=1 latency has been observed yet."""
+        return bool(self.batches) and not self.single_latencies
+
+    def add(self, sample_set: runcore.SampleSet) -> None:
+        self.batches.append(sample_set)
+        if sample_set.mode == "parallel":
+            # Each concurrent request is itself a k=1 call.
+            self.single_latencies.extend(sample_set.request_latencies)
+
+    def calibrate(self, probe: runcore.ChatResult) -> None:
+        self.calibration.append(probe)
+        self.single_latencies.append(probe.latency_sec)
+
+    def report(self, results: List[GeneResult]) -> Dict[str, Any]:
+        wall = sum(b.latency_sec for b in self.batches)
+        single_latency = (
+            len(self.batches) * sum(self.single_latencies) / len(self.single_latencies)
+            if self.single_latencies
+            else None
+        )
+        singles = [b.single_sample_tokens() for b in self.batches]
+        tokens = (
+            sum((b.prompt_tokens or 0) + (b.completion_tokens or 0) for b in self.batches)
+            if None not in singles
+            else None
+        )
+        single_tokens = sum(singles) if None not in singles else None  # type: ignore[arg-type]
+        confident = [r.confidence for r in results if r.confidence]
+        return {
+            "samples": self.samples,
+            "temperature": self.temperature,
+            "modes": sorted({b.mode for b in self.batches}),
+            "requests": sum(b.requests for b in self.batches),
+            "latency_sec": round(wall, 3),
+            "est_single_sample_latency_sec": round(single_latency, 3) if single_latency else None,
+            "latency_overhead": round(wall / single_latency, 2) if single_latency else None,
+            "tokens": tokens,
+            "est_single_sample_tokens": round(single_tokens) if single_tokens else None,
+            "token_overhead": round(tokens / single_tokens, 2) if tokens and single_tokens else None,
+            "calibration": {
+                "requests": len(self.calibration),
+                "latency_sec": round(sum(r.latency_sec for r in self.calibration), 3),
+                "tokens": sum((r.prompt_tokens or 0) + (r.completion_tokens or 0) for r in self.calibration),
+            },
+            "mean_confidence": {
+                d: round(sum(c[d] for c in confident) / len(confident), 3) for d in disease_panel.current().keys
+            }
+            if confident
+            else None,
+            "low_confidence_genes": sorted(
+                r.gene for r in results if r.confidence and min(r.confidence.values()) < 0.75
+            ),
+        }
+
+
+def add_sampling_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--samples",
+        type=int,
+        default=1,
+        help="Self-consistency: samples per batch, majority-voted per disease flag (1 = single call).",
+    )
+    parser.add_argument(
+        "--sample-temperature",
+        type=float,
+        default=0.7,
+        help="Sampling temperature used when --samples > 1.",
+    )
+
+
+def format_samples(texts: List[str]) -> str:
+    return "\n\n".join(f"--- sample {i} ---\n{text}" for i, text in enumerate(texts, start=1))
+
+
 def summarize(results: List[GeneResult]) -> Dict[str, Any]:
     aggregated = {
         "total_genes": len(results),
-        "disease_counts": {
-            "cancer": sum(r.has_cancer_link for r in results),
-            "heart_disease": sum(r.has_heart_disease_link for r in results),
-            "diabetes": sum(r.has_diabetes_link for r in results),
-            "dementia": sum(r.has_dementia_link for r in results),
-        },
+        "disease_counts": disease_panel.current().counts(r.flags for r in results),
         "genes_with_interactions": [
             {"gene": r.gene, "partners": r.interacting_genes}
             for r in results
@@ -222,20 +400,15 @@ def summarize(results: List[GeneResult]) -> Dict[str, Any]:
 
 def write_spot_audit(results: List[GeneResult], genes: List[str], output_dir: Path) -> None:
     by_gene = {r.gene: r for r in results}
+    panel = disease_panel.current()
     lines = ["# Spot Audit", ""]
     for g in genes:
         r = by_gene.get(g)
         if not r:
             lines.append(f"- {g}: not present in this run")
             continue
-        lines.append(
-            (
-                f"- {g}: cancer={r.has_cancer_link}, heart={r.has_heart_disease_link}, "
-                f"diabetes={r.has_diabetes_link}, dementia={r.has_dementia_link}"
-            )
-        )
-    output_dir.mkdir(parents=True, exist_ok=True)
-    (output_dir / "spot_audit.md").write_text("\n".join(lines) + "\n", encoding="utf-8")
+        lines.append(f"- {g}: " + ", ".join(f"{d}={linked}" for d, linked in panel.unpack(r.flags).items()))
+    runcore.write_text(output_dir / "spot_audit.md", "\n".join(lines) + "\n")
 
 
 def save_outputs(
@@ -247,40 +420,84 @@ def save_outputs(
     runtime_sec: float,
     model: str,
     output_dir: Path,
+    reused_genes: int = 0,
+    self_consistency: Optional[Dict[str, Any]] = None,
+    backend_stats: Optional[Dict[str, Any]] = None,
+    budget_stats: Optional[Dict[str, Any]] = None,
+    accounting_stats: Optional[Dict[str, Any]] = None,
 ) -> None:
-    output_dir.mkdir(parents=True, exist_ok=True)
-    (output_dir / "selected_genes.json").write_text(
-        json.dumps({"genes": genes}, indent=2),
-        encoding="utf-8",
-    )
-    (output_dir / "raw_model_responses.json").write_text(
-        json.dumps(raw_batches, indent=2),
-        encoding="utf-8",
-    )
-    (output_dir / "structured_responses.json").write_text(
-        json.dumps(payloads, indent=2),
-        encoding="utf-8",
-    )
-    (output_dir / "results.json").write_text(
-        json.dumps([result.__dict__ for result in results], indent=2),
-        encoding="utf-8",
-    )
+    runcore.write_json(output_dir / "selected_genes.json", {"genes": genes})
+    runcore.write_json(output_dir / "raw_model_responses.json", raw_batches)
+    runcore.write_json(output_dir / "structured_responses.json", payloads)
+    runcore.write_json(output_dir / "results.json", [result.to_record() for result in results])
     report = {
         "model": model,
         "runtime_seconds": runtime_sec,
         "manual_estimate_minutes": MANUAL_MINUTES_PER_GENE * len(genes),
+        "reused_from_store": reused_genes,
+        "disease_panel": disease_panel.current().keys,
         "summary": summary,
     }
-    (output_dir / "summary.json").write_text(json.dumps(report, indent=2), encoding="utf-8")
+    if self_consistency is not None:
+        report["self_consistency"] = self_consistency
+    if backend_stats is not None:
+        report["backend_stats"] = backend_stats
+    if budget_stats is not None:
+        report["token_budget"] = budget_stats
+    if accounting_stats is not None:
+        report["accounting"] = accounting_stats
+    runcore.write_json(output_dir / "summary.json", report)
 
     md_lines = [
         "# Gene Analysis Summary",
         f"- Model: `{model}`",
         f"- Runtime (sec): {runtime_sec:.2f}",
         f"- Estimated manual time (minutes): {report['manual_estimate_minutes']:.1f}",
+        f"- Genes reused from the gene store: {reused_genes}",
+    ]
+    if self_consistency is not None:
+        sc = self_consistency
+        md_lines += [
+            f"- Self-consistency: {sc['samples']} samples/batch at temperature {sc['temperature']} "
+            f"({', '.join(sc['modes']) or 'no new batches'}, {sc['requests']} requests)",
+            f"- Overhead vs. 1 sample: latency x{sc['latency_overhead'] or '?'}, tokens x{sc['token_overhead'] or '?'}"
+            + (
+                f" (from {sc['calibration']['requests']} k=1 calibration call, "
+                f"{sc['calibration']['latency_sec']}s / {sc['calibration']['tokens']} tokens, not in the totals)"
+                if sc["calibration"]["requests"]
+                else ""
+            ),
+            f"- Low-confidence genes (<75% agreement): {', '.join(sc['low_confidence_genes']) or 'none'}",
+        ]
+    if backend_stats is not None and backend_stats.get("backend") == "ollama":
+        bs = backend_stats
+        md_lines.append(
+            f"- Ollama: preload {bs['preload_sec'] if bs['preload_sec'] is not None else '-'}s, "
+            f"load during requests {bs['load_sec']}s, prompt eval {bs['prompt_eval_sec']}s, "
+            f"generation {bs['eval_sec']}s ({bs['eval_tokens_per_sec'] or '-'} tok/s), "
+            f"{bs['parallel_requests']} parallel requests"
+        )
+    if budget_stats is not None:
+        md_lines.append(
+            f"- Output-token budget: ~{budget_stats['tokens_per_gene_estimate']} tokens/gene, "
+            f"{budget_stats['truncations']} truncated responses ({budget_stats['retries']} retried), "
+            f"{budget_stats['reserved_utilization'] or '-'} of reserved tokens used"
+        )
+    if accounting_stats is not None and accounting_stats["requests"]:
+        acc = accounting_stats
+        md_lines.append(
+            f"- Tokens: {acc['total_tokens']} ({acc['prompt_tokens']} prompt + {acc['completion_tokens']} completion) "
+            f"over {acc['requests']} requests; {acc['tokens_per_gene'] or '-'} tokens/gene, "
+            f"{acc['genes_per_sec'] or '-'} genes/sec"
+        )
+        if acc["budget"]["stopped"]:
+            md_lines.append(
+                f"- Stopped by the {acc['budget']['stopped']}: {len(acc['budget']['skipped_genes'])} genes not queried"
+            )
+    md_lines += [
         "",
         "## Disease Counts",
-        *[f"- **{disease.replace('_', ' ').title()}**: {count}" for disease, count in summary["disease_counts"].items()],
+        *[f"- **{d.label}**: {summary['disease_counts'][d.key]}" for d in disease_panel.current()],
         "",
         "## Genes With Reported Interactions",
     ]
@@ -291,10 +508,10 @@ def save_outputs(
     else:
         md_lines.append("- None reported")
 
-    (output_dir / "summary.md").write_text("\n".join(md_lines) + "\n", encoding="utf-8")
+    runcore.write_text(output_dir / "summary.md", "\n".join(md_lines) + "\n")
 
 
-def main() -> None:
+def main(argv: Optional[List[str]] = None) -> None:
     parser = argparse.ArgumentParser(description="Run the gene-disease analysis workflow.")
     parser.add_argument("--model", default=DEFAULT_MODEL, help="Sophia model identifier.")
     parser.add_argument("--gene-count", type=int, default=50, help="Number of random genes.")
@@ -304,7 +521,15 @@ def main() -> None:
         default=42,
         help="Random seed for reproducible gene sampling.",
     )
-    args = parser.parse_args()
+    import gene_store
+
+    gene_store.add_store_arguments(parser)
+    add_sampling_arguments(parser)
+    token_budget.add_budget_arguments(parser)
+    accounting.add_accounting_arguments(parser)
+    disease_panel.add_panel_arguments(parser)
+    args = parser.parse_args(argv)
+    disease_panel.from_args(args)
 
     catalog_path = ensure_gene_catalog()
     symbols = load_gene_symbols(catalog_path)
@@ -315,25 +540,69 @@ def main() -> None:
     raw_batches: List[Dict[str, Any]] = []
     payloads: List[Dict[str, Any]] = []
     aggregated_results: List[GeneResult] = []
+    tracker = ConsistencyTracker(args.samples, args.sample_temperature) if args.samples > 1 else None
+    budget = token_budget.from_args(args)
+    acct = accounting.RunAccounting(args.token_budget, args.time_budget, samples=args.samples)
 
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-
-    for batch_idx in range(0, len(genes), batch_size):
-        batch_genes = genes[batch_idx : batch_idx + batch_size]
+    store = gene_store.open_store(args)
+    known, pending = gene_store.split_known(None if args.refresh else store, args.model, genes)
+    if known:
+        print(f">> {len(known)} genes already in the gene store; querying {len(pending)} new genes.")
+    aggregated_results.extend(known.values())
+
+    batches = deque(pending[i : i + batch_size] for i in range(0, len(pending), batch_size))
+    batch_no = 0
+    while batches:
+        batch_genes = batches.popleft()
+        allowed = acct.admit(batch_no + 1, len(batch_genes), accounting.prompt_tokens(build_prompt(batch_genes)))
+        if allowed == 0:
+            acct.skip(batch_genes + [g for rest in batches for g in rest])
+            print(f">> {acct.stop_reason.capitalize()} reached; skipping {len(acct.skipped_genes)} genes.")
+            break
+        if allowed < len(batch_genes):
+            print(f">> Shrinking batch to {allowed} genes to stay within the budget.")
+            batches.appendleft(batch_genes[allowed:])
+            batch_genes = batch_genes[:allowed]
+        batch_no += 1
         messages = build_prompt(batch_genes)
-        start = time.perf_counter()
-        raw_text = call_model(args.model, messages)
-        runtime_total += time.perf_counter() - start
-        raw_batches.append({"batch": batch_idx // batch_size + 1, "genes": batch_genes, "response": raw_text})
-        (OUTPUT_DIR / f"raw_batch_{batch_idx // batch_size + 1:02d}.txt").write_text(raw_text, encoding="utf-8")
-        payload = extract_json(raw_text)
-        payloads.append(payload)
-        batch_results = parse_results(payload, batch_genes)
+        with runcore.track_usage() as usage:
+            if tracker is not None:
+                sample_set = call_model_samples(
+                    args.model, messages, args.samples, args.sample_temperature, budget=budget, gene_count=len(batch_genes)
+                )
+                runtime_total += sample_set.latency_sec
+                tracker.add(sample_set)
+                raw_batches.append(
+                    {"batch": batch_no, "genes": batch_genes, "response": sample_set.texts[0], "samples": sample_set.texts}
+                )
+                runcore.write_text(OUTPUT_DIR / f"raw_batch_{batch_no:02d}.txt", format_samples(sample_set.texts))
+                batch_results, sample_payloads = vote_batch(sample_set.texts, batch_genes, parse_results)
+                payloads.append({"batch": batch_no, "samples": sample_payloads})
+            else:
+                start = time.perf_counter()
+                raw_text = call_model(args.model, messages, budget=budget, gene_count=len(batch_genes)).text
+                runtime_total += time.perf_counter() - start
+                raw_batches.append({"batch": batch_no, "genes": batch_genes, "response": raw_text})
+                runcore.write_text(OUTPUT_DIR / f"raw_batch_{batch_no:02d}.txt", raw_text)
+                payload = extract_json(raw_text)
+                payloads.append(payload)
+                batch_results = parse_results(payload, batch_genes)
+        acct.record(batch_no, len(batch_genes), usage)
+        if tracker is not None and tracker.needs_calibration:
+            # One extra k=1 call so the latency overhead of n-mode sampling can be reported. It runs
+            # outside `track_usage`, so neither the token budget nor the runtime is charged for it.
+            tracker.calibrate(call_model(args.model, messages, budget=budget, gene_count=len(batch_genes)))
         aggregated_results.extend(batch_results)
+        if store is not None:
+            store.put_many(args.model, "sophia", batch_results)
+    acct.finish()
+    if store is not None:
+        store.close()
 
-    # Sort aggregated results to match the original gene order
+    # Sort aggregated results to match the original gene order (genes skipped by a budget are left out)
     results_by_gene = {result.gene: result for result in aggregated_results}
-    ordered_results = [results_by_gene[g] for g in genes]
+    ordered_results = [results_by_gene[g] for g in genes if g in results_by_gene]
 
     summary = summarize(ordered_results)
     save_outputs(
@@ -345,10 +614,15 @@ def main() -> None:
         runtime_total,
         args.model,
         OUTPUT_DIR,
+        reused_genes=len(known),
+        self_consistency=tracker.report(ordered_results) if tracker is not None else None,
+        budget_stats=budget.report() if budget is not None else None,
+        accounting_stats=acct.report(),
     )
 
     # Write a simple spot-audit for canonical genes if present
     write_spot_audit(ordered_results, ["TP53", "BRCA1"], OUTPUT_DIR)
+    runcore.flush_outputs()
 
     print(f">> Completed gene analysis with {args.model} in {runtime_total:.2f} seconds.")
     print(f">> Outputs written to {OUTPUT_DIR}")
@@ -9,18 +9,26 @@ backend for a local Ollama instance. It measures runtime and stores outputs in
 from __future__ import annotations
 
 import argparse
-import json
 import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Dict, List
-
-import requests
+from typing import Any, Deque, Dict, List, Optional, Tuple
 
+import accounting
+import disease_panel
+import gene_store
+import runcore
 import task3
+import token_budget
+
+OMITTED_EXPLANATION = "Model omitted this gene in the JSON output."
 
 
 def coerce_results(payload: Dict[str, Any], expected_genes: List[str]) -> List[task3.GeneResult]:
     results: Dict[str, task3.GeneResult] = {}
+    panel = disease_panel.current()
     for entry in payload.get("genes", []):
         try:
             symbol = entry["symbol"]
@@ -30,18 +38,8 @@ def coerce_results(payload: Dict[str, Any], expected_genes: List[str]) -> List[t
             interactions = entry["interactions"]
             results[symbol] = task3.GeneResult(
                 gene=symbol,
-                has_cancer_link=bool(diseases["cancer"]["associated"]),
-                has_heart_disease_link=bool(diseases["heart_disease"]["associated"]),
-                has_diabetes_link=bool(diseases["diabetes"]["associated"]),
-                has_dementia_link=bool(diseases["dementia"]["associated"]),
-                explanation=" ".join(
-                    [
-                        diseases["cancer"]["evidence"],
-                        diseases["heart_disease"]["evidence"],
-                        diseases["diabetes"]["evidence"],
-                        diseases["dementia"]["evidence"],
-                    ]
-                ),
+                flags=panel.pack({k: diseases[k]["associated"] for k in panel.keys}),
+                explanation=" ".join(diseases[k]["evidence"] for k in panel.keys),
                 interacting_genes=list(interactions.get("partners", []))
                 if interactions.get("has_interactions")
                 else [],
@@ -53,42 +51,92 @@ def coerce_results(payload: Dict[str, Any], expected_genes: List[str]) -> List[t
         if gene not in results:
             results[gene] = task3.GeneResult(
                 gene=gene,
-                has_cancer_link=False,
-                has_heart_disease_link=False,
-                has_diabetes_link=False,
-                has_dementia_link=False,
-                explanation="Model omitted this gene in the JSON output.",
+                flags=0,
+                explanation=OMITTED_EXPLANATION,
                 interacting_genes=[],
             )
     return list(results.values())
 
 PROJECT_ROOT = Path(__file__).resolve().parent
 OUTPUT_BASE = PROJECT_ROOT / "outputs" / "gene_analysis_local"
-OLLAMA_CHAT_URL = "http://localhost:11434/api/chat"
 
 
-def call_ollama(model: str, messages: List[Dict[str, str]], timeout: int = 240) -> str:
-    payload = {
-        "model": model,
-        "messages": messages,
-        "format": "json",
-        "stream": False,
+def call_ollama(model: str, messages: List[Dict[str, str]], timeout: int = 240, **options: Any) -> runcore.ChatResult:
+    return runcore.chat("ollama", model, messages, timeout=timeout, format="json", **options)
+
+
+def ollama_options(args: argparse.Namespace) -> Dict[str, Any]:
+    """keep_alive plus runtime options; unset ones are left to the server defaults."""
+    return {
+        "keep_alive": args.keep_alive,
+        "num_thread": args.num_thread,
+        "num_ctx": args.num_ctx,
+        "num_predict": args.num_predict,
     }
-    response = requests.post(OLLAMA_CHAT_URL, json=payload, timeout=timeout)
-    response.raise_for_status()
-    data = response.json()
-    if "message" in data and "content" in data["message"]:
-        return data["message"]["content"]
-    if "response" in data:
-        return data["response"]
-    raise ValueError(f"Unexpected Ollama response payload: {json.dumps(data)[:200]}")
+
+
+@dataclass
+class BatchResponse:
+    texts: List[str]
+    server_timings: Dict[str, float]
+    completion_tokens: int
+    sample_set: Optional[runcore.SampleSet] = None
+    usage: Optional[runcore.Usage] = None
+
+
+def query_batch(
+    model: str,
+    genes: List[str],
+    samples: int,
+    temperature: float,
+    options: Dict[str, Any],
+    budget: Optional[token_budget.TokenBudget] = None,
+) -> BatchResponse:
+    messages = task3.build_prompt(genes)
+    with runcore.track_usage() as usage:
+        if samples > 1:
+            sample_set = token_budget.sample(
+                budget, "ollama", model, messages, len(genes), samples, timeout=240, format="json",
+                temperature=temperature, **options
+            )
+            return BatchResponse(
+                sample_set.texts, sample_set.server_timings, sample_set.completion_tokens or 0, sample_set, usage
+            )
+        result = token_budget.chat(budget, "ollama", model, messages, len(genes), timeout=240, format="json", **options)
+    return BatchResponse([result.text], result.server_timings or {}, result.completion_tokens or 0, usage=usage)
+
+
+def backend_report(
+    args: argparse.Namespace, preload: Optional[Dict[str, float]], responses: List[BatchResponse]
+) -> Dict[str, Any]:
+    timings: Dict[str, float] = {}
+    for response in responses:
+        runcore.add_timings(timings, response.server_timings)
+    generated = sum(r.completion_tokens for r in responses)
+    return {
+        "backend": "ollama",
+        "parallel_requests": args.parallel,
+        "options": {k: v for k, v in ollama_options(args).items() if v is not None},
+        "preload_sec": round(preload["wall"], 3) if preload else None,
+        "preload_load_sec": round(preload.get("load", 0.0), 3) if preload else None,
+        "load_sec": round(timings.get("load", 0.0), 3),
+        "prompt_eval_sec": round(timings.get("prompt_eval", 0.0), 3),
+        "eval_sec": round(timings.get("eval", 0.0), 3),
+        "generated_tokens": generated,
+        "eval_tokens_per_sec": round(generated / timings["eval"], 1) if timings.get("eval") else None,
+    }
+
+
+def answered_results(payload: Dict[str, Any], expected_genes: List[str]) -> List[task3.GeneResult]:
+    """coerce_results without the placeholders for omitted genes, so omissions do not vote."""
+    return [r for r in coerce_results(payload, expected_genes) if r.explanation != OMITTED_EXPLANATION]
 
 
 def sanitize_model_name(model: str) -> str:
     return model.replace("/", "_").replace(":", "_")
 
 
-def main() -> None:
+def main(argv: Optional[List[str]] = None) -> None:
     parser = argparse.ArgumentParser(
         description="Execute the gene analysis workflow against a local Ollama model."
     )
@@ -106,39 +154,122 @@ def main() -> None:
         help="Genes per Ollama request (smaller batches improve JSON compliance).",
     )
     parser.add_argument("--seed", type=int, default=42, help="Random seed.")
-    args = parser.parse_args()
+    parser.add_argument("--keep-alive", default="30m", help="How long Ollama keeps the model loaded (e.g. 30m, -1).")
+    parser.add_argument("--num-thread", type=int, help="Ollama num_thread (CPU threads per request).")
+    parser.add_argument("--num-ctx", type=int, help="Ollama num_ctx (context window).")
+    parser.add_argument(
+        "--num-predict", type=int, help="Fixed Ollama num_predict for every batch (default: sized per batch)."
+    )
+    parser.add_argument(
+        "--parallel",
+        type=int,
+        default=runcore.ollama_parallel_slots(),
+        help="Concurrent batch requests; match the server's OLLAMA_NUM_PARALLEL (default: that env var or 1).",
+    )
+    parser.add_argument("--no-preload", action="store_true", help="Skip loading the model before the first batch.")
+    gene_store.add_store_arguments(parser)
+    task3.add_sampling_arguments(parser)
+    token_budget.add_budget_arguments(parser)
+    accounting.add_accounting_arguments(parser)
+    disease_panel.add_panel_arguments(parser)
+    args = parser.parse_args(argv)
+    disease_panel.from_args(args)
 
     catalog_path = task3.ensure_gene_catalog()
     symbols = task3.load_gene_symbols(catalog_path)
     genes = task3.sample_genes(symbols, args.gene_count, seed=args.seed)
 
-    runtime_total = 0.0
     raw_batches: List[Dict[str, Any]] = []
     payloads: List[Dict[str, Any]] = []
     aggregated_results: List[task3.GeneResult] = []
+    tracker = task3.ConsistencyTracker(args.samples, args.sample_temperature) if args.samples > 1 else None
 
     model_dir = OUTPUT_BASE / sanitize_model_name(args.model)
     model_dir.mkdir(parents=True, exist_ok=True)
+    store = gene_store.open_store(args)
+    known, pending = gene_store.split_known(None if args.refresh else store, args.model, genes)
+    if known:
+        print(f">> {len(known)} genes already in the gene store; querying {len(pending)} new genes.")
+    aggregated_results.extend(known.values())
+
+    options = ollama_options(args)
+    # An explicit --num-predict is a fixed cap; otherwise num_predict is sized per batch.
+    budget = token_budget.from_args(args) if args.num_predict is None else None
+    acct = accounting.RunAccounting(args.token_budget, args.time_budget, samples=args.samples)
+    preload: Optional[Dict[str, float]] = None
+    if pending and not args.no_preload:
+        # Same runner options as the batches (num_predict aside), or Ollama reloads on the first one.
+        runner_options = {k: v for k, v in ollama_options(args).items() if k != "num_predict"}
+        preload = runcore.get_backend("ollama").preload(args.model, **runner_options)
+        print(f">> Preloaded {args.model} in {preload['wall']:.2f}s (load {preload.get('load', 0.0):.2f}s)")
 
-    for batch_idx in range(0, len(genes), args.batch_size):
-        batch_genes = genes[batch_idx : batch_idx + args.batch_size]
-        messages = task3.build_prompt(batch_genes)
-        start = time.perf_counter()
-        raw_text = call_ollama(args.model, messages)
-        runtime_total += time.perf_counter() - start
-        raw_batches.append(
-            {"batch": batch_idx // args.batch_size + 1, "genes": batch_genes, "response": raw_text}
-        )
-        (model_dir / f"raw_batch_{batch_idx // args.batch_size + 1:02d}.txt").write_text(
-            raw_text, encoding="utf-8"
-        )
-        payload = task3.extract_json(raw_text)
-        payloads.append(payload)
-        batch_results = coerce_results(payload, batch_genes)
-        aggregated_results.extend(batch_results)
+    queued = deque(pending[i : i + args.batch_size] for i in range(0, len(pending), args.batch_size))
+    responses: List[BatchResponse] = []
+    start = time.perf_counter()
+    slots = max(1, args.parallel)
+    with ThreadPoolExecutor(max_workers=slots) as pool:
+        in_flight: Deque[Tuple[int, List[str], "Future[BatchResponse]"]] = deque()
+        dispatched = 0
+        while queued or in_flight:
+            # Batches are admitted against the budgets when a slot frees up, not all up front.
+            while queued and len(in_flight) < slots:
+                batch_genes = queued.popleft()
+                prompt = accounting.prompt_tokens(task3.build_prompt(batch_genes))
+                allowed = acct.admit(dispatched + 1, len(batch_genes), prompt)
+                if allowed == 0:
+                    queued.appendleft(batch_genes)
+                    break
+                if allowed < len(batch_genes):
+                    print(f">> Shrinking batch to {allowed} genes to stay within the budget.")
+                    queued.appendleft(batch_genes[allowed:])
+                    batch_genes = batch_genes[:allowed]
+                dispatched += 1
+                future = pool.submit(
+                    query_batch, args.model, batch_genes, args.samples, args.sample_temperature, options, budget
+                )
+                in_flight.append((dispatched, batch_genes, future))
+            if acct.stop_reason is not None and queued:
+                acct.skip([g for rest in queued for g in rest])
+                queued.clear()
+                print(f">> {acct.stop_reason.capitalize()} reached; skipping {len(acct.skipped_genes)} genes.")
+            if not in_flight:
+                break
+            # Consume in submission order so outputs do not depend on completion order.
+            batch_no, batch_genes, future = in_flight.popleft()
+            response = future.result()
+            acct.record(batch_no, len(batch_genes), response.usage or runcore.Usage())
+            responses.append(response)
+            if response.sample_set is not None:
+                assert tracker is not None
+                tracker.add(response.sample_set)
+                texts = response.texts
+                raw_batches.append({"batch": batch_no, "genes": batch_genes, "response": texts[0], "samples": texts})
+                runcore.write_text(model_dir / f"raw_batch_{batch_no:02d}.txt", task3.format_samples(texts))
+                voted, sample_payloads = task3.vote_batch(texts, batch_genes, answered_results)
+                payloads.append({"batch": batch_no, "samples": sample_payloads})
+                # Genes no sample answered get the usual placeholder.
+                voted_genes = {r.gene for r in voted}
+                batch_results = voted + coerce_results({"genes": []}, [g for g in batch_genes if g not in voted_genes])
+            else:
+                raw_text = response.texts[0]
+                raw_batches.append({"batch": batch_no, "genes": batch_genes, "response": raw_text})
+                runcore.write_text(model_dir / f"raw_batch_{batch_no:02d}.txt", raw_text)
+                payload = task3.extract_json(raw_text)
+                payloads.append(payload)
+                batch_results = coerce_results(payload, batch_genes)
+            aggregated_results.extend(batch_results)
+            if store is not None:
+                # Omitted genes are placeholders, not answers; leave them to be asked again.
+                store.put_many(
+                    args.model, "ollama", (r for r in batch_results if r.explanation != OMITTED_EXPLANATION)
+                )
+    runtime_total = time.perf_counter() - start
+    acct.finish()
+    if store is not None:
+        store.close()
 
     results_by_gene = {result.gene: result for result in aggregated_results}
-    ordered_results = [results_by_gene[g] for g in genes]
+    ordered_results = [results_by_gene[g] for g in genes if g in results_by_gene]
 
     summary = task3.summarize(ordered_results)
     task3.save_outputs(
@@ -150,7 +281,13 @@ def main() -> None:
         runtime_total,
         args.model,
         model_dir,
+        reused_genes=len(known),
+        self_consistency=tracker.report(ordered_results) if tracker is not None else None,
+        backend_stats=backend_report(args, preload, responses),
+        budget_stats=budget.report() if budget is not None else None,
+        accounting_stats=acct.report(),
     )
+    runcore.flush_outputs()
 
     print(f">> Local analysis with {args.model} complete in {runtime_total:.2f} seconds.")
     print(f">> Outputs written to {model_dir}")
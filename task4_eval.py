@@ -7,9 +7,14 @@ for each local model directory under outputs/gene_analysis_local/.
 """
 from __future__ import annotations
 
+import argparse
 import json
 from pathlib import Path
-from typing import Dict, List, Tuple
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import disease_panel
+import runcore
 
 PROJECT_ROOT = Path(__file__).resolve().parent
 BASELINE_DIR = PROJECT_ROOT / "outputs" / "gene_analysis"
@@ -17,17 +22,11 @@ LOCAL_DIR = PROJECT_ROOT / "outputs" / "gene_analysis_local"
 REPORT = LOCAL_DIR / "comparison.md"
 
 
-def load_results(path: Path) -> Dict[str, Dict[str, bool]]:
+def load_results(path: Path) -> Dict[str, int]:
+    """Disease-panel mask per gene."""
     data = json.loads((path / "results.json").read_text())
-    out: Dict[str, Dict[str, bool]] = {}
-    for r in data:
-        out[r["gene"]] = {
-            "cancer": bool(r["has_cancer_link"]),
-            "heart_disease": bool(r["has_heart_disease_link"]),
-            "diabetes": bool(r["has_diabetes_link"]),
-            "dementia": bool(r["has_dementia_link"]),
-        }
-    return out
+    panel = disease_panel.current()
+    return {r["gene"]: panel.mask_from_record(r) for r in data}
 
 
 def load_explanations(path: Path) -> Dict[str, str]:
@@ -36,30 +35,35 @@ def load_explanations(path: Path) -> Dict[str, str]:
 
 
 def compare_models(
-    baseline: Dict[str, Dict[str, bool]],
-    local: Dict[str, Dict[str, bool]],
+    baseline: Dict[str, int],
+    local: Dict[str, int],
     local_expl: Dict[str, str],
 ) -> Dict[str, Tuple[int, int, int]]:
     # returns per disease: (agree, disagree, unsure)
-    diseases = ["cancer", "heart_disease", "diabetes", "dementia"]
-    counts = {d: [0, 0, 0] for d in diseases}
-    for gene, bvals in baseline.items():
+    panel = disease_panel.current()
+    shared = 0
+    disagree: Counter = Counter()
+    unsure: Counter = Counter()
+    for gene, bmask in baseline.items():
         if gene not in local:
             continue
-        lvals = local[gene]
-        for d in diseases:
-            if lvals[d] == bvals[d]:
-                counts[d][0] += 1
-            else:
-                # mark unsure if local says False and uses cautious language
-                if not lvals[d] and "no known association" in local_expl.get(gene, "").lower():
-                    counts[d][2] += 1
-                else:
-                    counts[d][1] += 1
-    return {k: tuple(v) for k, v in counts.items()}
+        shared += 1
+        lmask = local[gene]
+        diff = bmask ^ lmask
+        if diff and "no known association" in local_expl.get(gene, "").lower():
+            # mark unsure where local says False and uses cautious language
+            unsure[diff & ~lmask] += 1
+            disagree[diff & lmask] += 1
+        else:
+            disagree[diff] += 1
+    dis, uns = panel.tally(disagree), panel.tally(unsure)
+    return {d: (shared - dis[d] - uns[d], dis[d], uns[d]) for d in panel.keys}
 
 
-def main() -> None:
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Compare local Ollama gene analyses with the Sophia baseline.")
+    disease_panel.add_panel_arguments(parser)
+    disease_panel.from_args(parser.parse_args(argv))
     baseline = load_results(BASELINE_DIR)
     lines: List[str] = ["# Local vs Sophia Comparison", ""]
     for model_dir in sorted(p for p in LOCAL_DIR.iterdir() if p.is_dir()):
@@ -72,8 +76,7 @@ def main() -> None:
         for d, (ag, di, un) in stats.items():
             lines.append(f"| {d.replace('_',' ')} | {ag} | {di} | {un} |")
         lines.append("")
-    REPORT.parent.mkdir(parents=True, exist_ok=True)
-    REPORT.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    runcore.write_text(REPORT, "\n".join(lines) + "\n")
     print(f"Wrote comparison report to {REPORT}")
 
 
@@ -9,31 +9,50 @@ log to produce a plot of loss vs. tokens seen.
 from __future__ import annotations
 
 import argparse
+import csv
+import json
+import math
+import os
 import re
+import shutil
+import statistics
 import subprocess
+import sys
+import time
+from array import array
 from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Tuple
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple, Union
 
-import matplotlib.pyplot as plt
-import pandas as pd
+import profiling
 
 PROJECT_ROOT = Path(__file__).resolve().parent
 NANOGPT_DIR = PROJECT_ROOT / "nanoGPT"
 LOG_PATH = NANOGPT_DIR / "out" / "training_log.txt"
 PLOT_PATH = PROJECT_ROOT / "outputs" / "nanogpt_learning_curve.png"
 SAMPLE_PATH = PROJECT_ROOT / "outputs" / "nanogpt_sample.txt"
+METRICS_CSV = NANOGPT_DIR / "out" / "metrics.csv"
+METRICS_NPZ = NANOGPT_DIR / "out" / "metrics.npz"
+PLOT_MAX_POINTS = 5000  # Train-loss curve is strided down to this many points before plotting
+BENCHMARK_PATH = PROJECT_ROOT / "outputs" / "nanogpt_benchmark.json"
+BENCHMARK_DIR = NANOGPT_DIR / "out-bench"
 
+TOKENS_RE = re.compile(r"tokens per iteration will be: ([\d,]+)")
+LOSS = r"([\d.]+|nan|inf)"  # a diverged run prints `nan` / `inf`, which float() accepts
+ITER_RE = re.compile(rf"iter (\d+): loss {LOSS}(?:, time ([\d.]+)ms)?")
+EVAL_RE = re.compile(rf"step (\d+): train loss {LOSS}, val loss {LOSS}")
 
-TRAIN_CMD = [
-    "python3",
-    "train.py",
-    "--device",
-    "mps",
-    "--dtype",
-    "float32",
-    "--compile",
-    "False",
+# Device/runtime settings per host type. `threads` is exported as OMP/MKL thread count
+# for the training subprocess; None leaves the library default.
+DEVICE_PROFILES: Dict[str, Dict[str, object]] = {
+    "mps": {"device": "mps", "dtype": "float32", "compile": False, "threads": None},
+    "cuda": {"device": "cuda", "dtype": "bfloat16", "compile": True, "threads": None},
+    "cpu": {"device": "cpu", "dtype": "auto", "compile": False, "threads": os.cpu_count()},
+    "cpu-compile": {"device": "cpu", "dtype": "auto", "compile": True, "threads": os.cpu_count()},
+}
+DEFAULT_PROFILE = "mps"
+
+TRAIN_ARGS = [
     "--dataset",
     "shakespeare",
     "--n_layer",
@@ -59,11 +78,69 @@ TRAIN_CMD = [
 ]
 
 
+def cpu_supports_bf16() -> bool:
+    """True when the host CPU advertises native bf16 (AVX512-BF16 or AMX) instructions."""
+    try:
+        flags = Path("/proc/cpuinfo").read_text(encoding="utf-8")
+    except OSError:
+        return False
+    return "avx512_bf16" in flags or "amx_bf16" in flags
+
+
+def resolve_profile(
+    name: str, threads: Optional[int] = None, compile_model: Optional[bool] = None
+) -> Dict[str, object]:
+    if name not in DEVICE_PROFILES:
+        raise ValueError(f"Unknown device profile {name!r}; choose from {sorted(DEVICE_PROFILES)}")
+    profile = dict(DEVICE_PROFILES[name])
+    if profile["dtype"] == "auto":
+        profile["dtype"] = "bfloat16" if cpu_supports_bf16() else "float32"
+    if threads is not None:
+        profile["threads"] = threads
+    if compile_model is not None:
+        profile["compile"] = compile_model
+    return profile
+
+
+def build_train_cmd(profile: Dict[str, object], overrides: Optional[Dict[str, object]] = None) -> List[str]:
+    """nanoGPT train.py command for a resolved profile; overrides replace TRAIN_ARGS values."""
+    args = list(TRAIN_ARGS)
+    for key, value in (overrides or {}).items():
+        flag = f"--{key}"
+        if flag in args:
+            args[args.index(flag) + 1] = str(value)
+        else:
+            args += [flag, str(value)]
+    return [
+        "python3",
+        "train.py",
+        "--device",
+        str(profile["device"]),
+        "--dtype",
+        str(profile["dtype"]),
+        "--compile",
+        str(bool(profile["compile"])),
+        *args,
+    ]
+
+
+def profile_env(profile: Dict[str, object]) -> Dict[str, str]:
+    env = os.environ.copy()
+    if profile.get("threads"):
+        for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+            env[var] = str(profile["threads"])
+    return env
+
+
+TRAIN_CMD = build_train_cmd(DEVICE_PROFILES[DEFAULT_PROFILE])
+
+
 @dataclass
 class IterRecord:
     iteration: int
     tokens_seen: int
     train_loss: float
+    iter_time_ms: Optional[float] = None
 
 
 @dataclass
@@ -74,11 +151,233 @@ class EvalRecord:
     val_loss: float
 
 
-def run_training(log_path: Path) -> None:
+class LogParser:
+    """Incremental parser turning nanoGPT stdout lines into records as they arrive."""
+
+    def __init__(self) -> None:
+        self.tokens_per_iter: Optional[int] = None
+
+    def feed(self, line: str) -> Optional[Union[IterRecord, EvalRecord]]:
+        if "loss" not in line:
+            if self.tokens_per_iter is None:
+                match = TOKENS_RE.search(line)
+                if match:
+                    self.tokens_per_iter = int(match.group(1).replace(",", ""))
+            return None
+        match = ITER_RE.search(line)
+        if match:
+            iteration = int(match.group(1))
+            iter_time = float(match.group(3)) if match.group(3) else None
+            return IterRecord(iteration, (iteration + 1) * self._tokens(), float(match.group(2)), iter_time)
+        match = EVAL_RE.search(line)
+        if match:
+            step = int(match.group(1))
+            return EvalRecord(step, (step + 1) * self._tokens(), float(match.group(2)), float(match.group(3)))
+        return None
+
+    def _tokens(self) -> int:
+        if self.tokens_per_iter is None:
+            raise ValueError("Could not find tokens-per-iteration line in log.")
+        return self.tokens_per_iter
+
+
+class MetricsSink:
+    """Columnar (array-backed) store of parsed records with an append-only CSV sidecar."""
+
+    def __init__(self, csv_path: Optional[Path] = None) -> None:
+        self.iter_tokens = array("q")
+        self.iter_loss = array("d")
+        self.eval_steps = array("q")
+        self.eval_tokens = array("q")
+        self.eval_train_loss = array("d")
+        self.eval_val_loss = array("d")
+        self._csv_fh = None
+        self._writer = None
+        if csv_path is not None:
+            csv_path.parent.mkdir(parents=True, exist_ok=True)
+            self._csv_fh = csv_path.open("w", encoding="utf-8", newline="")
+            self._writer = csv.writer(self._csv_fh)
+            self._writer.writerow(["kind", "step", "tokens_seen", "train_loss", "val_loss"])
+
+    def add(self, record: Union[IterRecord, EvalRecord]) -> None:
+        if isinstance(record, IterRecord):
+            self.iter_tokens.append(record.tokens_seen)
+            self.iter_loss.append(record.train_loss)
+            row = ["iter", record.iteration, record.tokens_seen, record.train_loss, ""]
+        else:
+            self.eval_steps.append(record.step)
+            self.eval_tokens.append(record.tokens_seen)
+            self.eval_train_loss.append(record.train_loss)
+            self.eval_val_loss.append(record.val_loss)
+            row = ["eval", record.step, record.tokens_seen, record.train_loss, record.val_loss]
+        if self._writer is not None:
+            self._writer.writerow(row)
+
+    def close(self, npz_path: Optional[Path] = None) -> None:
+        if self._csv_fh is not None:
+            self._csv_fh.close()
+            self._csv_fh = None
+        if npz_path is not None:
+            import numpy as np
+
+            npz_path.parent.mkdir(parents=True, exist_ok=True)
+            np.savez_compressed(
+                npz_path,
+                iter_tokens=np.frombuffer(self.iter_tokens, dtype=np.int64),
+                iter_loss=np.frombuffer(self.iter_loss, dtype=np.float64),
+                eval_steps=np.frombuffer(self.eval_steps, dtype=np.int64),
+                eval_tokens=np.frombuffer(self.eval_tokens, dtype=np.int64),
+                eval_train_loss=np.frombuffer(self.eval_train_loss, dtype=np.float64),
+                eval_val_loss=np.frombuffer(self.eval_val_loss, dtype=np.float64),
+            )
+
+
+class TrainingController:
+    """Watches eval records live: stops on val-loss plateau or divergence and keeps the best-k checkpoints.
+
+    nanoGPT overwrites ``ckpt.pt`` after an eval; once the following line arrives the save
+    is complete, so the file is copied to ``ckpt_stepNNNNNN.pt`` and only the ``keep_best``
+    lowest-val-loss copies are retained. On finish the best one is restored as ``ckpt.pt``.
+    """
+
+    def __init__(
+        self,
+        out_dir: Path,
+        max_iters: int,
+        patience: int = 3,
+        min_delta: float = 0.0,
+        divergence_factor: float = 1.5,
+        keep_best: int = 2,
+    ) -> None:
+        self.out_dir = out_dir
+        self.max_iters = max_iters
+        self.patience = patience
+        self.min_delta = min_delta
+        self.divergence_factor = divergence_factor
+        self.keep_best = keep_best
+        self.best_val = math.inf
+        self.evals_since_best = 0
+        self.stop_reason: Optional[str] = None
+        self.stopped_at: Optional[int] = None
+        self.last_iter = -1
+        self.iter_times: List[float] = []
+        self.kept: List[Tuple[float, int, Path]] = []
+        self._last_eval: Optional[EvalRecord] = None
+        self._pending_save: Optional[EvalRecord] = None
+
+    def update(self, line: str, record: Optional[Union[IterRecord, EvalRecord]]) -> bool:
+        """Consume one log line (and its parsed record); return True to stop training."""
+        if self._pending_save is not None:
+            self._snapshot(self._pending_save)
+            self._pending_save = None
+        # After a stop request the child may be killed mid-save, so later checkpoints are ignored.
+        if line.startswith("saving checkpoint") and self._last_eval is not None and self.stop_reason is None:
+            self._pending_save = self._last_eval
+        if isinstance(record, IterRecord):
+            self.last_iter = record.iteration
+            if record.iter_time_ms is not None:
+                self.iter_times.append(record.iter_time_ms)
+        elif isinstance(record, EvalRecord):
+            self._last_eval = record
+            self._observe_eval(record)
+        return self.stop_reason is not None
+
+    def _observe_eval(self, record: EvalRecord) -> None:
+        val = record.val_loss
+        if not math.isfinite(val) or (math.isfinite(self.best_val) and val > self.best_val * self.divergence_factor):
+            self.stop_reason = f"divergence (val loss {val:.4f} vs best {self.best_val:.4f})"
+        elif val < self.best_val - self.min_delta:
+            self.best_val = val
+            self.evals_since_best = 0
+        else:
+            self.evals_since_best += 1
+            if self.evals_since_best >= self.patience:
+                self.stop_reason = f"plateau ({self.patience} evals without improvement)"
+        if self.stop_reason:
+            self.stopped_at = record.step
+            print(f">> Early stop at step {record.step}: {self.stop_reason}", flush=True)
+
+    def _snapshot(self, record: EvalRecord) -> None:
+        src = self.out_dir / "ckpt.pt"
+        if not src.exists():
+            return
+        dst = self.out_dir / f"ckpt_step{record.step:06d}.pt"
+        shutil.copy2(src, dst)
+        self.kept.append((record.val_loss, record.step, dst))
+        self.kept.sort(key=lambda item: item[0])
+        for _, _, stale in self.kept[self.keep_best :]:
+            stale.unlink(missing_ok=True)
+        del self.kept[self.keep_best :]
+
+    def finish(self, tokens_per_iter: Optional[int]) -> Dict[str, object]:
+        if self._pending_save is not None and self.stop_reason is None:
+            self._snapshot(self._pending_save)
+            self._pending_save = None
+        if self.kept:
+            shutil.copy2(self.kept[0][2], self.out_dir / "ckpt.pt")
+        iters_run = self.last_iter + 1
+        iters_saved = max(0, self.max_iters - iters_run)
+        mean_iter_ms = statistics.fmean(self.iter_times) if self.iter_times else None
+        report: Dict[str, object] = {
+            "stop_reason": self.stop_reason or "completed max_iters",
+            "stopped_at_step": self.stopped_at,
+            "max_iters": self.max_iters,
+            "iters_run": iters_run,
+            "iters_saved": iters_saved,
+            "tokens_saved": iters_saved * tokens_per_iter if tokens_per_iter else None,
+            "train_seconds_saved_est": round(iters_saved * mean_iter_ms / 1000, 1) if mean_iter_ms else None,
+            "best_val_loss": None if math.isinf(self.best_val) else self.best_val,
+            "kept_checkpoints": [{"step": step, "val_loss": val, "path": str(path)} for val, step, path in self.kept],
+        }
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        (self.out_dir / "early_stopping.json").write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(
+            f">> Training controller: {report['stop_reason']}; saved {iters_saved} iters "
+            f"({report['tokens_saved']} tokens, ~{report['train_seconds_saved_est']}s)",
+            flush=True,
+        )
+        return report
+
+
+class LivePlotter:
+    """Re-renders the learning curve from a MetricsSink at most once per interval."""
+
+    def __init__(self, output: Path, interval_sec: float = 30.0) -> None:
+        self.output = output
+        self.interval_sec = interval_sec
+        self._last = 0.0
+
+    def maybe_update(self, sink: MetricsSink, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._last < self.interval_sec:
+            return
+        self._last = now
+        render_plot(sink.iter_tokens, sink.iter_loss, sink.eval_tokens, sink.eval_val_loss, self.output)
+
+
+def stream_process(
+    cmd: List[str],
+    log_path: Path,
+    on_line: Callable[[str], Optional[bool]],
+    env: Optional[Dict[str, str]] = None,
+    echo: bool = True,
+    cpus: Optional[Set[int]] = None,
+) -> Tuple[int, int]:
+    """Run ``cmd`` in the nanoGPT dir, tee stdout to ``log_path`` and hand each line to ``on_line``.
+
+    If ``on_line`` returns True the child is terminated (its remaining output is still drained).
+    ``cpus`` pins the child to those cores where the platform supports affinity.
+    Returns the exit code and the child's peak RSS in bytes.
+    """
     log_path.parent.mkdir(parents=True, exist_ok=True)
+    pin = None
+    if cpus and hasattr(os, "sched_setaffinity"):
+        pin = lambda: os.sched_setaffinity(0, cpus)  # noqa: E731
     with subprocess.Popen(
-        TRAIN_CMD,
+        cmd,
         cwd=NANOGPT_DIR,
+        env=env,
+        preexec_fn=pin,
         stdout=subprocess.PIPE,
         stderr=subprocess.STDOUT,
         text=True,
@@ -86,115 +385,343 @@ def run_training(log_path: Path) -> None:
     ) as proc, log_path.open("w", encoding="utf-8") as log_file:
         assert proc.stdout is not None
         for line in proc.stdout:
-            print(line, end="")
+            if echo:
+                print(line, end="")
             log_file.write(line)
-        ret = proc.wait()
-        if ret != 0:
-            raise RuntimeError(f"Training command failed with exit code {ret}")
+            if on_line(line) and proc.poll() is None:
+                proc.terminate()
+        # wait4 reports resource usage for this child alone (RUSAGE_CHILDREN would aggregate).
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+    peak_rss = usage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    return proc.returncode, peak_rss
+
+
+def cmd_arg(cmd: List[str], flag: str, default: str) -> str:
+    return cmd[cmd.index(flag) + 1] if flag in cmd else default
+
+
+def run_training(
+    log_path: Path,
+    plot_path: Optional[Path] = None,
+    plot_interval: float = 30.0,
+    cmd: Optional[List[str]] = None,
+    env: Optional[Dict[str, str]] = None,
+    controller: Optional[TrainingController] = None,
+) -> Tuple[Optional[int], MetricsSink]:
+    """Run training, teeing stdout to the log and parsing metrics line by line.
+
+    Metrics go to the CSV sidecar as they arrive (NPZ on completion); when ``plot_path``
+    is given the learning curve is refreshed every ``plot_interval`` seconds. A
+    ``controller`` may stop the run early and curates the saved checkpoints.
+    """
+    parser = LogParser()
+    sink = MetricsSink(METRICS_CSV)
+    plotter = LivePlotter(plot_path, plot_interval) if plot_path is not None else None
+
+    def on_line(line: str) -> bool:
+        record = parser.feed(line)
+        if record is not None:
+            sink.add(record)
+            if plotter is not None:
+                plotter.maybe_update(sink)
+        return controller.update(line, record) if controller is not None else False
+
+    ret, _ = stream_process(cmd or TRAIN_CMD, log_path, on_line, env=env)
+    sink.close(METRICS_NPZ)
+    if plotter is not None:
+        plotter.maybe_update(sink, force=True)
+    if controller is not None:
+        controller.finish(parser.tokens_per_iter)
+    if ret != 0 and not (controller is not None and controller.stop_reason):
+        raise RuntimeError(f"Training command failed with exit code {ret}")
+    return parser.tokens_per_iter, sink
+
+
+def make_controller(cmd: List[str], args: argparse.Namespace) -> TrainingController:
+    return TrainingController(
+        NANOGPT_DIR / cmd_arg(cmd, "--out_dir", "out"),
+        int(cmd_arg(cmd, "--max_iters", "5000")),
+        patience=args.patience,
+        min_delta=args.min_delta,
+        divergence_factor=args.divergence_factor,
+        keep_best=args.keep_best,
+    )
+
+
+def benchmark_profile(name: str, profile: Dict[str, object], iters: int, warmup: int = 3) -> Dict[str, object]:
+    """Short training run under one profile; reports throughput, iteration time and peak RSS."""
+    out_dir = BENCHMARK_DIR / name
+    cmd = build_train_cmd(
+        profile,
+        {
+            "max_iters": iters,
+            "eval_interval": iters + 1,
+            "eval_iters": 1,
+            "log_interval": 1,
+            "out_dir": out_dir.relative_to(NANOGPT_DIR),
+        },
+    )
+    parser = LogParser()
+    times: List[float] = []
+
+    def on_line(line: str) -> None:
+        record = parser.feed(line)
+        if isinstance(record, IterRecord) and record.iter_time_ms is not None and record.iteration >= warmup:
+            times.append(record.iter_time_ms)
+
+    start = time.perf_counter()
+    ret, peak_rss = stream_process(cmd, out_dir / "benchmark_log.txt", on_line, env=profile_env(profile), echo=False)
+    wall = time.perf_counter() - start
+    result: Dict[str, object] = {"profile": name, **profile, "exit_code": ret, "wall_sec": round(wall, 2)}
+    result["peak_rss_mb"] = round(peak_rss / 2**20, 1)
+    if ret == 0 and times and parser.tokens_per_iter:
+        iter_ms = statistics.median(times)
+        result["median_iter_ms"] = round(iter_ms, 2)
+        result["tokens_per_sec"] = round(parser.tokens_per_iter / (iter_ms / 1000), 1)
+    return result
+
+
+def run_benchmark(names: List[str], iters: int, threads: Optional[int], compile_model: Optional[bool]) -> None:
+    results = []
+    for name in names:
+        profile = resolve_profile(name, threads, compile_model)
+        print(f">> Benchmarking profile {name}: {profile}", flush=True)
+        results.append(benchmark_profile(name, profile, iters))
+    BENCHMARK_PATH.parent.mkdir(parents=True, exist_ok=True)
+    BENCHMARK_PATH.write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+    print("| Profile | dtype | compile | threads | tokens/sec | iter (ms) | peak RSS (MB) |")
+    print("| --- | --- | --- | ---:| ---:| ---:| ---:|")
+    for r in results:
+        if r["exit_code"] != 0:
+            print(f"| {r['profile']} | failed (exit {r['exit_code']}) | | | | | |")
+            continue
+        print(
+            f"| {r['profile']} | {r['dtype']} | {r['compile']} | {r['threads'] or '-'} | "
+            f"{r.get('tokens_per_sec', '-')} | {r.get('median_iter_ms', '-')} | {r['peak_rss_mb']} |"
+        )
+    print(f"Saved benchmark results to {BENCHMARK_PATH}")
 
 
 def parse_log(log_path: Path) -> Tuple[int, List[IterRecord], List[EvalRecord]]:
-    text = log_path.read_text(encoding="utf-8")
-    token_match = re.search(r"tokens per iteration will be: ([\d,]+)", text)
-    if not token_match:
+    parser = LogParser()
+    iter_records: List[IterRecord] = []
+    eval_records: List[EvalRecord] = []
+    with profiling.span("parse", "task5.parse_log"), log_path.open("r", encoding="utf-8") as fh:
+        for line in fh:
+            record = parser.feed(line)
+            if isinstance(record, IterRecord):
+                iter_records.append(record)
+            elif isinstance(record, EvalRecord):
+                eval_records.append(record)
+    if parser.tokens_per_iter is None:
         raise ValueError("Could not find tokens-per-iteration line in log.")
-    tokens_per_iter = int(token_match.group(1).replace(",", ""))
+    return parser.tokens_per_iter, iter_records, eval_records
 
-    iter_records: List[IterRecord] = []
-    for match in re.finditer(r"iter (\d+): loss ([\d.]+)", text):
-        iteration = int(match.group(1))
-        loss = float(match.group(2))
-        tokens_seen = (iteration + 1) * tokens_per_iter
-        iter_records.append(IterRecord(iteration, tokens_seen, loss))
 
-    eval_records: List[EvalRecord] = []
-    for match in re.finditer(
-        r"step (\d+): train loss ([\d.]+), val loss ([\d.]+)", text
-    ):
-        step = int(match.group(1))
-        train_loss = float(match.group(2))
-        val_loss = float(match.group(3))
-        tokens_seen = (step + 1) * tokens_per_iter
-        eval_records.append(EvalRecord(step, tokens_seen, train_loss, val_loss))
+def ingest_log(log_path: Path) -> Tuple[int, MetricsSink]:
+    """Stream an existing log into a MetricsSink (and its CSV/NPZ sidecars)."""
+    parser = LogParser()
+    sink = MetricsSink(METRICS_CSV)
+    with profiling.span("parse", "task5.ingest_log"), log_path.open("r", encoding="utf-8") as fh:
+        for line in fh:
+            record = parser.feed(line)
+            if record is not None:
+                sink.add(record)
+    sink.close(METRICS_NPZ)
+    if parser.tokens_per_iter is None:
+        raise ValueError("Could not find tokens-per-iteration line in log.")
+    return parser.tokens_per_iter, sink
+
+
+def _pyplot():
+    # matplotlib costs a few hundred ms to import, so only plotting paths pay for it.
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    return plt
+
+
+def render_plot(
+    iter_tokens: Sequence[float],
+    iter_loss: Sequence[float],
+    eval_tokens: Sequence[float],
+    eval_val_loss: Sequence[float],
+    output: Path,
+) -> None:
+    with profiling.span("render", "task5.render_plot"):
+        import numpy as np
 
-    return tokens_per_iter, iter_records, eval_records
+        plt = _pyplot()
+        output.parent.mkdir(parents=True, exist_ok=True)
+        stride = max(1, len(iter_tokens) // PLOT_MAX_POINTS)
+
+        fig = plt.figure(figsize=(10, 6))
+        if len(iter_tokens):
+            plt.plot(
+                np.asarray(iter_tokens)[::stride],
+                np.asarray(iter_loss)[::stride],
+                label="Train loss (per iter)",
+                linewidth=1,
+                alpha=0.7,
+            )
+        if len(eval_tokens):
+            plt.scatter(
+                np.asarray(eval_tokens),
+                np.asarray(eval_val_loss),
+                label="Validation loss (eval checkpoints)",
+                color="orange",
+            )
+        plt.xlabel("Tokens seen")
+        plt.ylabel("Loss")
+        plt.title("nanoGPT Shakespeare Fine-tuning Learning Curve")
+        plt.legend()
+        plt.grid(True, alpha=0.3)
+        plt.tight_layout()
+        # Write then rename so anyone watching the PNG during training never sees a partial file.
+        tmp = output.with_name(f".{output.name}.tmp")
+        plt.savefig(tmp, format=output.suffix.lstrip(".") or "png")
+        plt.close(fig)
+    os.replace(tmp, output)
 
 
 def make_plot(iter_records: List[IterRecord], eval_records: List[EvalRecord], output: Path) -> None:
-    output.parent.mkdir(parents=True, exist_ok=True)
-    df_iters = pd.DataFrame([r.__dict__ for r in iter_records])
-    df_evals = pd.DataFrame([r.__dict__ for r in eval_records])
-
-    plt.figure(figsize=(10, 6))
-    if not df_iters.empty:
-        plt.plot(
-            df_iters["tokens_seen"],
-            df_iters["train_loss"],
-            label="Train loss (per iter)",
-            linewidth=1,
-            alpha=0.7,
-        )
-    if not df_evals.empty:
-        plt.scatter(
-            df_evals["tokens_seen"],
-            df_evals["val_loss"],
-            label="Validation loss (eval checkpoints)",
-            color="orange",
-        )
-    plt.xlabel("Tokens seen")
-    plt.ylabel("Loss")
-    plt.title("nanoGPT Shakespeare Fine-tuning Learning Curve")
-    plt.legend()
-    plt.grid(True, alpha=0.3)
-    plt.tight_layout()
-    plt.savefig(output)
+    render_plot(
+        [r.tokens_seen for r in iter_records],
+        [r.train_loss for r in iter_records],
+        [r.tokens_seen for r in eval_records],
+        [r.val_loss for r in eval_records],
+        output,
+    )
     print(f"Saved learning curve plot to {output}")
 
 
-def write_sample(sample_path: Path, start: str = "to be") -> None:
+def make_comparison_plot(
+    curves: Dict[str, Tuple[List[IterRecord], List[EvalRecord]]], output: Path
+) -> None:
+    """Overlay the learning curves of several runs (train faint, validation bold, one color per run)."""
+    with profiling.span("render", "task5.make_comparison_plot"):
+        plt = _pyplot()
+        output.parent.mkdir(parents=True, exist_ok=True)
+        fig = plt.figure(figsize=(11, 7))
+        for idx, (name, (iter_records, eval_records)) in enumerate(curves.items()):
+            color = f"C{idx % 10}"
+            stride = max(1, len(iter_records) // PLOT_MAX_POINTS)
+            if iter_records:
+                plt.plot(
+                    [r.tokens_seen for r in iter_records[::stride]],
+                    [r.train_loss for r in iter_records[::stride]],
+                    color=color,
+                    linewidth=0.8,
+                    alpha=0.3,
+                )
+            if eval_records:
+                plt.plot(
+                    [r.tokens_seen for r in eval_records],
+                    [r.val_loss for r in eval_records],
+                    color=color,
+                    marker="o",
+                    label=f"{name} (val)",
+                )
+        plt.xlabel("Tokens seen")
+        plt.ylabel("Loss")
+        plt.title("nanoGPT Shakespeare Sweep: Learning Curves")
+        plt.legend(fontsize="small")
+        plt.grid(True, alpha=0.3)
+        plt.tight_layout()
+        plt.savefig(output)
+        plt.close(fig)
+    print(f"Saved comparison plot to {output}")
+
+
+def write_sample(sample_path: Path, start: str = "to be", num_samples: int = 3, max_new_tokens: int = 40) -> None:
     sample_path.parent.mkdir(parents=True, exist_ok=True)
     try:
-        # Use nanoGPT's sample.py with the latest checkpoint in out/
-        out = subprocess.check_output(
-            [
-                "python3",
-                "sample.py",
-                "--dtype",
-                "float32",
-                "--num_samples",
-                "3",
-                "--max_new_tokens",
-                "40",
-                "--start",
-                start,
-            ],
-            cwd=NANOGPT_DIR,
-            text=True,
-        )
+        # In-process batched sampler: the checkpoint is loaded once and all samples share one batch.
+        from nanogpt_sampler import SAMPLE_SEPARATOR, Sampler
+
+        samples, stats = Sampler().generate([start] * num_samples, max_new_tokens=max_new_tokens)
+        out = "".join(f"{sample}\n{SAMPLE_SEPARATOR}\n" for sample in samples)
         sample_path.write_text(out, encoding="utf-8")
-        print(f"Saved text sample to {sample_path}")
+        print(f"Saved text sample to {sample_path} ({stats['tokens_per_sec']} tokens/sec)")
     except Exception as e:  # noqa: BLE001
         print(f"Sampling failed: {e}")
 
 
-def main() -> None:
+def main(argv: Optional[List[str]] = None) -> None:
     parser = argparse.ArgumentParser(description="Run nanoGPT fine-tuning and plot the learning curve.")
     parser.add_argument("--skip-train", action="store_true", help="Skip running training and just parse the existing log.")
-    args = parser.parse_args()
+    parser.add_argument(
+        "--plot-interval",
+        type=float,
+        default=30.0,
+        help="Seconds between live learning-curve refreshes while training.",
+    )
+    parser.add_argument(
+        "--device-profile",
+        choices=sorted(DEVICE_PROFILES),
+        default=DEFAULT_PROFILE,
+        help="Device/dtype/compile settings for training (cpu picks bf16 when the CPU supports it).",
+    )
+    parser.add_argument("--threads", type=int, help="Torch CPU threads (OMP/MKL) for the training process.")
+    parser.add_argument(
+        "--compile",
+        dest="compile_model",
+        choices=["True", "False"],
+        help="Override the profile's torch.compile setting.",
+    )
+    parser.add_argument(
+        "--benchmark",
+        nargs="+",
+        metavar="PROFILE",
+        help="Benchmark the given device profiles (tokens/sec, iter time, peak RSS) instead of training.",
+    )
+    parser.add_argument("--benchmark-iters", type=int, default=30, help="Training iterations per benchmark run.")
+    parser.add_argument(
+        "--early-stop",
+        action="store_true",
+        help="Stop on val-loss plateau/divergence and keep only the best checkpoints.",
+    )
+    parser.add_argument("--patience", type=int, default=3, help="Evals without improvement before stopping.")
+    parser.add_argument("--min-delta", type=float, default=0.0, help="Minimum val-loss drop counted as improvement.")
+    parser.add_argument(
+        "--divergence-factor",
+        type=float,
+        default=1.5,
+        help="Stop when val loss exceeds best * factor.",
+    )
+    parser.add_argument("--keep-best", type=int, default=2, help="Eval checkpoints retained with --early-stop.")
+    args = parser.parse_args(argv)
 
     if not NANOGPT_DIR.exists():
         raise FileNotFoundError(f"nanoGPT directory not found at {NANOGPT_DIR}")
 
+    compile_model = None if args.compile_model is None else args.compile_model == "True"
+    if args.benchmark:
+        run_benchmark(args.benchmark, args.benchmark_iters, args.threads, compile_model)
+        return
+
     if not args.skip_train:
         print("Starting nanoGPT training (this may take a while)...")
-        run_training(LOG_PATH)
+        profile = resolve_profile(args.device_profile, args.threads, compile_model)
+        cmd = build_train_cmd(profile)
+        controller = make_controller(cmd, args) if args.early_stop else None
+        tokens_per_iter, sink = run_training(
+            LOG_PATH, PLOT_PATH, args.plot_interval, cmd=cmd, env=profile_env(profile), controller=controller
+        )
     elif not LOG_PATH.exists():
         raise FileNotFoundError(f"{LOG_PATH} not found. Run without --skip-train to generate it.")
+    else:
+        tokens_per_iter, sink = ingest_log(LOG_PATH)
+        render_plot(sink.iter_tokens, sink.iter_loss, sink.eval_tokens, sink.eval_val_loss, PLOT_PATH)
 
-    tokens_per_iter, iter_records, eval_records = parse_log(LOG_PATH)
-    print(f"Parsed {len(iter_records)} iteration records and {len(eval_records)} evaluation checkpoints.")
+    print(f"Parsed {len(sink.iter_loss)} iteration records and {len(sink.eval_val_loss)} evaluation checkpoints.")
     print(f"Tokens per iteration: {tokens_per_iter}")
-    make_plot(iter_records, eval_records, PLOT_PATH)
+    print(f"Saved learning curve plot to {PLOT_PATH}")
+    print(f"Saved metrics sidecars to {METRICS_CSV} and {METRICS_NPZ}")
     write_sample(SAMPLE_PATH)
 
 
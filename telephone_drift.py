@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Semantic drift metrics for telephone runs produced by task1.py.
+
+For every stage of every run we measure how far the text has moved away from the
+original prompt and from the previous stage, using two signals:
+  • lexical overlap: Jaccard similarity of word n-gram sets (hashed, vectorized);
+  • embedding cosine: sentence embeddings from a small CPU model, cached per unique text.
+
+Runs are processed in fixed-size chunks so thousands of runs stay cheap, and the
+result is a drift table aggregated per chain position.
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import re
+import zlib
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+import artifact_writer
+
+PROJECT_ROOT = Path(__file__).resolve().parent
+TELEPHONE_DIR = PROJECT_ROOT / "outputs" / "telephone"
+DEFAULT_EMBED_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+HASH_DIM = 1 << 12
+TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+
+def iter_runs(path: Path) -> Iterator[Dict[str, Any]]:
+    """Yield run dicts from either the JSON array or the JSONL layout written by task1."""
+    if path.suffix == ".jsonl":
+        yield from artifact_writer.iter_jsonl(path)
+        return
+    yield from json.loads(path.read_text(encoding="utf-8"))
+
+
+def chunked(runs: Iterable[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    chunk: List[Dict[str, Any]] = []
+    for run in runs:
+        chunk.append(run)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def ngram_hashes(text: str, n: int) -> np.ndarray:
+    tokens = TOKEN_RE.findall(text.lower())
+    if len(tokens) < n:
+        grams = [" ".join(tokens)] if tokens else []
+    else:
+        grams = [" ".join(tokens[i : i + n]) for i in range(len(tokens) - n + 1)]
+    return np.fromiter((zlib.crc32(g.encode("utf-8")) % HASH_DIM for g in grams), dtype=np.int64)
+
+
+def ngram_matrix(texts: List[str], n: int) -> np.ndarray:
+    """Binary (len(texts), HASH_DIM) matrix of hashed n-gram presence."""
+    matrix = np.zeros((len(texts), HASH_DIM), dtype=np.float32)
+    for row, text in enumerate(texts):
+        matrix[row, ngram_hashes(text, n)] = 1.0
+    return matrix
+
+
+def paired_jaccard(matrix: np.ndarray, left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    a = matrix[left]
+    b = matrix[right]
+    inter = np.einsum("ij,ij->i", a, b)
+    union = a.sum(axis=1) + b.sum(axis=1) - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+class EmbeddingCache:
+    """Sentence embeddings keyed by text hash; each unique text is encoded once."""
+
+    def __init__(self, model_name: str, cache_path: Optional[Path] = None) -> None:
+        self.model_name = model_name
+        self.cache_path = cache_path
+        self._model = None
+        self._vectors: Dict[str, np.ndarray] = {}
+        if cache_path and cache_path.exists():
+            with np.load(cache_path) as data:
+                if str(data["model"]) == model_name:
+                    self._vectors = dict(zip(data["keys"].tolist(), data["vectors"]))
+
+    @staticmethod
+    def key(text: str) -> str:
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def _load_model(self):
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+
+            self._model = SentenceTransformer(self.model_name, device="cpu")
+        return self._model
+
+    def encode(self, texts: List[str], batch_size: int = 64) -> np.ndarray:
+        keys = [self.key(t) for t in texts]
+        missing = {k: t for k, t in zip(keys, texts) if k not in self._vectors}
+        if missing:
+            vectors = self._load_model().encode(
+                list(missing.values()),
+                batch_size=batch_size,
+                normalize_embeddings=True,
+                convert_to_numpy=True,
+            )
+            self._vectors.update(zip(missing.keys(), vectors.astype(np.float32)))
+        return np.stack([self._vectors[k] for k in keys])
+
+    def save(self) -> None:
+        if not self.cache_path or not self._vectors:
+            return
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        keys = list(self._vectors)
+        np.savez(
+            self.cache_path,
+            model=np.array(self.model_name),
+            keys=np.array(keys),
+            vectors=np.stack([self._vectors[k] for k in keys]),
+        )
+
+
+def compute_drift(
+    runs: Iterable[Dict[str, Any]],
+    ngram: int = 2,
+    embeddings: Optional[EmbeddingCache] = None,
+    chunk_size: int = 512,
+) -> Dict[str, Any]:
+    """Return per-position drift statistics over all runs.
+
+    Position 0 is the original prompt; position k is the output of the k-th model.
+    """
+    metric_names = ["lexical_to_original", "lexical_to_previous"]
+    if embeddings is not None:
+        metric_names += ["embedding_to_original", "embedding_to_previous"]
+    columns: Dict[str, List[np.ndarray]] = {name: [] for name in metric_names}
+    models_by_position: Dict[int, Counter] = {}
+    max_stages = 0
+    total_runs = 0
+
+    for chunk in chunked(runs, chunk_size):
+        texts: List[str] = []
+        index: Dict[str, int] = {}
+        positions: List[List[int]] = []
+        for run in chunk:
+            row: List[int] = []
+            for text in [run["input_prompt"], *[s["output_text"] for s in run["stages"]]]:
+                if text not in index:
+                    index[text] = len(texts)
+                    texts.append(text)
+                row.append(index[text])
+            positions.append(row)
+            for pos, stage in enumerate(run["stages"], start=1):
+                models_by_position.setdefault(pos, Counter())[stage["model"]] += 1
+            max_stages = max(max_stages, len(run["stages"]))
+        total_runs += len(chunk)
+
+        # (run, stage) -> text index of the stage output, its previous text and the original.
+        width = max(len(row) for row in positions) - 1
+        cur = np.full((len(chunk), width), -1, dtype=np.int64)
+        for r, row in enumerate(positions):
+            cur[r, : len(row) - 1] = row[1:]
+        valid = cur >= 0
+        orig = np.repeat(np.array([row[0] for row in positions])[:, None], width, axis=1)
+        prev = np.concatenate([orig[:, :1], np.where(valid[:, :-1], cur[:, :-1], -1)], axis=1)
+
+        features = ngram_matrix(texts, ngram)
+        vecs = embeddings.encode(texts) if embeddings is not None else None
+        for name in metric_names:
+            other = orig if name.endswith("original") else prev
+            out = np.full(cur.shape, np.nan, dtype=np.float32)
+            if name.startswith("lexical"):
+                out[valid] = paired_jaccard(features, cur[valid], other[valid])
+            else:
+                out[valid] = np.einsum("ij,ij->i", vecs[cur[valid]], vecs[other[valid]])
+            columns[name].append(out)
+
+    table: List[Dict[str, Any]] = []
+    if total_runs:
+        stacked = {
+            name: np.concatenate(
+                [np.pad(c, ((0, 0), (0, max_stages - c.shape[1])), constant_values=np.nan) for c in chunks]
+            )
+            for name, chunks in columns.items()
+        }
+        for pos in range(1, max_stages + 1):
+            counter = models_by_position.get(pos, Counter())
+            model, _ = counter.most_common(1)[0] if counter else ("", 0)
+            entry: Dict[str, Any] = {
+                "position": pos,
+                "model": model if len(counter) == 1 else f"{model} (+{len(counter) - 1} others)",
+                "runs": int(sum(counter.values())),
+            }
+            for name, values in stacked.items():
+                col = values[:, pos - 1]
+                entry[f"{name}_mean"] = float(np.nanmean(col))
+                entry[f"{name}_median"] = float(np.nanmedian(col))
+            table.append(entry)
+
+    return {
+        "runs": total_runs,
+        "ngram": ngram,
+        "embedding_model": embeddings.model_name if embeddings is not None else None,
+        "positions": table,
+    }
+
+
+def write_drift_report(report: Dict[str, Any], output_dir: Path) -> None:
+    output_dir.mkdir(parents=True, exist_ok=True)
+    json_path = output_dir / "telephone_drift.json"
+    json_path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+    has_embed = report["embedding_model"] is not None
+    header = "| Stage | Model | Runs | Lexical vs orig | Lexical vs prev |"
+    divider = "| --- | --- | ---:| ---:| ---:|"
+    if has_embed:
+        header += " Embed vs orig | Embed vs prev |"
+        divider += " ---:| ---:|"
+    lines = [
+        "# Telephone Drift",
+        "",
+        f"- Runs: {report['runs']}",
+        f"- Lexical metric: Jaccard over word {report['ngram']}-grams (mean)",
+        f"- Embedding model: `{report['embedding_model']}` (mean cosine)" if has_embed else "- Embeddings: disabled",
+        "",
+        header,
+        divider,
+    ]
+    for row in report["positions"]:
+        line = (
+            f"| {row['position']} | {row['model']} | {row['runs']} | "
+            f"{row['lexical_to_original_mean']:.3f} | {row['lexical_to_previous_mean']:.3f} |"
+        )
+        if has_embed:
+            line += f" {row['embedding_to_original_mean']:.3f} | {row['embedding_to_previous_mean']:.3f} |"
+        lines.append(line)
+    md_path = output_dir / "telephone_drift.md"
+    md_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+    print(f"Saved drift metrics to {json_path}")
+    print(f"Saved drift table to {md_path}")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Compute semantic drift metrics for telephone runs.")
+    parser.add_argument(
+        "--input",
+        type=Path,
+        default=TELEPHONE_DIR / "telephone_runs.json",
+        help="telephone_runs.json or telephone_runs.jsonl produced by task1.py.",
+    )
+    parser.add_argument(
+        "--output-dir",
+        type=Path,
+        default=TELEPHONE_DIR,
+        help="Directory where the drift table will be written.",
+    )
+    parser.add_argument("--ngram", type=int, default=2, help="Word n-gram size for lexical overlap.")
+    parser.add_argument("--chunk-size", type=int, default=512, help="Runs processed per vectorized batch.")
+    parser.add_argument("--embed-model", default=DEFAULT_EMBED_MODEL, help="sentence-transformers model name.")
+    parser.add_argument(
+        "--no-embeddings",
+        action="store_true",
+        help="Skip embedding cosine and report lexical overlap only.",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    embeddings: Optional[EmbeddingCache] = None
+    if not args.no_embeddings:
+        try:
+            import sentence_transformers  # noqa: F401  # pylint: disable=unused-import
+        except ImportError:
+            print("sentence-transformers not installed; reporting lexical overlap only.")
+        else:
+            embeddings = EmbeddingCache(args.embed_model, args.output_dir / "embedding_cache.npz")
+
+    report = compute_drift(iter_runs(args.input), ngram=args.ngram, embeddings=embeddings, chunk_size=args.chunk_size)
+    if embeddings is not None:
+        embeddings.save()
+    write_drift_report(report, args.output_dir)
+
+
+if __name__ == "__main__":
+    main()
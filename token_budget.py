@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Per-batch output-token budget for the gene-analysis runs (task3 and task4).
+
+A fixed `max_tokens=4000` reserves the same KV cache for a 2-gene batch as for a
+10-gene one and still truncates when a batch runs long. `TokenBudget` predicts the
+completion tokens a batch needs from the tokens per gene observed so far in the run
+(a high quantile, plus a safety margin) and sizes `max_tokens` from that; Ollama
+receives it as `num_predict`. A response cut off at the limit (`finish_reason` /
+`done_reason == "length"`) raises the estimate and the batch is retried with the
+larger budget, up to the ceiling.
+"""
+from __future__ import annotations
+
+import argparse
+import math
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import runcore
+
+PRIOR_TOKENS_PER_GENE = 300.0  # recorded runs use ~200-250 (Sophia), up to ~450 (phi3)
+TRUNCATED = "length"
+
+
+@dataclass
+class TokenBudget:
+    per_gene_prior: float = PRIOR_TOKENS_PER_GENE
+    margin: float = 0.25
+    overhead: int = 64  # JSON wrapper around the per-gene entries
+    floor: int = 256
+    ceiling: int = 8192
+    quantile: float = 0.9
+    growth: float = 1.5  # how far a truncation pushes the estimate past the cut-off
+    rates: List[float] = field(default_factory=list)
+    truncation_floor: float = 0.0
+    requests: int = 0
+    truncations: int = 0
+    retries: int = 0
+    reserved_tokens: int = 0
+    used_tokens: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def per_gene(self) -> float:
+        """Tokens per gene to plan for: a high quantile of the observed rates, else the prior."""
+        with self._lock:
+            if self.rates:
+                ordered = sorted(self.rates)
+                estimate = ordered[min(len(ordered) - 1, int(self.quantile * len(ordered)))]
+            else:
+                estimate = self.per_gene_prior
+            return max(estimate, self.truncation_floor)
+
+    def max_tokens(self, genes: int) -> int:
+        needed = math.ceil(genes * self.per_gene() * (1 + self.margin)) + self.overhead
+        return max(self.floor, min(self.ceiling, needed))
+
+    def observe(self, genes: int, limit: int, completion_tokens: Optional[int], truncated: bool) -> None:
+        with self._lock:
+            self.requests += 1
+            self.reserved_tokens += limit
+            self.used_tokens += completion_tokens or 0
+            if truncated:
+                self.truncations += 1
+                # The true rate is at least limit / genes; plan past it from now on.
+                self.truncation_floor = max(self.truncation_floor, self.growth * limit / max(1, genes))
+            elif completion_tokens:
+                self.rates.append(completion_tokens / max(1, genes))
+
+    def record_retry(self) -> None:
+        with self._lock:
+            self.retries += 1
+
+    def report(self) -> Dict[str, Any]:
+        per_gene = self.per_gene()
+        return {
+            "tokens_per_gene_estimate": round(per_gene, 1),
+            "margin": self.margin,
+            "ceiling": self.ceiling,
+            "requests": self.requests,
+            "truncations": self.truncations,
+            "retries": self.retries,
+            "reserved_tokens": self.reserved_tokens,
+            "completion_tokens": self.used_tokens,
+            "reserved_utilization": round(self.used_tokens / self.reserved_tokens, 3) if self.reserved_tokens else None,
+        }
+
+
+def chat(
+    budget: Optional[TokenBudget],
+    backend: str,
+    model: str,
+    messages: List[Dict[str, str]],
+    genes: int,
+    timeout: float = 180,
+    fixed_max_tokens: Optional[int] = None,
+    **options: Any,
+) -> runcore.ChatResult:
+    """`runcore.chat` with ``max_tokens`` sized by ``budget``; truncated responses are retried larger.
+
+    Without a budget the call uses ``fixed_max_tokens`` (None: the backend's own default).
+    """
+    if budget is None:
+        if fixed_max_tokens is not None:
+            options["max_tokens"] = fixed_max_tokens
+        return runcore.chat(backend, model, messages, timeout, **options)
+    while True:
+        limit = budget.max_tokens(genes)
+        result = runcore.chat(backend, model, messages, timeout, max_tokens=limit, **options)
+        truncated = result.finish_reason == TRUNCATED
+        budget.observe(genes, limit, result.completion_tokens, truncated)
+        if not truncated or limit >= budget.ceiling:
+            if truncated:
+                print(f"   ! Response truncated at the {limit}-token ceiling for {genes} genes; keeping it")
+            return result
+        budget.record_retry()
+        print(f"   ! Response truncated at {limit} tokens for {genes} genes; retrying with {budget.max_tokens(genes)}")
+
+
+def sample(
+    budget: Optional[TokenBudget],
+    backend: str,
+    model: str,
+    messages: List[Dict[str, str]],
+    genes: int,
+    k: int,
+    timeout: float = 180,
+    fixed_max_tokens: Optional[int] = None,
+    **options: Any,
+) -> runcore.SampleSet:
+    """`runcore.sample` under ``budget``; retried only when every sample was truncated.
+
+    Partially truncated sets are kept: the cut-off samples fail to parse and drop out of
+    the vote, and the truncations still raise the estimate for later batches.
+    """
+    if budget is None:
+        if fixed_max_tokens is not None:
+            options["max_tokens"] = fixed_max_tokens
+        return runcore.sample(backend, model, messages, k, timeout, **options)
+    while True:
+        limit = budget.max_tokens(genes)
+        sample_set = runcore.sample(backend, model, messages, k, timeout, max_tokens=limit, **options)
+        reasons = sample_set.finish_reasons or [None] * len(sample_set.texts)
+        per_sample = (sample_set.completion_tokens or 0) / max(1, len(sample_set.texts))
+        for reason in reasons:
+            budget.observe(genes, limit, round(per_sample) or None, reason == TRUNCATED)
+        if any(reason != TRUNCATED for reason in reasons) or limit >= budget.ceiling:
+            return sample_set
+        budget.record_retry()
+        print(f"   ! All {k} samples truncated at {limit} tokens; retrying with {budget.max_tokens(genes)}")
+
+
+def add_budget_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--max-tokens-margin",
+        type=float,
+        default=0.25,
+        help="Safety margin on the predicted output tokens per batch (0.25 = 25%%).",
+    )
+    parser.add_argument(
+        "--max-tokens-ceiling", type=int, default=8192, help="Upper bound on the per-batch max_tokens."
+    )
+    parser.add_argument(
+        "--fixed-max-tokens",
+        action="store_true",
+        help="Disable adaptive sizing and use the script's fixed max_tokens.",
+    )
+
+
+def from_args(args: argparse.Namespace) -> Optional[TokenBudget]:
+    if args.fixed_max_tokens:
+        return None
+    return TokenBudget(margin=args.max_tokens_margin, ceiling=args.max_tokens_ceiling)